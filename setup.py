@@ -231,6 +231,7 @@ setup_args = {
                             'bin/radical-pilot-fetch-logfiles',
                             'bin/radical-pilot-fetch-json',
                             'bin/radical-pilot-inspect',
+                            'bin/radical-pilot-prof2bin',
                             'bin/radical-pilot-prte2prof',
                             'bin/radical-pilot-run-session',
                             'bin/radical-pilot-stats',
@@ -9,6 +9,7 @@ import copy
 import stat
 import time
 import pprint
+import threading           as mt
 import subprocess          as sp
 import multiprocessing     as mp
 
@@ -53,6 +54,8 @@ class Agent_0(rpu.Worker):
 
         self._starttime   = time.time()
         self._final_cause = None
+        self._ingest_term = mt.Event()   # stops unit ingest (`db_ingest`)
+        self._metrics_srv = None         # serves metrics (`metrics`)
 
         # this is the earliest point to sync bootstrap and agent profiles
         prof = ru.Profiler(ns='radical.pilot', name='agent.0')
@@ -201,9 +204,39 @@ class Agent_0(rpu.Worker):
         self.register_timed_cb(self._agent_command_cb,
                                timer=self._cfg['db_poll_sleeptime'])
 
-        # register idle callback to pull for units
-        self.register_timed_cb(self._check_units_cb,
-                               timer=self._cfg['db_poll_sleeptime'])
+        # pull for units, either on DB changes or in regular intervals.  Unit
+        # claims are atomic, so several ingest threads can claim concurrently,
+        # each at most `db_claim_bulk` units at a time.  The threads push the
+        # claimed units via the same output queue endpoint, which serializes
+        # sends (`ru.zmq.Putter.put()` is locked).
+        self._claim_bulk = self._cfg.get('db_claim_bulk')
+        if self._cfg.get('db_ingest', 'poll') == 'tail':
+            self._ingest = list()
+            for _ in range(self._cfg.get('db_ingest_threads', 1)):
+                thread = mt.Thread(target=self._dbs.tailed_control,
+                                   args=[None, 'agent',
+                                         {'type' : 'unit',
+                                          'pilot': self._pid},
+                                         self._ingest_units_cb],
+                                   kwargs={'timeout':
+                                               self._cfg['db_poll_sleeptime'],
+                                           'term' : self._ingest_term,
+                                           'limit': self._claim_bulk})
+                thread.daemon = True
+                thread.start()
+                self._ingest.append(thread)
+        else:
+            self.register_timed_cb(self._check_units_cb,
+                                   timer=self._cfg['db_poll_sleeptime'])
+
+        # collect the metrics published by all components, and serve them on
+        # the configured endpoint
+        endpoint = self._cfg.get('metrics', {}).get('endpoint')
+        if endpoint and self._metrics:
+            self._metrics_srv = rpu.MetricsServer(endpoint, log=self._log)
+            self._metrics_srv.start()
+            self.register_subscriber(rpc.CONTROL_PUBSUB,
+                                     self._metrics_srv.collect_cb)
 
         # sub-agents are started, components are started, bridges are up: we are
         # ready to roll!  Update pilot state.
@@ -252,9 +285,13 @@ class Agent_0(rpu.Worker):
         self.stage_output()
 
         # tear things down in reverse order
+        self._ingest_term.set()
         self._hb.stop()
         self._cmgr.close()
 
+        if self._metrics_srv:
+            self._metrics_srv.stop()
+
         if self._rm:
             self._rm.stop()
 
@@ -676,32 +713,26 @@ class Agent_0(rpu.Worker):
     def _check_units_cb(self):
 
         # Check for compute units waiting for input staging and log pull.
-        #
-        # FIXME: Unfortunately, 'find_and_modify' is not bulkable, so we have
-        #        to use 'find'.  To avoid finding the same units over and over
-        #        again, we update the 'control' field *before* running the next
-        #        find -- so we do it right here.
-        #        This also blocks us from using multiple ingest threads, or from
-        #        doing late binding by unit pull :/
-        unit_cursor = self._dbs._c.find({'type'    : 'unit',
-                                         'pilot'   : self._pid,
-                                         'control' : 'agent_pending'})
-        if not unit_cursor.count():
-            self._log.info('units pulled:    0')
-            return True
+        unit_list = self._dbs.claim_control('agent', {'type' : 'unit',
+                                                      'pilot': self._pid},
+                                            limit=self._claim_bulk)
+        return self._ingest_units_cb(unit_list)
 
-        # update the units to avoid pulling them again next time.
-        unit_list = list(unit_cursor)
-        unit_uids = [unit['uid'] for unit in unit_list]
 
-        self._dbs._c.update({'type'  : 'unit',
-                             'uid'   : {'$in'     : unit_uids}},
-                            {'$set'  : {'control' : 'agent'}},
-                            multi=True)
+    # --------------------------------------------------------------------------
+    #
+    def _ingest_units_cb(self, unit_list):
+
+        if not unit_list:
+            self._log.info('units pulled:    0')
+            return True
 
         self._log.info("units pulled: %4d", len(unit_list))
         self._prof.prof('get', msg='bulk: %d' % len(unit_list), uid=self._pid)
 
+        # measure the latency of the handover from the umgr
+        self._prof_ingest(unit_list)
+
         for unit in unit_list:
 
             # make sure the units obtain env settings (if needed)
@@ -719,8 +750,6 @@ class Agent_0(rpu.Worker):
             if unit['state'] != rps.AGENT_STAGING_INPUT_PENDING:
                 self._log.error('invalid state: %s', (pprint.pformat(unit)))
 
-            unit['control'] = 'agent'
-
         # now we really own the CUs, and can start working on them (ie. push
         # them into the pipeline).  We don't publish nor profile as advance,
         # since that happened already on the module side when the state was set.
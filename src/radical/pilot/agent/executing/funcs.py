@@ -58,8 +58,9 @@ class FUNCS(AgentExecutingComponent) :
         self._res_queue = ru.zmq.Getter('funcs_res_queue', res_cfg['get'])
 
         self._cancel_lock    = ru.RLock()
-        self._cus_to_cancel  = list()
+        self._cus_to_cancel  = set()
         self._cus_to_watch   = list()
+        self.register_cancel_set(self._cus_to_cancel, self._cancel_lock)
         self._watch_queue    = queue.Queue ()
 
         self._pid = self._cfg['pid']
@@ -118,7 +119,7 @@ class FUNCS(AgentExecutingComponent) :
 
             self._log.info("cancel_units command (%s)" % arg)
             with self._cancel_lock:
-                self._cus_to_cancel.extend(arg['uids'])
+                self._cus_to_cancel.update(ru.as_list(arg['uids']))
 
         return True
 
@@ -1,18 +1,14 @@
-# pylint: disable=subprocess-popen-preexec-fn
-# FIXME: review pylint directive - https://github.com/PyCQA/pylint/pull/2087
-#        (https://docs.python.org/3/library/subprocess.html#popen-constructor)
-
 __copyright__ = "Copyright 2013-2016, http://radical.rutgers.edu"
 __license__   = "MIT"
 
 
 import os
-import stat
 import time
 import queue
 import atexit
 import pprint
 import signal
+import selectors
 import tempfile
 import threading as mt
 import traceback
@@ -43,6 +39,131 @@ atexit.register(_kill)
 # ------------------------------------------------------------------------------
 
 
+# ------------------------------------------------------------------------------
+# shell function used by launch scripts to write profile events.  With
+# `RP_PROF_BATCH` set, events are collected in a variable and are written to
+# a file named after the unit in that directory when the script exits, and the
+# time is taken from `$EPOCHREALTIME` where the shell provides it (bash 5),
+# i.e., w/o running `$RP_GTOD`.  The file is renamed into place once complete,
+# so the executor never reads partial files.
+_PROF_FUNC = '''
+_rp_prof=''
+_rp_prof_flush(){
+    test -z "$_rp_prof" && return
+    _rp_fname="$RP_PROF_BATCH/$RP_UNIT_ID"
+    printf "%s" "$_rp_prof" > "$_rp_fname.tmp" \\
+        && mv "$_rp_fname.tmp" "$_rp_fname"
+}
+trap _rp_prof_flush EXIT
+prof(){
+    if test -n "$RP_PROF_BATCH"
+    then
+        now=${EPOCHREALTIME:-$($RP_GTOD)}
+        _rp_prof="$_rp_prof$now\t$1\t$RP_UNIT_ID\t$2
+"
+        return
+    fi
+    if test -z "$RP_PROF"
+    then
+        return
+    fi
+    event=$1
+    msg=$2
+    now=$($RP_GTOD)
+    echo "$now,$event,unit_script,MainThread,$RP_UNIT_ID,AGENT_EXECUTING,$msg" >> $RP_PROF
+}
+'''
+
+# launch script template shared by all units of an executor (`launch_template`
+# mode).  The unit specific shell code is passed in the environment, and is
+# evaluated in the same order as in the per-unit launch scripts.
+_TEMPLATE = '''#!/bin/sh
+%(prof)s
+_rp_env="$RP_UNIT_ENV"
+_rp_pre="$RP_UNIT_PRE_EXEC"
+_rp_exec="$RP_UNIT_EXEC"
+_rp_post="$RP_UNIT_POST_EXEC"
+unset RP_UNIT_ENV RP_UNIT_PRE_EXEC RP_UNIT_EXEC RP_UNIT_POST_EXEC
+
+# Environment variables
+eval "$_rp_env"
+prof cu_start
+
+%(cu_pre_exec)s
+
+if test -n "$_rp_pre"
+then
+    prof cu_pre_start
+    eval "$_rp_pre"
+    prof cu_pre_stop
+fi
+
+prof cu_exec_start
+eval "$_rp_exec"
+RETVAL=$?
+prof cu_exec_stop
+
+if test -n "$_rp_post"
+then
+    prof cu_post_start
+    eval "$_rp_post"
+    prof cu_post_stop "ret=$RETVAL"
+fi
+
+prof cu_stop
+exit $RETVAL
+'''
+
+
+# ------------------------------------------------------------------------------
+#
+def _exec_opener(path, flags):
+    # create launch scripts as executable (0o766 & ~umask, i.e., rwxr--r-- for
+    # umask 022), which saves the `stat` and `chmod` metadata operations after
+    # writing them
+    return os.open(path, flags, 0o766)
+
+
+# ------------------------------------------------------------------------------
+#
+class _WatchQueue(queue.Queue):
+    '''
+    A queue which signals new items on a pipe.  That allows the watcher thread
+    to wait for new units and for unit completion in the same `select()` call.
+    '''
+
+    def __init__(self):
+
+        queue.Queue.__init__(self)
+
+        self._r, self._w = os.pipe()
+        os.set_blocking(self._r, False)
+        os.set_blocking(self._w, False)
+
+
+    def fileno(self):
+        return self._r
+
+
+    def put(self, item, block=True, timeout=None):
+
+        queue.Queue.put(self, item, block, timeout)
+
+        try:
+            os.write(self._w, b'.')
+        except BlockingIOError:
+            pass  # pipe is full, the watcher is signalled already
+
+
+    def drain(self):
+
+        try:
+            while os.read(self._r, 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+
 # ------------------------------------------------------------------------------
 #
 class Popen(AgentExecutingComponent) :
@@ -73,12 +194,38 @@ class Popen(AgentExecutingComponent) :
         self.register_subscriber(rpc.CONTROL_PUBSUB, self.command_cb)
 
         self._cancel_lock    = ru.RLock()
-        self._cus_to_cancel  = list()
-        self._cus_to_watch   = list()
-        self._watch_queue    = queue.Queue ()
+        self._cus_to_cancel  = set()
+        self._cus_to_watch   = dict()         # uid -> running unit
+        self.register_cancel_set(self._cus_to_cancel, self._cancel_lock)
+        self._watch_queue    = _WatchQueue()
+        self._pidfds         = dict()         # uid -> pidfd of running unit
+        self._selector       = None
+
+        # we detect unit completion via pidfds (Linux 5.3+) which become
+        # readable when the process exits.  If those are not available, we
+        # fall back to polling all running units.
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._watch_queue, selectors.EVENT_READ)
+
+        except (AttributeError, OSError):
+            self._log.warn('pidfds not available, poll for unit completion')
 
         self._pid = self._cfg['pid']
 
+        # unit side profile events are written to one file per unit, which is
+        # merged into the agent profile by the output stager ('file'), or to
+        # one file per unit in a directory per executor, which the watcher
+        # merges when the unit completes ('batch'), or are not collected at all
+        # ('none')
+        self._prof_mode  = self._cfg.get('unit_prof_mode', 'file')
+        self._prof_batch = None
+
+        if self._prof.enabled and self._prof_mode == 'batch':
+            self._prof_batch = '%s/%s.uprof' % (self._pwd, self.uid)
+            rpu.rec_makedir(self._prof_batch)
+
         # run watcher thread
         self._watcher = mt.Thread(target=self._watch)
       # self._watcher.daemon = True
@@ -99,6 +246,10 @@ class Popen(AgentExecutingComponent) :
         self.gtod   = "%s/gtod" % self._pwd
         self.tmpdir = tempfile.gettempdir()
 
+        # launch script template, created on first use
+        self._template     = None
+        self._template_env = None
+
 
     # --------------------------------------------------------------------------
     #
@@ -113,7 +264,7 @@ class Popen(AgentExecutingComponent) :
 
             self._log.info("cancel_units command (%s)" % arg)
             with self._cancel_lock:
-                self._cus_to_cancel.extend(arg['uids'])
+                self._cus_to_cancel.update(ru.as_list(arg['uids']))
 
         return True
 
@@ -127,10 +278,45 @@ class Popen(AgentExecutingComponent) :
 
         self.advance(units, rps.AGENT_EXECUTING, publish=True, push=False)
 
+        self._prepare_sandboxes(units)
+
         for unit in units:
             self._handle_unit(unit)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _prepare_sandboxes(self, units):
+        '''
+        Create the sandboxes for a bulk of units.  Parent directories are
+        created once per bulk, so that each sandbox costs a single `mkdir` -
+        metadata operations are expensive on shared file systems.  Errors are
+        reported when the unit is spawned.
+        '''
+
+        parents = set()
+        for unit in units:
+
+            uid     = unit['uid']
+            sandbox = unit['unit_sandbox_path']
+
+            self._prof.prof('exec_mkdir', uid=uid)
+            try:
+                parent = os.path.dirname(sandbox.rstrip('/'))
+                if parent not in parents:
+                    rpu.rec_makedir(parent)
+                    parents.add(parent)
+                os.mkdir(sandbox)
+
+            except FileExistsError:
+                pass
+
+            except OSError:
+                self._log.exception('cannot create sandbox %s', sandbox)
+
+            self._prof.prof('exec_mkdir_done', uid=uid)
+
+
     # --------------------------------------------------------------------------
     #
     def _handle_unit(self, cu):
@@ -195,24 +381,182 @@ class Popen(AgentExecutingComponent) :
         descr   = cu['description']
         sandbox = cu['unit_sandbox_path']
 
-        # make sure the sandbox exists
-        self._prof.prof('exec_mkdir', uid=cu['uid'])
-        rpu.rec_makedir(sandbox)
-        self._prof.prof('exec_mkdir_done', uid=cu['uid'])
-
+        # the sandbox was created by `_prepare_sandboxes()`
         launch_script_name = '%s/%s.sh' % (sandbox, cu['uid'])
         slots_fname        = '%s/%s.sl' % (sandbox, cu['uid'])
 
-        self._log.debug("Created launch_script: %s", launch_script_name)
-
         # prep stdout/err so that we can append w/o checking for None
         cu['stdout'] = ''
         cu['stderr'] = ''
 
-        with open(slots_fname, "w") as launch_script:
-            launch_script.write('\n%s\n\n' % pprint.pformat(cu['slots']))
+        # the slots file is only written for debugging
+        if self._cfg.get('unit_slots_file', True):
+            with open(slots_fname, "w") as slots_file:
+                slots_file.write('\n%s\n\n' % pprint.pformat(cu['slots']))
+
+        # in template mode, units share a launch script, and the unit specific
+        # parts are passed via the environment.  Otherwise (and for launch
+        # methods which hop to other nodes) we write a launch script per unit.
+        env = None
+        if self._cfg.get('launch_template'):
+            cmdline, env = self._template_command(launcher, cu)
+
+        if env is None:
+            cmdline = self._create_launch_script(launcher, cu,
+                                                 launch_script_name)
+
+        # prepare stdout/stderr
+        stdout_file = descr.get('stdout') or '%s.out' % cu['uid']
+        stderr_file = descr.get('stderr') or '%s.err' % cu['uid']
+
+        cu['stdout_file'] = os.path.join(sandbox, stdout_file)
+        cu['stderr_file'] = os.path.join(sandbox, stderr_file)
+
+        _stdout_file_h = open(cu['stdout_file'], 'a')
+        _stderr_file_h = open(cu['stderr_file'], 'a')
+
+        self._log.info("Launching unit %s via %s in %s", cu['uid'], cmdline, sandbox)
+
+        self._prof.prof('exec_start', uid=cu['uid'])
+        cu['proc'] = subprocess.Popen(args       = cmdline,
+                                      executable = None,
+                                      stdin      = None,
+                                      stdout     = _stdout_file_h,
+                                      stderr     = _stderr_file_h,
+                                      close_fds  = True,
+                                      shell      = env is None,
+                                      env        = env,
+                                      cwd        = sandbox,
+                                      start_new_session = True)
+        self._prof.prof('exec_ok', uid=cu['uid'])
+
+        if self._metrics:
+            self._metrics.inc('units_spawned')
+
+        # store pid for last-effort termination
+        _pids.append(cu['proc'].pid)
+
+        self._watch_queue.put(cu)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _create_template(self):
+        '''
+        Write the launch script template shared by all units of this executor,
+        and prepare the environment for the units, which contains the settings
+        common to all units.
+        '''
+
+        fname = '%s/%s.launch.sh' % (self._pwd, self.uid)
+
+        env = dict(os.environ)
+        env['RADICAL_BASE']     = self._pwd
+        env['RP_SESSION_ID']    = self._cfg['sid']
+        env['RP_PILOT_ID']      = self._cfg['pid']
+        env['RP_AGENT_ID']      = self._cfg['aid']
+        env['RP_SPAWNER_ID']    = self.uid
+        env['RP_GTOD']          = self.gtod
+        env['RP_TMP']           = self._cu_tmp
+        env['RP_PILOT_SANDBOX'] = self._pwd
+        env['RP_PILOT_STAGING'] = self._pwd
+        env.pop('RP_PROF',       None)
+        env.pop('RP_PROF_BATCH', None)
+
+        cu_pre_exec = '\n'.join(self._cfg.get('cu_pre_exec') or [])
+
+        with open(fname, 'w', opener=_exec_opener) as fout:
+            fout.write(_TEMPLATE % {'prof'       : _PROF_FUNC,
+                                    'cu_pre_exec': cu_pre_exec})
+
+        self._template     = fname
+        self._template_env = env
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _template_command(self, launcher, cu):
+        '''
+        Return the command and environment to run the unit via the launch
+        script template, or `[None, None]` if the launch method hops to
+        a different node (the environment is not passed along then).
+        '''
+
+        uid     = cu['uid']
+        descr   = cu['description']
+
+        if not self._template:
+            self._create_template()
+
+        try:
+            launch_command, hop_cmd = launcher.construct_command(cu,
+                                                            self._template)
+        except Exception as e:
+            msg = "Error in spawner (%s)" % e
+            self._log.exception(msg)
+            raise RuntimeError (msg) from e
+
+        if hop_cmd:
+            return None, None
+
+        pre  = ''
+        post = ''
+        env  = ''
+
+        fail = ' (echo "pre_exec failed"; false) || exit'
+        for elem in descr['pre_exec'] or []:
+            pre += "%s || %s\n" % (elem, fail)
+
+        fail = ' (echo "post_exec failed"; false) || exit'
+        for elem in descr['post_exec'] or []:
+            post += "%s || %s\n" % (elem, fail)
+
+        for key, val in (descr['environment'] or {}).items():
+            env += 'export "%s=%s"\n' % (key, val)
+
+        ret = dict(self._template_env)
+        ret['RP_UNIT_ID']        = uid
+        ret['RP_UNIT_NAME']      = str(descr.get('name'))
+        ret['OMP_NUM_THREADS']   = str(descr['cpu_threads'])
+        ret['RP_UNIT_ENV']       = env
+        ret['RP_UNIT_PRE_EXEC']  = pre
+        ret['RP_UNIT_EXEC']      = launch_command
+        ret['RP_UNIT_POST_EXEC'] = post
+
+        ret.update(self._prof_env(cu))
 
-        with open(launch_script_name, "w") as launch_script:
+        return [self._template], ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _prof_env(self, cu):
+
+        # environment settings which enable unit side profiling
+        if not self._prof.enabled:
+            return dict()
+
+        if self._prof_mode == 'file':
+            return {'RP_PROF': '%s/%s.prof' % (cu['unit_sandbox_path'],
+                                               cu['uid'])}
+
+        if self._prof_mode == 'batch':
+            return {'RP_PROF_BATCH': self._prof_batch}
+
+        return dict()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _create_launch_script(self, launcher, cu, launch_script_name):
+
+        descr   = cu['description']
+        sandbox = cu['unit_sandbox_path']
+
+        self._log.debug("Created launch_script: %s", launch_script_name)
+
+        with open(launch_script_name, "w",
+                  opener=_exec_opener) as launch_script:
             launch_script.write('#!/bin/sh\n\n')
 
             # Create string for environment variable setting
@@ -229,27 +573,14 @@ class Popen(AgentExecutingComponent) :
             env_string += 'export RP_TMP="%s"\n'           % self._cu_tmp
             env_string += 'export RP_PILOT_SANDBOX="%s"\n' % self._pwd
             env_string += 'export RP_PILOT_STAGING="%s"\n' % self._pwd
-            if self._prof.enabled:
-                env_string += 'export RP_PROF="%s/%s.prof"\n' % (sandbox, cu['uid'])
-
-            else:
-                env_string += 'unset  RP_PROF\n'
+            env_string += 'unset  RP_PROF RP_PROF_BATCH\n'
+            for key, val in self._prof_env(cu).items():
+                env_string += 'export %s="%s"\n' % (key, val)
 
             if 'RP_APP_TUNNEL' in os.environ:
                 env_string += 'export RP_APP_TUNNEL="%s"\n' % os.environ['RP_APP_TUNNEL']
 
-            env_string += '''
-prof(){
-    if test -z "$RP_PROF"
-    then
-        return
-    fi
-    event=$1
-    msg=$2
-    now=$($RP_GTOD)
-    echo "$now,$event,unit_script,MainThread,$RP_UNIT_ID,AGENT_EXECUTING,$msg" >> $RP_PROF
-}
-'''
+            env_string += _PROF_FUNC
 
             # FIXME: this should be set by an LaunchMethod filter or something (GPU)
             env_string += 'export OMP_NUM_THREADS="%s"\n' % descr['cpu_threads']
@@ -306,83 +637,138 @@ prof(){
                 launch_script.write("\n# Post-exec commands\n")
                 launch_script.write('prof cu_post_start\n')
                 launch_script.write('%s\n' % post)
-                launch_script.write('prof cu_post_stop "$ret=RETVAL"\n')
+                launch_script.write('prof cu_post_stop "ret=$RETVAL"\n')
 
             launch_script.write("\n# Exit the script with the return code from the command\n")
             launch_script.write("prof cu_stop\n")
             launch_script.write("exit $RETVAL\n")
 
-        # done writing to launch script, get it ready for execution.
-        st = os.stat(launch_script_name)
-        os.chmod(launch_script_name, st.st_mode | stat.S_IEXEC)
+        return cmdline
 
-        # prepare stdout/stderr
-        stdout_file = descr.get('stdout') or '%s.out' % cu['uid']
-        stderr_file = descr.get('stderr') or '%s.err' % cu['uid']
 
-        cu['stdout_file'] = os.path.join(sandbox, stdout_file)
-        cu['stderr_file'] = os.path.join(sandbox, stderr_file)
+    # --------------------------------------------------------------------------
+    #
+    def _watch(self):
 
-        _stdout_file_h = open(cu['stdout_file'], 'a')
-        _stderr_file_h = open(cu['stderr_file'], 'a')
+        try:
+            while not self._terminate.is_set():
 
-        self._log.info("Launching unit %s via %s in %s", cu['uid'], cmdline, sandbox)
+                if self._selector:
+                    self._wait_running()
 
-        self._prof.prof('exec_start', uid=cu['uid'])
-        cu['proc'] = subprocess.Popen(args       = cmdline,
-                                      executable = None,
-                                      stdin      = None,
-                                      stdout     = _stdout_file_h,
-                                      stderr     = _stderr_file_h,
-                                      preexec_fn = os.setsid,
-                                      close_fds  = True,
-                                      shell      = True,
-                                      cwd        = sandbox)
-        self._prof.prof('exec_ok', uid=cu['uid'])
+                else:
+                    # add all new cus to the watchlist, and check on all known
+                    # cus.
+                    cus    = self._get_new()
+                    action = self._check_running()
 
-        # store pid for last-effort termination
-        _pids.append(cu['proc'].pid)
+                    if not action and not cus :
+                        # nothing happened at all!  Zzz for a bit.
+                        # FIXME: make configurable
+                        time.sleep(0.1)
 
-        self._watch_queue.put(cu)
+        except Exception as e:
+            self._log.exception("Error in ExecWorker watch loop (%s)" % e)
+            # FIXME: this should signal the ExecWorker for shutdown...
 
 
     # --------------------------------------------------------------------------
     #
-    def _watch(self):
+    def _collect_events(self, uid):
+        '''
+        Merge the batched unit side profile events of the given (completed)
+        unit into the agent profile, and remove the event file.
+        '''
 
+        if not self._prof_batch:
+            return
+
+        fname = '%s/%s' % (self._prof_batch, uid)
         try:
-            while not self._terminate.is_set():
+            with open(fname) as fin:
+                data = fin.read()
+            os.unlink(fname)
+        except FileNotFoundError:
+            # no events (or the unit got killed before writing them)
+            return
+
+        for line in data.split('\n'):
+            if not line:
+                continue
+            try:
+                ts, event, _, msg = line.split('\t', 3)
+                # `$EPOCHREALTIME` uses the locale's decimal point
+                self._prof.prof(ts=float(ts.replace(',', '.')), event=event,
+                                comp='unit_script', tid='MainThread', uid=uid,
+                                state=rps.AGENT_EXECUTING, msg=msg)
+            except ValueError:
+                self._log.error('invalid unit profile event: %s', line)
 
-                cus = list()
-                try:
-                    # we don't want to only wait for one CU -- then we would
-                    # pull CU state too frequently.  OTOH, we also don't want to
-                    # learn about CUs until all slots are filled, because then
-                    # we may not be able to catch finishing CUs in time -- so
-                    # there is a fine balance here.  Balance means 100 (FIXME).
-                    MAX_QUEUE_BULKSIZE = 100
-                    while len(cus) < MAX_QUEUE_BULKSIZE :
-                        cus.append (self._watch_queue.get_nowait())
-
-                except queue.Empty:
-                    # nothing found -- no problem, see if any CUs finished
-                    pass
-
-                # add all cus we found to the watchlist
-                for cu in cus :
-                    self._cus_to_watch.append (cu)
-
-                # check on the known cus.
-                action = self._check_running()
-
-                if not action and not cus :
-                    # nothing happened at all!  Zzz for a bit.
-                    # FIXME: make configurable
-                    time.sleep(0.1)
 
-        except Exception as e:
-            self._log.exception("Error in ExecWorker watch loop (%s)" % e)
-            # FIXME: this should signal the ExecWorker for shutdown...
+    # --------------------------------------------------------------------------
+    #
+    def _get_new(self):
+
+        cus = list()
+        try:
+            while True:
+                cus.append(self._watch_queue.get_nowait())
+
+        except queue.Empty:
+            pass
+
+        for cu in cus:
+            self._cus_to_watch[cu['uid']] = cu
+
+        return cus
+
+
+    # --------------------------------------------------------------------------
+    # Wait for running tasks to finish, for new tasks to arrive, or for the
+    # cancellation check interval to pass - whichever comes first.  The cost of
+    # this method depends on the number of finished tasks, not on the number of
+    # running tasks.
+    def _wait_running(self):
+
+        # FIXME: make configurable
+        for key, _ in self._selector.select(timeout=0.1):
+
+            if key.fileobj is self._watch_queue:
+                self._watch_queue.drain()
+                continue
+
+            uid = key.data
+            cu  = self._cus_to_watch.get(uid)
+            self._unregister_pidfd(uid)
+
+            if cu:
+                self._unit_done(cu, cu['proc'].wait())
+
+        for cu in self._get_new():
+
+            uid = cu['uid']
+            try:
+                fd = os.pidfd_open(cu['proc'].pid)
+
+            except ProcessLookupError:
+                # already collected
+                self._unit_done(cu, cu['proc'].wait())
+                continue
+
+            self._pidfds[uid] = fd
+            self._selector.register(fd, selectors.EVENT_READ, data=uid)
+
+        self._check_cancel()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _unregister_pidfd(self, uid):
+
+        fd = self._pidfds.pop(uid, None)
+        if fd is not None:
+            self._selector.unregister(fd)
+            os.close(fd)
 
 
     # --------------------------------------------------------------------------
@@ -390,81 +776,105 @@ prof(){
     # next step.  Also check for a requested cancellation for the tasks.
     def _check_running(self):
 
-        action = 0
-        for cu in self._cus_to_watch:
+        action = self._check_cancel()
+
+        for cu in list(self._cus_to_watch.values()):
 
             # poll subprocess object
             exit_code = cu['proc'].poll()
-            uid       = cu['uid']
 
-            if exit_code is None:
-                # Process is still running
+            if exit_code is not None:
+                action += 1
+                self._unit_done(cu, exit_code)
 
-                if cu['uid'] in self._cus_to_cancel:
+        return action
 
-                    # FIXME: there is a race condition between the state poll
-                    # above and the kill command below.  We probably should pull
-                    # state after kill again?
 
-                    self._prof.prof('exec_cancel_start', uid=uid)
+    # --------------------------------------------------------------------------
+    #
+    def _check_cancel(self):
 
-                    # We got a request to cancel this cu - send SIGTERM to the
-                    # process group (which should include the actual launch
-                    # method)
-                  # cu['proc'].kill()
-                    action += 1
-                    try:
-                        os.killpg(cu['proc'].pid, signal.SIGTERM)
-                    except OSError:
-                        # unit is already gone, we ignore this
-                        pass
-                    cu['proc'].wait()  # make sure proc is collected
+        if not self._cus_to_cancel:
+            return 0
 
-                    with self._cancel_lock:
-                        self._cus_to_cancel.remove(uid)
+        # the cancel set can be much larger than the set of running units and
+        # vice versa: iterate over the smaller one
+        with self._cancel_lock:
+            if len(self._cus_to_cancel) < len(self._cus_to_watch):
+                uids = [uid for uid in self._cus_to_cancel
+                                 if uid in self._cus_to_watch]
+            else:
+                uids = [uid for uid in self._cus_to_watch
+                                 if uid in self._cus_to_cancel]
+            self._cus_to_cancel.difference_update(uids)
 
-                    self._prof.prof('exec_cancel_stop', uid=uid)
+        for uid in uids:
 
-                    del(cu['proc'])  # proc is not json serializable
-                    self._prof.prof('unschedule_start', uid=cu['uid'])
-                    self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, cu)
-                    self.advance(cu, rps.CANCELED, publish=True, push=False)
+            # we don't need to watch canceled CUs
+            cu = self._cus_to_watch.pop(uid)
+            self._unregister_pidfd(uid)
 
-                    # we don't need to watch canceled CUs
-                    self._cus_to_watch.remove(cu)
+            self._prof.prof('exec_cancel_start', uid=uid)
 
-            else:
+            # We got a request to cancel this cu - send SIGTERM to the process
+            # group (which should include the actual launch method)
+            try:
+                os.killpg(cu['proc'].pid, signal.SIGTERM)
+            except OSError:
+                # unit is already gone, we ignore this
+                pass
+            cu['proc'].wait()  # make sure proc is collected
+            self._collect_events(uid)
 
-                self._prof.prof('exec_stop', uid=uid)
+            self._prof.prof('exec_cancel_stop', uid=uid)
 
-                # make sure proc is collected
-                cu['proc'].wait()
+            del(cu['proc'])  # proc is not json serializable
+            self._prof.prof('unschedule_start', uid=uid)
+            self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, cu)
+            self.advance(cu, rps.CANCELED, publish=True, push=False)
 
-                # we have a valid return code -- unit is final
-                action += 1
-                self._log.info("Unit %s has return code %s.", uid, exit_code)
+        return len(uids)
 
-                cu['exit_code'] = exit_code
 
-                # Free the Slots, Flee the Flots, Ree the Frots!
-                self._cus_to_watch.remove(cu)
-                del(cu['proc'])  # proc is not json serializable
-                self._prof.prof('unschedule_start', uid=cu['uid'])
-                self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, cu)
+    # --------------------------------------------------------------------------
+    #
+    def _unit_done(self, cu, exit_code):
 
-                if exit_code != 0:
-                    # The unit failed - fail after staging output
-                    cu['target_state'] = rps.FAILED
+        uid = cu['uid']
 
-                else:
-                    # The unit finished cleanly, see if we need to deal with
-                    # output data.  We always move to stageout, even if there are no
-                    # directives -- at the very least, we'll upload stdout/stderr
-                    cu['target_state'] = rps.DONE
+        self._prof.prof('exec_stop', uid=uid)
 
-                self.advance(cu, rps.AGENT_STAGING_OUTPUT_PENDING, publish=True, push=True)
+        # make sure proc is collected, and merge its profile events
+        cu['proc'].wait()
+        self._collect_events(uid)
 
-        return action
+        # we have a valid return code -- unit is final
+        self._log.info("Unit %s has return code %s.", uid, exit_code)
+
+        cu['exit_code'] = exit_code
+
+        # the unit is final, so a late cancel request for it has expired
+        if uid in self._cus_to_cancel:
+            with self._cancel_lock:
+                self._cus_to_cancel.discard(uid)
+
+        # Free the Slots, Flee the Flots, Ree the Frots!
+        self._cus_to_watch.pop(uid, None)
+        del(cu['proc'])  # proc is not json serializable
+        self._prof.prof('unschedule_start', uid=uid)
+        self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, cu)
+
+        if exit_code != 0:
+            # The unit failed - fail after staging output
+            cu['target_state'] = rps.FAILED
+
+        else:
+            # The unit finished cleanly, see if we need to deal with
+            # output data.  We always move to stageout, even if there are no
+            # directives -- at the very least, we'll upload stdout/stderr
+            cu['target_state'] = rps.DONE
+
+        self.advance(cu, rps.AGENT_STAGING_OUTPUT_PENDING, publish=True, push=True)
 
 
 # ------------------------------------------------------------------------------
@@ -118,8 +118,9 @@ class Shell(AgentExecutingComponent):
         self._registry      = dict()
         self._registry_lock = ru.RLock()
 
-        self._cus_to_cancel  = list()
+        self._cus_to_cancel  = set()
         self._cancel_lock    = ru.RLock()
+        self.register_cancel_set(self._cus_to_cancel, self._cancel_lock)
 
         self._cached_events = list()  # keep monitoring events for pid's which
                                       # are not yet known
@@ -170,7 +171,7 @@ class Shell(AgentExecutingComponent):
 
             self._log.info("cancel_units command (%s)" % arg)
             with self._cancel_lock:
-                self._cus_to_cancel.append(arg['uids'])
+                self._cus_to_cancel.update(ru.as_list(arg['uids']))
 
         return True
 
@@ -197,7 +198,7 @@ class Shell(AgentExecutingComponent):
         if cu['uid'] in self._cus_to_cancel:
 
             with self._cancel_lock:
-                self._cus_to_cancel.remove(cu['uid'])
+                self._cus_to_cancel.discard(cu['uid'])
 
             self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, cu)
             self.advance(cu, rps.CANCELED, publish=True, push=False)
@@ -215,7 +216,7 @@ class Shell(AgentExecutingComponent):
                 # inverse registry for quick lookups:
                 inv_registry = {v: k for k, v in list(self._registry.items())}
 
-                for cu_uid in self._cus_to_cancel:
+                for cu_uid in list(self._cus_to_cancel):
                     pid = inv_registry.get(cu_uid)
                     if pid:
                         # we own that cu, cancel it!
@@ -228,7 +229,7 @@ class Shell(AgentExecutingComponent):
                         del(self._registry[pid])
 
                         with self._cancel_lock:
-                            self._cus_to_cancel.remove(cu_uid)
+                            self._cus_to_cancel.discard(cu_uid)
 
             # The state advance will be managed by the watcher, which will pick
             # up the cancel notification.
@@ -106,7 +106,10 @@ class Sleep(AgentExecutingComponent) :
                 self._prof.prof('cu_stop',          uid=uid)
                 self._prof.prof('exec_stop',        uid=uid)
                 self._prof.prof('unschedule_start', uid=uid)
-                self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, t)
+
+            # the scheduler releases the slots of the whole bulk at once
+            if to_finish:
+                self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, to_finish)
 
             self.advance(to_finish, rps.AGENT_STAGING_OUTPUT_PENDING,
                                     publish=True, push=True)
@@ -5,7 +5,9 @@ __license__   = "MIT"
 
 import time
 import queue
+import bisect
 import logging
+import collections
 
 import multiprocessing    as mp
 
@@ -219,6 +221,10 @@ class AgentSchedulingComponent(rpu.Component):
         self.nodes = None
         self._uid  = ru.generate_id(cfg['owner'] + '.scheduling.%(counter)s',
                                     ru.ID_CUSTOM)
+
+        # uid -> node map, see `_index_nodes()`
+        self._node_index = dict()
+
         rpu.Component.__init__(self, cfg, session)
 
 
@@ -254,13 +260,16 @@ class AgentSchedulingComponent(rpu.Component):
             raise RuntimeError("ResourceManager %s didn't _configure gpus_per_node."
                               % self._rm_info['name'])
 
-        # create and initialize the wait pool.  Also maintain a mapping of that
-        # waitlist to a binned list where tasks are binned by size for faster
-        # lookups of replacement units.  And outdated binlist is mostly
-        # sufficient, only rebuild when we run dry
-        self._waitpool = dict()  # map uid:task
-        self._ts_map   = dict()
-        self._ts_valid = False  # set to False to trigger re-binning
+        # create and initialize the wait pool.  Waiting tasks are binned by
+        # their `tuple_size`, each bin is a FIFO queue.  The bins are kept
+        # sorted by task size (largest first), so that we never need to sort
+        # the waiting tasks themselves.  See `_schedule_waitpool()`.
+        self._waitpool   = dict()  # map bin key:deque(tasks)
+        self._wait_bins  = list()  # bin keys, largest tasks first
+        self._wait_sizes = list()  # negated task sizes of `_wait_bins`
+        self._wait_count = 0       # number of waiting tasks
+        self._wait_limit = None    # upper bound for task sizes which may fit
+        self._wait_ts    = None    # arrival times of tasks (scheduler process)
 
         # the scheduler algorithms have two inputs: tasks to be scheduled, and
         # slots becoming available (after tasks complete).
@@ -281,6 +290,7 @@ class AgentSchedulingComponent(rpu.Component):
 
         # configure the scheduler instance
         self._configure()
+        self._index_nodes()
         self.slot_status("slot status after  init")
 
         # register unit input channels
@@ -365,6 +375,22 @@ class AgentSchedulingComponent(rpu.Component):
             raise ValueError("Scheduler '%s' unknown or defunct" % name) from e
 
 
+    # --------------------------------------------------------------------------
+    #
+    # Map node uids to node entries, so that slots can be mapped to nodes
+    # without searching the node list.  This is called once after `_configure()`
+    # - a scheduler implementation which later replaces `self.nodes` needs to
+    # call it again.
+    #
+    def _index_nodes(self):
+
+        self._node_index = dict()
+
+        if isinstance(self.nodes, list):
+            for node in self.nodes:
+                self._node_index[node['uid']] = node
+
+
     # --------------------------------------------------------------------------
     #
     # Change the reserved state of slots (rpc.FREE or rpc.BUSY)
@@ -384,22 +410,9 @@ class AgentSchedulingComponent(rpu.Component):
         for slot_node in slots['nodes']:
 
             # Find the entry in the the slots list
+            node = self._node_index.get(slot_node['uid'])
 
-            # TODO: [Optimization] Assuming 'uid' is the ID of the node, it
-            #       seems a bit wasteful to have to look at all of the nodes
-            #       available for use if at most one node can have that uid.
-            #       Maybe it would be worthwhile to simply keep a list of nodes
-            #       that we would read, and keep a dictionary that maps the uid
-            #       of the node to the location on the list?
-
-            node = None
-            node_found = False
-            for node in self.nodes:
-                if node['uid'] == slot_node['uid']:
-                    node_found = True
-                    break
-
-            if not node_found:
+            if node is None:
                 raise RuntimeError('inconsistent node information')
 
             # iterate over cores/gpus in the slot, and update state
@@ -460,29 +473,102 @@ class AgentSchedulingComponent(rpu.Component):
 
     # --------------------------------------------------------------------------
     #
-    def _refresh_ts_map(self):
+    def _ts_scalar(self, ts):
+        '''
+        Tasks are ordered in the wait pool by the size of their request.  We
+        only look at cores right now - this needs fixing for GPU dominated
+        loads.  We define the size as `(cpu_processes + gpu_processes) *
+        cpu_threads`.
+        '''
 
-        # The ts map only gets invalidated when new units get added to the
-        # waitpool.  Removing tasks does *not* invalidate it.
-        #
-        # This method should only be called opportunistically, i.e., when a task
-        # lookup failed and it is worthwhile checking the waitlist tasks.
+        return (ts[0] + ts[2]) * ts[1]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _wait_key(self, task):
+        '''
+        Return the key of the wait pool bin for this task, which is its tuple
+        size.  Tagged tasks can only be placed on specific nodes, so they are
+        binned separately per tag and don't block untagged tasks of the same
+        size.
+        '''
+
+        descr = task['description']
+        tag   = descr.get('tag') or descr.get('tags', {}).get('colocate')
+
+        if tag is None:
+            return task['tuple_size']
+
+        return task['tuple_size'] + (str(tag),)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _waitpool_add(self, tasks):
+        '''
+        Append tasks to the FIFO of their bin.  New bins are inserted at their
+        position in the (descending) bin order.
+        '''
+
+        for task in tasks:
+
+            ts   = self._wait_key(task)
+            tbin = self._waitpool.get(ts)
+
+            if tbin is None:
+                tbin = collections.deque()
+                size = -self._ts_scalar(ts)
+                idx  = bisect.bisect_right(self._wait_sizes, size)
+
+                self._waitpool[ts] = tbin
+                self._wait_sizes.insert(idx, size)
+                self._wait_bins.insert(idx, ts)
+
+            tbin.append(task)
+
+        self._wait_count += len(tasks)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _waitpool_drop(self, ts):
+        '''
+        remove an empty bin from the wait pool
+        '''
+
+        idx = self._wait_bins.index(ts)
+
+        del self._waitpool[ts]
+        del self._wait_bins[idx]
+        del self._wait_sizes[idx]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _limit_waitpool(self, task):
+        '''
+        The given task could not be placed: larger tasks will not fit either
+        until resources get freed.  Following the size metric (see
+        `_ts_scalar()`), this only applies to CPU-only tasks - bins with GPU
+        tasks are always checked.  Tagged tasks may fail for reasons other than
+        the amount of free resources, and tasks requesting memory or local disk
+        may fail on those: neither limits the search.
+        '''
+
+        ts    = self._wait_key(task)
+        descr = task['description']
 
-        if self._ts_valid:
-            # nothing to do, the map is valid
+        if ts[2] or len(ts) > 4:
             return
 
-        # we can only rebuild if we have waiting tasks
-        if not self._waitpool:
+        if descr.get('mem_per_process') or descr.get('lfs_per_process'):
             return
 
-        for uid,task in self._waitpool.items():
-            ts = task['tuple_size']
-            if ts not in self._ts_map:
-                self._ts_map[ts] = set()
-            self._ts_map[ts].add(uid)
+        limit = self._ts_scalar(ts) - 1
 
-        self._ts_valid = True
+        if self._wait_limit is None or limit < self._wait_limit:
+            self._wait_limit = limit
 
 
     # --------------------------------------------------------------------------
@@ -499,6 +585,19 @@ class AgentSchedulingComponent(rpu.Component):
         raise NotImplementedError('unschedule_unit needs to be implemented.')
 
 
+    # --------------------------------------------------------------------------
+    #
+    def unschedule_units(self, units):
+        '''
+        Release the allocations of a bulk of units.  Scheduler implementations
+        can overload this method to free many allocations in one go - the
+        default falls back to `unschedule_unit()` for each unit.
+        '''
+
+        for unit in units:
+            self.unschedule_unit(unit)
+
+
     # --------------------------------------------------------------------------
     #
     def work(self, units):
@@ -527,7 +626,8 @@ class AgentSchedulingComponent(rpu.Component):
     #
     def unschedule_cb(self, topic, msg):
         '''
-        release (for whatever reason) all slots allocated to this unit
+        release (for whatever reason) all slots allocated to this unit (or to
+        this list of units)
         '''
 
         self._queue_unsched.put(msg)
@@ -558,16 +658,15 @@ class AgentSchedulingComponent(rpu.Component):
         #
         #   if resources:  # otherwise: why bother?
         #     if waitpool:
-        #       sort(waitpool)  # largest tasks first
-        #       for task in sorted(waitpool):
-        #         if task >= max_task:
-        #           prof schedule_skip
-        #         else:
+        #       for tbin in waitpool:  # binned by size, largest tasks first
+        #         if size(tbin) > max_task:
+        #           continue  # did not fit before, still won't fit
+        #         for task in tbin:
         #           if try_schedule:
         #             advance
         #             continue
-        #           max_task = max(max_task, size(task))
-        #         break  # larger tasks won't work
+        #           max_task = min(max_task, size(task) - 1)
+        #           break  # other tasks in this bin won't work
         #
         #   if any_resources:  # otherwise: why bother
         #     for task in queue_units.get():
@@ -589,6 +688,16 @@ class AgentSchedulingComponent(rpu.Component):
         self.register_output(rps.AGENT_EXECUTING_PENDING,
                              rpc.AGENT_EXECUTING_QUEUE)
 
+        # this process publishes its own metrics: scheduling latency (time from
+        # arrival in this process until placement) and wait pool size.  The
+        # control publisher of the parent process can't be used after the fork,
+        # so we create our own.
+        if self._metrics:
+            self._metrics = rpu.Metrics('%s.sched' % self.uid)
+            self._wait_ts = dict()
+            del self._publishers[rpc.CONTROL_PUBSUB]
+            self.register_publisher(rpc.CONTROL_PUBSUB)
+
         resources = True  # fresh start, all is free
         while not self._proc_term.is_set():
 
@@ -629,15 +738,19 @@ class AgentSchedulingComponent(rpu.Component):
             if not active:
                 time.sleep(0.1)  # FIXME: configurable
 
+            # no timed callbacks in this process: publish metrics from here
+            self.publish_metrics()
+
           # self._log.debug('=== schedule units x: %s %s', resources, active)
 
 
     # --------------------------------------------------------------------------
     #
-    def _prof_sched_skip(self, task):
+    def update_metrics(self):
 
-        pass
-      # self._prof.prof('schedule_skip', uid=task['uid'])
+        # the wait pool only exists in the scheduler process
+        if self._wait_ts is not None:
+            self._metrics.set('waitpool', self._wait_count)
 
 
     # --------------------------------------------------------------------------
@@ -646,31 +759,59 @@ class AgentSchedulingComponent(rpu.Component):
 
       # self.slot_status("before schedule waitpool")
 
-        # sort by inverse tuple size to place larger tasks first and backfill
-        # with smaller tasks.  We only look at cores right now - this needs
-        # fixing for GPU dominated loads.
-        # We define `tuple_size` as
-        #     `(cpu_processes + gpu_processes) * cpu_threads`
+        if not self._wait_count:
+            # nothing to do, all resources remain available
+            return True, False
+
+        # Cycle through the bins, largest tasks first, to place larger tasks
+        # first and backfill with smaller tasks.  All tasks in a bin have the
+        # same tuple size, so once a task of a bin cannot be placed, the
+        # remaining tasks in that bin cannot be placed either.
         #
-        tasks = list(self._waitpool.values())
-        tasks.sort(key=lambda x:
-                (x['tuple_size'][0] + x['tuple_size'][2]) * x['tuple_size'][1],
-                 reverse=True)
-
-        # cycle through waitpool, and see if we get anything placed now.
-        scheduled, unscheduled = ru.lazy_bisect(tasks,
-                                                check=self._try_allocation,
-                                                on_skip=self._prof_sched_skip,
-                                                log=self._log)
-
-        self._waitpool = {task['uid']:task for task in unscheduled}
+        # Bins with tasks larger than `self._wait_limit` are known not to fit,
+        # as they did not fit before and not enough resources have been freed
+        # since (see `_unschedule_completed()`).  We bisect to the largest bin
+        # which may fit.
+        start = 0
+        if self._wait_limit is not None:
+            start = bisect.bisect_left(self._wait_sizes, -self._wait_limit)
+
+        scheduled = list()
+        emptied   = list()
+        failed    = list()
+
+        for idx, ts in enumerate(self._wait_bins):
+
+            if idx < start and not ts[2] and len(ts) == 4:
+                continue
+
+            tbin = self._waitpool[ts]
+            while tbin:
+
+                if not self._try_allocation(tbin[0]):
+                    failed.append(tbin[0])
+                    break
+
+                scheduled.append(tbin.popleft())
+
+            if not tbin:
+                emptied.append(ts)
+
+        for ts in emptied:
+            self._waitpool_drop(ts)
+
+        for task in failed:
+            self._limit_waitpool(task)
+
+        self._wait_count -= len(scheduled)
+
         self.advance(scheduled, rps.AGENT_EXECUTING_PENDING, publish=True,
                                                              push=True)
         # method counts as `active` if anything was scheduled
         active = bool(scheduled)
 
         # if we sccheduled some tasks but not all, we ran out of resources
-        resources = not (bool(unscheduled) and bool(unscheduled))
+        resources = not bool(self._wait_count)
 
       # self.slot_status("after  schedule waitpool")
         return resources, active
@@ -694,6 +835,11 @@ class AgentSchedulingComponent(rpu.Component):
                     self._set_tuple_size(unit)
                     units.append(unit)
 
+                if self._wait_ts is not None:
+                    now = time.time()
+                    for unit in data:
+                        self._wait_ts[unit['uid']] = now
+
         except queue.Empty:
             # no more unschedule requests
             pass
@@ -721,9 +867,10 @@ class AgentSchedulingComponent(rpu.Component):
 
             else:
                 to_wait.append(unit)
+                self._limit_waitpool(unit)
 
         # all units which could not be scheduled are added to the waitpool
-        self._waitpool.update({task['uid']:task for task in to_wait})
+        self._waitpool_add(to_wait)
 
         # we performed some activity (worked on units)
         active = True
@@ -731,10 +878,6 @@ class AgentSchedulingComponent(rpu.Component):
         # if units remain waiting, we are out of usable resources
         resources = not bool(to_wait)
 
-        # incoming units which have to wait are the only reason to rebuild the
-        # tuple_size map
-        self._ts_valid = False
-
       # self.slot_status("after  schedule incoming")
         return resources, active
 
@@ -746,21 +889,14 @@ class AgentSchedulingComponent(rpu.Component):
         to_unschedule = list()
         try:
             while not self._proc_term.is_set():
-                unit = self._queue_unsched.get(timeout=0.001)
-                to_unschedule.append(unit)
+                units = self._queue_unsched.get(timeout=0.001)
+                to_unschedule.extend(ru.as_list(units))
 
         except queue.Empty:
             # no more unschedule requests
             pass
 
         to_release = list()  # slots of unscheduling tasks
-        placed     = list()  # uids of waiting tasks replacing unscheduled ones
-
-        if to_unschedule:
-
-            # rebuild the tuple_size binning, maybe
-            self._refresh_ts_map()
-
 
         for unit in to_unschedule:
             # if we find a waiting unit with the same tuple size, we don't free
@@ -770,11 +906,11 @@ class AgentSchedulingComponent(rpu.Component):
             # judge the legality of the resources for the new target unit.
 
           # ts = tuple(unit['tuple_size'])
-          # if self._ts_map.get(ts):
+          # if self._waitpool.get(ts):
           #
-          #     replace = self._waitpool[self._ts_map[ts].pop()]
+          #     replace = self._waitpool[ts].popleft()
           #     replace['slots'] = unit['slots']
-          #     placed.append(placed)
+          #     self._wait_count -= 1
           #
           #     # unschedule unit A and schedule unit B have the same
           #     # timestamp
@@ -804,14 +940,15 @@ class AgentSchedulingComponent(rpu.Component):
         # we have units to unschedule, which will free some resources. We can
         # thus try to schedule larger units again, and also inform the caller
         # about resource availability.
+        self.unschedule_units(to_release)
         for unit in to_release:
-            self.unschedule_unit(unit)
             self._prof.prof('unschedule_stop', uid=unit['uid'])
 
-        # we placed some previously waiting units, and need to remove those from
-        # the waitpool
-        self._waitpool = {task['uid']:task for task in self._waitpool.values()
-                                           if  task['uid'] not in placed}
+        # the freed resources may allow larger waiting tasks to be placed
+        if self._wait_limit is not None:
+            for unit in to_release:
+                self._set_tuple_size(unit)
+                self._wait_limit += self._ts_scalar(unit['tuple_size'])
 
         # we have new resources, and were active
         return True, True
@@ -849,6 +986,12 @@ class AgentSchedulingComponent(rpu.Component):
         # got an allocation, we can go off and launch the process
         self._prof.prof('schedule_ok', uid=uid)
 
+        if self._wait_ts is not None:
+            start = self._wait_ts.pop(uid, None)
+            if start:
+                self._metrics.observe('sched_latency', time.time() - start,
+                                      buckets=rpu.LATENCY_BUCKETS)
+
         return True
 
 
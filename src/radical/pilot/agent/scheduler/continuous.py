@@ -2,10 +2,12 @@
 __copyright__ = "Copyright 2013-2016, http://radical.rutgers.edu"
 __license__ = "MIT"
 
-import math as m
+import math    as m
+import logging
 
-from ...   import constants as rpc
-from .base import AgentSchedulingComponent
+from ...        import constants as rpc
+from .base      import AgentSchedulingComponent
+from .inventory import Inventory
 
 
 # ------------------------------------------------------------------------------
@@ -51,6 +53,10 @@ from .base import AgentSchedulingComponent
 # lfs storage and memory is specified in MByte.  The scheduler assumes that
 # both are freed when the unit finishes.
 #
+# The `cores` and `gpus` entries are managed by an `Inventory` instance (see
+# `inventory.py`), which stores them as `bytearray` rows and keeps track of the
+# number of free cores and GPUs per node.
+#
 #
 # Unit Tagging:
 #
@@ -78,6 +84,7 @@ class Continuous(AgentSchedulingComponent):
         self._tag_history   = dict()
         self._scattered     = None
         self._node_offset   = 0
+        self._inventory     = None
 
 
     # --------------------------------------------------------------------------
@@ -147,6 +154,9 @@ class Continuous(AgentSchedulingComponent):
 
             self.nodes.append(node_entry)
 
+        # switch the node list over to the compact inventory representation
+        self._inventory = Inventory(self.nodes)
+
         if self._rm_cores_per_node > 40 and \
            self._cfg['task_launch_method'] == 'JSRUN':
             self._rm_cores_per_node -= 1
@@ -162,9 +172,18 @@ class Continuous(AgentSchedulingComponent):
 
     # --------------------------------------------------------------------------
     #
-    def _iterate_nodes(self):
+    def _iterate_nodes(self, cores=None, gpus=None):
         # note that the first index is yielded twice, so that the respecitve
         # node can function as first and last node in an allocation.
+        #
+        # If `cores` and `gpus` are given, the request must be placed on
+        # a single node, and we only iterate over the nodes which the inventory
+        # reports to have sufficient free capacity - full nodes are skipped.
+
+        if cores is not None:
+            for idx in self._inventory.candidates(cores, gpus):
+                yield self.nodes[idx]
+            return
 
         iterator_count = 0
 
@@ -175,6 +194,30 @@ class Continuous(AgentSchedulingComponent):
             self._node_offset  = self._node_offset % len(self.nodes)
 
 
+    # --------------------------------------------------------------------------
+    #
+    # overload the base class methods which operate on the nodelist structure
+    #
+    def _change_slot_states(self, slots, new_state):
+
+        self._inventory.change_slot_states(slots, new_state)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def slot_status(self, msg=None):
+
+        if not self._log.isEnabledFor(logging.DEBUG):
+            return
+
+        if not msg: msg = ''
+
+        ret = self._inventory.status()
+        self._log.debug("status: %-30s: %s", msg, ret)
+
+        return ret
+
+
     # --------------------------------------------------------------------------
     #
     def unschedule_unit(self, unit):
@@ -188,6 +231,16 @@ class Continuous(AgentSchedulingComponent):
         self._change_slot_states(unit['slots'], rpc.FREE)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def unschedule_units(self, units):
+        '''
+        Release the slots of a bulk of units with a single inventory update.
+        '''
+
+        self._inventory.release([unit['slots'] for unit in units])
+
+
     # --------------------------------------------------------------------------
     #
     def _find_resources(self, node, find_slots, cores_per_slot, gpus_per_slot,
@@ -224,8 +277,9 @@ class Continuous(AgentSchedulingComponent):
         '''
 
         # check if the node can host the request
-        free_cores = node['cores'].count(rpc.FREE)
-        free_gpus  = node['gpus'].count(rpc.FREE)
+        node_idx   = self._inventory.index(node['uid'])
+        free_cores = self._inventory.free_cores[node_idx]
+        free_gpus  = self._inventory.free_gpus[node_idx]
         free_lfs   = node['lfs']['size']
         free_mem   = node['mem']
 
@@ -259,6 +313,7 @@ class Continuous(AgentSchedulingComponent):
         node_uid  = node['uid']
         node_name = node['name']
 
+        # the free counters guarantee that the searches below succeed
         core_idx  = 0
         gpu_idx   = 0
 
@@ -267,17 +322,15 @@ class Continuous(AgentSchedulingComponent):
             cores = list()
             gpus  = list()
 
-            while len(cores) < cores_per_slot:
+            if cores_per_slot:
+                cores    = self._inventory.find_cores(node_idx, cores_per_slot,
+                                                      core_idx)
+                core_idx = cores[-1] + 1
 
-                if node['cores'][core_idx] == rpc.FREE:
-                    cores.append(core_idx)
-                core_idx += 1
-
-            while len(gpus) < gpus_per_slot:
-
-                if node['gpus'][gpu_idx] == rpc.FREE:
-                    gpus.append(gpu_idx)
-                gpu_idx += 1
+            if gpus_per_slot:
+                gpus     = self._inventory.find_gpus(node_idx, gpus_per_slot,
+                                                     gpu_idx)
+                gpu_idx  = gpus[-1] + 1
 
             core_map = [cores]
             gpu_map  = [[gpu] for gpu in gpus]
@@ -411,8 +464,16 @@ class Continuous(AgentSchedulingComponent):
         alc_slots = list()
         rem_slots = req_slots
 
+        # single node requests can be served by any node with enough free
+        # resources: use the inventory's capacity index to skip full nodes.
+        # Multi-node requests need to check node continuity and thus iterate
+        # over all nodes.
+        if mpi: node_iter = self._iterate_nodes()
+        else  : node_iter = self._iterate_nodes(req_slots * cores_per_slot,
+                                                req_slots * gpus_per_slot)
+
         # start the search
-        for node in self._iterate_nodes():
+        for node in node_iter:
 
             node_uid  = node['uid']
           # node_name = node['name']
@@ -284,9 +284,12 @@ class ContinuousOrdered(Continuous):
                 if uid not in self._units:
                     # unknown unit
                     continue
+                unit = self._units[uid]
 
-            # get and parse order tag.  We don't need to repeat checks
-            order_tag = thing['description']['tags']['order']
+            # get and parse order tag.  We don't need to repeat checks.  State
+            # updates may not carry the unit description (`state_delta`), so
+            # we use the unit we registered on scheduling.
+            order_tag = unit['description']['tags']['order']
             ns    = order_tag['ns']
             order = order_tag['order']
           # size  = order_tag['size']
@@ -0,0 +1,271 @@
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+
+import array
+
+from ... import constants as rpc
+
+
+# ------------------------------------------------------------------------------
+#
+# The scheduler's node list represents the occupation of cores and GPUs as lists
+# of `rpc.FREE`, `rpc.BUSY` and `rpc.DOWN` markers.  For large allocations
+# (thousands of nodes with hundreds of hardware threads each) the time spent in
+# `list.count()` and in index scans on those lists dominates the scheduling
+# cost.
+#
+# The `Inventory` below replaces those lists with one `bytearray` row per node
+# and resource type, and maintains the number of free cores and GPUs per node
+# incrementally on every state change.  Capacity checks thus become O(1), and
+# slot searches use `bytearray.find()`, which skips over busy stretches of
+# a row in C.
+#
+# The node dicts in `self.nodes` are kept: their `cores` and `gpus` entries
+# *are* the inventory rows, so code which indexes or iterates those entries
+# continues to work unchanged.
+#
+# The inventory also maintains a free-capacity index: nodes are binned by their
+# number of free cores and GPUs, and `candidates()` walks those bins instead of
+# the node list.  Bins are plain lists, nodes are moved between bins in O(1) via
+# swap-and-pop when their free counters change.  Fully occupied nodes are thus
+# never looked at when searching for single-node placements.
+#
+class Inventory(object):
+
+    # glyphs used to render a row for `slot_status()`
+    _glyphs = bytes.maketrans(bytes([rpc.FREE, rpc.BUSY, rpc.DOWN]), b'-#!')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nodes):
+
+        self.nodes      = nodes
+        self.free_cores = array.array('l')
+        self.free_gpus  = array.array('l')
+
+        self._index     = dict()   # node uid -> row index
+
+        self._bins      = dict()   # (free cores, free gpus) -> [node idx]
+        self._bin_key   = list()   # node idx -> current bin key
+        self._bin_pos   = list()   # node idx -> position in that bin
+        self._max_cores = 0
+        self._max_gpus  = 0
+
+        for idx, node in enumerate(nodes):
+
+            node['cores'] = bytearray(node.get('cores', []))
+            node['gpus']  = bytearray(node.get('gpus',  []))
+
+            self._index[node['uid']] = idx
+            self.free_cores.append(node['cores'].count(rpc.FREE))
+            self.free_gpus.append(node['gpus'].count(rpc.FREE))
+
+            self._max_cores = max(self._max_cores, len(node['cores']))
+            self._max_gpus  = max(self._max_gpus,  len(node['gpus']))
+
+            self._bin_key.append(None)
+            self._bin_pos.append(None)
+            self._bin_add(idx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self.nodes)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def index(self, uid):
+        '''
+        return the row index of the node with the given uid
+        '''
+
+        idx = self._index.get(uid)
+        if idx is None:
+            raise RuntimeError('inconsistent node information')
+
+        return idx
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _bin_add(self, idx):
+
+        key = (self.free_cores[idx], self.free_gpus[idx])
+        if key not in self._bins:
+            self._bins[key] = list()
+
+        self._bin_key[idx] = key
+        self._bin_pos[idx] = len(self._bins[key])
+        self._bins[key].append(idx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _bin_del(self, idx):
+
+        nodes = self._bins[self._bin_key[idx]]
+        pos   = self._bin_pos[idx]
+        last  = nodes.pop()
+
+        if last != idx:
+            # move the last bin entry into the gap
+            nodes[pos]          = last
+            self._bin_pos[last] = pos
+
+
+    # --------------------------------------------------------------------------
+    #
+    def candidates(self, cores, gpus):
+        '''
+        Yield the indexes of all nodes which have at least `cores` free cores
+        and `gpus` free GPUs.  Nodes with the least sufficient capacity are
+        yielded first (best fit).  The cost of this method depends on the node
+        size, not on the number of nodes.
+
+        The caller must not change slot states while iterating.
+        '''
+
+        for n_cores in range(cores, self._max_cores + 1):
+            for n_gpus in range(gpus, self._max_gpus + 1):
+                for idx in self._bins.get((n_cores, n_gpus), ()):
+                    yield idx
+
+
+    # --------------------------------------------------------------------------
+    #
+    def find_cores(self, idx, n, start=0):
+        '''
+        return the indexes of the first `n` free cores on node `idx`, starting
+        the search at core index `start`.  Returns `None` if the node does not
+        have enough free cores.
+        '''
+
+        return self._find(self.nodes[idx]['cores'], n, start)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def find_gpus(self, idx, n, start=0):
+        '''
+        same as `find_cores()`, for GPUs
+        '''
+
+        return self._find(self.nodes[idx]['gpus'], n, start)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _find(self, row, n, start):
+
+        ret = list()
+        pos = row.find(rpc.FREE, start)
+
+        while pos >= 0 and len(ret) < n:
+            ret.append(pos)
+            pos = row.find(rpc.FREE, pos + 1)
+
+        if len(ret) < n:
+            return None
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def change_slot_states(self, slots, new_state):
+        '''
+        Set the cores and GPUs listed in `slots['nodes']` to `new_state`, and
+        account for the lfs and memory held by those slots.  The per-node free
+        counters are updated for each core and GPU which enters or leaves the
+        `rpc.FREE` state.
+        '''
+
+        self._change([slots], new_state)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def release(self, slots_list):
+        '''
+        Free the resources of a list of allocations in one go.  Compared to
+        calling `change_slot_states()` per allocation, each node which is
+        touched by the bulk is moved to its new capacity bin only once.
+        '''
+
+        self._change(slots_list, rpc.FREE)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _change(self, slots_list, new_state):
+
+        busy    = bool(new_state == rpc.BUSY)
+        touched = set()
+
+        for slots in slots_list:
+
+            for slot_node in slots['nodes']:
+
+                idx  = self.index(slot_node['uid'])
+                node = self.nodes[idx]
+
+                if idx not in touched:
+                    self._bin_del(idx)
+                    touched.add(idx)
+
+                row  = node['cores']
+                diff = 0
+                for cslot in slot_node['core_map']:
+                    for core in cslot:
+                        if row[core] == rpc.FREE: diff -= 1
+                        if new_state == rpc.FREE: diff += 1
+                        row[core] = new_state
+                self.free_cores[idx] += diff
+
+                row  = node['gpus']
+                diff = 0
+                for gslot in slot_node['gpu_map']:
+                    for gpu in gslot:
+                        if row[gpu]  == rpc.FREE: diff -= 1
+                        if new_state == rpc.FREE: diff += 1
+                        row[gpu] = new_state
+                self.free_gpus[idx] += diff
+
+                if slot_node['lfs']['path']:
+                    if busy: node['lfs']['size'] -= slot_node['lfs']['size']
+                    else   : node['lfs']['size'] += slot_node['lfs']['size']
+
+                if slot_node['mem']:
+                    if busy: node['mem'] -= slot_node['mem']
+                    else   : node['mem'] += slot_node['mem']
+
+        for idx in touched:
+            self._bin_add(idx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def status(self):
+        '''
+        return a string representation of the occupation of all nodes, in the
+        format used by `slot_status()`
+        '''
+
+        ret = '|'
+        for node in self.nodes:
+            ret += node['cores'].translate(self._glyphs).decode()
+            ret += ':'
+            ret += node['gpus'].translate(self._glyphs).decode()
+            ret += '|'
+
+        return ret
+
+
+# ------------------------------------------------------------------------------
+
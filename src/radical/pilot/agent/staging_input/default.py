@@ -4,8 +4,6 @@ __license__   = "MIT"
 
 
 import os
-import errno
-import shutil
 import tarfile
 
 import radical.saga  as rs
@@ -50,14 +48,29 @@ class Default(AgentStagingInputComponent):
         self.register_output(rps.AGENT_SCHEDULING_PENDING,
                              rpc.AGENT_SCHEDULING_QUEUE)
 
+        # local staging ops are enacted by the staging engine, which also
+        # calls back for the remaining actions
+        handlers     = {rpc.TARBALL : self._untar,
+                        rpc.TRANSFER: self._transfer}
+        self._engine = rpu.StagingEngine(self._cfg, self._log, self._prof,
+                                         prefix='staging_in',
+                                         handlers=handlers)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def finalize(self):
+
+        self._engine.close()
+
 
     # --------------------------------------------------------------------------
     #
     def _work(self, units):
 
         # we first filter out any units which don't need any input staging, and
-        # advance them again as a bulk.  We work over the others one by one, and
-        # advance them individually, to avoid stalling from slow staging ops.
+        # advance them again as a bulk.  The others are staged concurrently, but
+        # advanced individually, to avoid stalling from slow staging ops.
 
         no_staging_units = list()
         staging_units    = list()
@@ -81,13 +94,30 @@ class Default(AgentStagingInputComponent):
             self.advance(no_staging_units, rps.AGENT_SCHEDULING_PENDING,
                          publish=True, push=True)
 
-        for unit,actionables in staging_units:
-            self._handle_unit(unit, actionables)
+        if staging_units:
+            self._handle_units(staging_units)
 
 
     # --------------------------------------------------------------------------
     #
-    def _handle_unit(self, unit, actionables):
+    def _handle_units(self, staging_units):
+
+        bulk = [[unit, self._get_ops(unit, actionables)]
+                for unit, actionables in staging_units]
+
+        for unit, error in self._engine.stage(bulk):
+
+            if error:
+                self.advance(unit, rps.FAILED, publish=True, push=False)
+            else:
+                # all staging is done -- pass on to the scheduler
+                self.advance(unit, rps.AGENT_SCHEDULING_PENDING,
+                                   publish=True, push=True)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_ops(self, unit, actionables):
 
         uid = unit['uid']
 
@@ -123,8 +153,9 @@ class Default(AgentStagingInputComponent):
                        'pilot'    : str(pilot_sandbox),
                        'resource' : str(resource_sandbox)}
 
-
-        # we can now handle the actionable staging directives
+        # we can now translate the actionable staging directives into ops for
+        # the staging engine
+        ops = list()
         for sd in actionables:
 
             action = sd['action']
@@ -133,8 +164,6 @@ class Default(AgentStagingInputComponent):
             src    = sd['source']
             tgt    = sd['target']
 
-            self._prof.prof('staging_in_start', uid=uid, msg=did)
-
             assert(action in [rpc.COPY, rpc.LINK, rpc.MOVE,
                               rpc.TRANSFER, rpc.TARBALL])
 
@@ -176,75 +205,60 @@ class Default(AgentStagingInputComponent):
 
             # SAGA will take care of dir creation - but we do it manually
             # for local ops (copy, link, move)
+            mkdir = None
             if flags & rpc.CREATE_PARENTS and action != rpc.TRANSFER:
                 tgtdir = os.path.dirname(tgt.path)
                 if tgtdir != unit_sandbox.path:
-                    self._log.debug("mkdir %s", tgtdir)
-                    rpu.rec_makedir(tgtdir)
-
-            if action == rpc.COPY:
-                try:
-                    shutil.copytree(src.path, tgt.path)
-                except OSError as exc:
-                    if exc.errno == errno.ENOTDIR:
-                        shutil.copy(src.path, tgt.path)
-                    else:
-                        raise
-
-            elif action == rpc.LINK:
-
-                # Fix issue/1513 if link source is file and target is folder.
-                # should support POSIX standard where link is created
-                # with the same name as the source
-                if os.path.isfile(src.path) and os.path.isdir(tgt.path):
-                    os.symlink(src.path,
-                               '%s/%s' % (tgt.path, os.path.basename(src.path)))
-
-                else:
-                    os.symlink(src.path, tgt.path)
-
-            elif action == rpc.MOVE:
-                shutil.move(src.path, tgt.path)
-
-            elif action == rpc.TRANSFER:
-
-                # NOTE:  TRANSFER directives don't arrive here right now.
-                # FIXME: we only handle srm staging right now, and only for
-                #        a specific target proxy. Other TRANSFER directives are
-                #        left to umgr input staging.  We should use SAGA to
-                #        attempt all staging ops which do not involve the client
-                #        machine.
-                if src.schema == 'srm':
-                    # FIXME: cache saga handles
-                    srm_dir = rs.filesystem.Directory('srm://proxy/?SFN=bogus')
-                    srm_dir.copy(src, tgt)
-                    srm_dir.close()
-
-                else:
-                    self._log.error('no transfer for %s -> %s', src, tgt)
-                    self._prof.prof('staging_in_fail', uid=uid, msg=did)
-                    raise NotImplementedError('unsupported transfer %s' % src)
-
-            elif action == rpc.TARBALL:
-
-                # If somethig was staged via the tarball method, the tarball is
-                # extracted and then removed from the unit folder.  The target
-                # path is expected to be an *absolute* path on the target system
-                # - any relative paths specified by the application are expected
-                # to get expanded on the client side.
-                tarball = '%s/%s.tar' % (os.path.dirname(tgt.path), uid)
-                self._log.debug('extract tarball for %s', tarball)
-                tar = tarfile.open(tarball)
-                tar.extractall(path='/')
-                tar.close()
-
-              # FIXME: make tarball removal dependent on debug settings
-              # os.remove(os.path.dirname(tgt.path) + '/' + uid + '.tar')
-
-            self._prof.prof('staging_in_stop', uid=uid, msg=did)
-
-        # all staging is done -- pass on to the scheduler
-        self.advance(unit, rps.AGENT_SCHEDULING_PENDING, publish=True, push=True)
+                    mkdir = tgtdir
+
+            if action == rpc.TRANSFER:
+                ops.append({'did': did, 'action': action, 'mkdir': mkdir,
+                            'src': str(src), 'tgt': str(tgt)})
+            else:
+                ops.append({'did': did, 'action': action, 'mkdir': mkdir,
+                            'src': src.path, 'tgt': tgt.path})
+
+        return ops
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _transfer(self, uid, src, tgt):
+
+        # NOTE:  TRANSFER directives don't arrive here right now.
+        # FIXME: we only handle srm staging right now, and only for
+        #        a specific target proxy. Other TRANSFER directives are
+        #        left to umgr input staging.  We should use SAGA to
+        #        attempt all staging ops which do not involve the client
+        #        machine.
+        if src.startswith('srm://'):
+            # FIXME: cache saga handles
+            srm_dir = rs.filesystem.Directory('srm://proxy/?SFN=bogus')
+            srm_dir.copy(src, tgt)
+            srm_dir.close()
+
+        else:
+            self._log.error('no transfer for %s -> %s', src, tgt)
+            raise NotImplementedError('unsupported transfer %s' % src)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _untar(self, uid, src, tgt):
+
+        # If somethig was staged via the tarball method, the tarball is
+        # extracted and then removed from the unit folder.  The target
+        # path is expected to be an *absolute* path on the target system
+        # - any relative paths specified by the application are expected
+        # to get expanded on the client side.
+        tarball = '%s/%s.tar' % (os.path.dirname(tgt), uid)
+        self._log.debug('extract tarball for %s', tarball)
+        tar = tarfile.open(tarball)
+        tar.extractall(path='/')
+        tar.close()
+
+      # FIXME: make tarball removal dependent on debug settings
+      # os.remove(os.path.dirname(tgt) + '/' + uid + '.tar')
 
 
 # ------------------------------------------------------------------------------
@@ -4,8 +4,9 @@ __license__   = "MIT"
 
 
 import os
-import errno
-import shutil
+import time
+
+import concurrent.futures as cf
 
 import radical.utils as ru
 
@@ -52,6 +53,35 @@ class Default(AgentStagingOutputComponent):
         # we don't need an output queue -- units are picked up via mongodb
         self.register_output(rps.UMGR_STAGING_OUTPUT_PENDING, None)  # drop
 
+        # stdout / stderr capture: number of bytes to capture from the end (and
+        # begin) of the files, and number of threads which read the files of
+        # a bulk of units concurrently
+        self._stdio_tail = self._cfg.get('stdio_tail', rpu.MAX_IO_LOGLENGTH)
+        self._stdio_head = self._cfg.get('stdio_head', 0)
+        self._stdio_pool = None
+
+        n_workers = self._cfg.get('stdio_workers', 1)
+        if n_workers > 1:
+            self._stdio_pool = cf.ThreadPoolExecutor(max_workers=n_workers)
+
+        # unit profiles only exist in the 'file' mode of unit profiling (in
+        # 'batch' mode, the executor merges the unit events)
+        self._uprof = self._cfg.get('unit_prof_mode', 'file') == 'file'
+
+        # local staging ops are enacted by the staging engine
+        self._engine = rpu.StagingEngine(self._cfg, self._log, self._prof,
+                                         prefix='staging_out')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def finalize(self):
+
+        if self._stdio_pool:
+            self._stdio_pool.shutdown(wait=False)
+
+        self._engine.close()
+
 
     # --------------------------------------------------------------------------
     #
@@ -63,12 +93,19 @@ class Default(AgentStagingOutputComponent):
         self.advance(units, rps.AGENT_STAGING_OUTPUT, publish=True, push=False)
 
         # we first filter out any units which don't need any input staging, and
-        # advance them again as a bulk.  We work over the others one by one, and
-        # advance them individually, to avoid stalling from slow staging ops.
+        # advance them again as a bulk.  The others are staged concurrently, but
+        # advanced individually, to avoid stalling from slow staging ops.
 
         no_staging_units = list()
         staging_units    = list()
 
+        # we always dig for stdout/stderr
+        if self._stdio_pool and len(units) > 1:
+            list(self._stdio_pool.map(self._handle_unit_stdio, units))
+        else:
+            for unit in units:
+                self._handle_unit_stdio(unit)
+
         for unit in units:
 
             uid = unit['uid']
@@ -76,11 +113,9 @@ class Default(AgentStagingOutputComponent):
             # From here on, any state update will hand control over to the umgr
             # again.  The next unit update should thus push *all* unit details,
             # not only state.
-            unit['$all']    = True
-            unit['control'] = 'umgr_pending'
-
-            # we always dig for stdout/stderr
-            self._handle_unit_stdio(unit)
+            unit['$all']       = True
+            unit['control']    = 'umgr_pending'
+            unit['control_ts'] = time.time()
 
             # NOTE: all units get here after execution, even those which did not
             #       finish successfully.  We do that so that we can make
@@ -113,8 +148,8 @@ class Default(AgentStagingOutputComponent):
         if no_staging_units:
             self.advance(no_staging_units, publish=True, push=True)
 
-        for unit,actionables in staging_units:
-            self._handle_unit_staging(unit, actionables)
+        if staging_units:
+            self._handle_units(staging_units)
 
 
     # --------------------------------------------------------------------------
@@ -126,45 +161,46 @@ class Default(AgentStagingOutputComponent):
 
         self._prof.prof('staging_stdout_start', uid=uid)
 
-        # TODO: disable this at scale?
+        # only the tail (and head) of the files is read, so large outputs
+        # don't cost more than small ones
         if unit.get('stdout_file') and os.path.isfile(unit['stdout_file']):
-            with open(unit['stdout_file'], 'r') as stdout_f:
-                try:
-                    txt = ru.as_string(stdout_f.read())
-                except UnicodeDecodeError:
-                    txt = "unit stdout is binary -- use file staging"
 
-                unit['stdout'] += rpu.tail(txt)
+            txt = rpu.tail_file(unit['stdout_file'], self._stdio_tail,
+                                                     self._stdio_head)
+            if txt is None:
+                txt = "unit stdout is binary -- use file staging"
+
+            unit['stdout'] += txt
 
         self._prof.prof('staging_stdout_stop',  uid=uid)
         self._prof.prof('staging_stderr_start', uid=uid)
 
-        # TODO: disable this at scale?
         if unit.get('stderr_file') and os.path.isfile(unit['stderr_file']):
-            with open(unit['stderr_file'], 'r') as stderr_f:
-                try:
-                    txt = ru.as_string(stderr_f.read())
-                except UnicodeDecodeError:
-                    txt = "unit stderr is binary -- use file staging"
 
-                unit['stderr'] += rpu.tail(txt)
+            txt = rpu.tail_file(unit['stderr_file'], self._stdio_tail,
+                                                     self._stdio_head)
+            if txt is None:
+                txt = "unit stderr is binary -- use file staging"
+
+            unit['stderr'] += txt
 
-            # to help with ID mapping, also parse for PRTE output:
+            # to help with ID mapping, also parse for PRTE output (only within
+            # the captured output):
             # [batch3:122527] JOB [3673,4] EXECUTING
-            with open(unit['stderr_file'], 'r') as stderr_f:
+            for line in txt.split('\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                if line[0] == '[' and line.endswith('EXECUTING'):
+                    elems = line.replace('[', '').replace(']', '').split()
+                    tid   = elems[2]
+                    self._log.info('PRTE IDMAP: %s:%s' % (tid, uid))
 
-                for line in stderr_f.readlines():
-                    line = line.strip()
-                    if not line:
-                        continue
-                    if line[0] == '[' and line.endswith('EXECUTING'):
-                        elems = line.replace('[', '').replace(']', '').split()
-                        tid   = elems[2]
-                        self._log.info('PRTE IDMAP: %s:%s' % (tid, uid))
+        self._prof.prof('staging_stderr_stop', uid=uid)
 
-                unit['stderr'] += rpu.tail(txt)
+        if not self._uprof:
+            return
 
-        self._prof.prof('staging_stderr_stop', uid=uid)
         self._prof.prof('staging_uprof_start', uid=uid)
 
         unit_prof = "%s/%s.prof" % (sandbox, uid)
@@ -187,7 +223,24 @@ class Default(AgentStagingOutputComponent):
 
     # --------------------------------------------------------------------------
     #
-    def _handle_unit_staging(self, unit, actionables):
+    def _handle_units(self, staging_units):
+
+        bulk = [[unit, self._get_ops(unit, actionables)]
+                for unit, actionables in staging_units]
+
+        for unit, error in self._engine.stage(bulk):
+
+            if error:
+                self.advance(unit, rps.FAILED, publish=True, push=False)
+            else:
+                # all agent staging is done -- pass on to umgr output staging
+                self.advance(unit, rps.UMGR_STAGING_OUTPUT_PENDING,
+                                   publish=True, push=False)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_ops(self, unit, actionables):
 
         uid = unit['uid']
 
@@ -223,7 +276,9 @@ class Default(AgentStagingOutputComponent):
                        'pilot'    : str(pilot_sandbox),
                        'resource' : str(resource_sandbox)}
 
-        # we can now handle the actionable staging directives
+        # we can now translate the actionable staging directives into ops for
+        # the staging engine
+        ops = list()
         for sd in actionables:
 
             action = sd['action']
@@ -232,8 +287,6 @@ class Default(AgentStagingOutputComponent):
             src    = sd['source']
             tgt    = sd['target']
 
-            self._prof.prof('staging_out_start', uid=uid, msg=did)
-
             assert(action in [rpc.COPY, rpc.LINK, rpc.MOVE, rpc.TRANSFER]), \
                               'invalid staging action'
 
@@ -274,56 +327,26 @@ class Default(AgentStagingOutputComponent):
 
             # SAGA will take care of dir creation - but we do it manually
             # for local ops (copy, link, move)
+            mkdir = None
             if flags & rpc.CREATE_PARENTS and action != rpc.TRANSFER:
                 tgtdir = os.path.dirname(tgt.path)
                 if tgtdir != unit_sandbox.path:
-                    self._log.debug("mkdir %s", tgtdir)
-                    rpu.rec_makedir(tgtdir)
-
-            if   action == rpc.COPY:
-                try:
-                    shutil.copytree(src.path, tgt.path)
-                except OSError as exc:
-                    if exc.errno == errno.ENOTDIR:
-                        shutil.copy(src.path, tgt.path)
-                    else:
-                        raise
-
-            elif action == rpc.LINK:
-                # Fix issue/1513 if link source is file and target is folder
-                # should support POSIX standard where link is created
-                # with the same name as the source
-                if os.path.isfile(src.path) and os.path.isdir(tgt.path):
-                    os.symlink(src.path,
-                               os.path.join(tgt.path,
-                                            os.path.basename(src.path)))
-                else:  # default behavior
-                    os.symlink(src.path, tgt.path)
-            elif action == rpc.MOVE: shutil.move(src.path, tgt.path)
-            elif action == rpc.TRANSFER: pass
-                # This is currently never executed. Commenting it out.
-                # Uncomment and implement when uploads directly to remote URLs
-                # from units are supported.
+                    mkdir = tgtdir
+
+            if action == rpc.TRANSFER:
+                # This is currently never executed.  Implement when uploads
+                # directly to remote URLs from units are supported.
                 # FIXME: we only handle srm staging right now, and only for
                 #        a specific target proxy. Other TRANSFER directives are
                 #        left to umgr output staging.  We should use SAGA to
                 #        attempt all staging ops which do not target the client
                 #        machine.
-                # if tgt.schema == 'srm':
-                #     # FIXME: cache saga handles
-                #     srm_dir = rs.filesystem.Directory('srm://proxy/?SFN=bogus')
-                #     srm_dir.copy(src, tgt)
-                #     srm_dir.close()
-                # else:
-                #     self._log.error('no transfer for %s -> %s', src, tgt)
-                #     self._prof.prof('staging_out_fail', uid=uid, msg=did)
-                #     raise NotImplementedError('unsupported transfer %s' % tgt)
-
-            self._prof.prof('staging_out_stop', uid=uid, msg=did)
-
-        # all agent staging is done -- pass on to umgr output staging
-        self.advance(unit, rps.UMGR_STAGING_OUTPUT_PENDING,
-                           publish=True, push=False)
+                continue
+
+            ops.append({'did': did, 'action': action, 'mkdir': mkdir,
+                        'src': src.path, 'tgt': tgt.path})
+
+        return ops
 
 
 # ------------------------------------------------------------------------------
@@ -3,6 +3,7 @@ __copyright__ = "Copyright 2013-2016, http://radical.rutgers.edu"
 __license__   = "MIT"
 
 
+import sys
 import copy
 import time
 
@@ -45,23 +46,44 @@ class ComputeUnit(object):
     #
     # Note that this implies that we could create CUs before submitting them
     # to a UMGR, w/o any problems. (FIXME?)
+    #
+    # A umgr can hold millions of units, so we keep CUs small: attributes are
+    # slotted, the description only holds the values which differ from the
+    # description defaults, and strings which are shared by many units (pilot
+    # IDs, sandboxes etc.) are interned.  The umgr can also evict the stdout and
+    # stderr of final units into an on-disk store (see `evict_output`).
     # --------------------------------------------------------------------------
 
+    __slots__ = ['_descr', '_umgr', '_session', '_uid', '_state', '_log',
+                 '_exit_code', '_stdout', '_stderr', '_stdio', '_pilot',
+                 '_resource_sandbox', '_pilot_sandbox', '_unit_sandbox',
+                 '_client_sandbox']
+
+    # description defaults - mutable values are copied when used
+    _descr_defaults = cud.ComputeUnitDescription._defaults
+    _descr_mutable  = [k for k, v in _descr_defaults.items()
+                         if isinstance(v, (list, dict))]
+
+    # fields set by `_update()`, and those of them which are interned
+    _update_keys    = ['state', 'stdout', 'stderr', 'exit_code', 'pilot',
+                       'resource_sandbox', 'pilot_sandbox', 'unit_sandbox',
+                       'client_sandbox']
+    _intern_keys    = ['pilot', 'resource_sandbox', 'pilot_sandbox',
+                       'client_sandbox']
+
 
     # --------------------------------------------------------------------------
     #
-    def __init__(self, umgr, descr):
+    def __init__(self, umgr, descr, uid=None, advance=True):
 
         # NOTE GPU: we allow `mpi` for backward compatibility - but need to
         #      convert the bool into a decent value for `cpu_process_type`
         if  descr[cud.CPU_PROCESS_TYPE] in [True, 'True']:
             descr[cud.CPU_PROCESS_TYPE] = cud.MPI
 
-        # ensure that the description is viable
-        descr.verify()
-
-        # 'static' members
-        self._descr = descr.as_dict()
+        # ensure that the description is viable, and keep a private copy of it
+        # as 'static' member
+        self._descr = descr.as_verified_dict()
         self._umgr  = umgr
 
         # initialize state
@@ -72,56 +94,91 @@ class ComputeUnit(object):
         self._exit_code        = None
         self._stdout           = None
         self._stderr           = None
-        self._pilot            = descr.get('pilot')
+        self._stdio            = None   # reference into the umgr output store
+        self._pilot            = self._descr.get('pilot')
         self._resource_sandbox = None
         self._pilot_sandbox    = None
         self._unit_sandbox     = None
         self._client_sandbox   = None
-        self._callbacks        = dict()
 
         # ensure uid is unique
         if self._uid:
             if not self._umgr.check_uid(self._uid):
                 raise ValueError('uid %s is not unique' % self._uid)
+        elif uid:
+            # uid was pre-allocated by the umgr (bulk submission)
+            self._uid = uid
         else:
             self._uid = ru.generate_id('unit.%(item_counter)06d', ru.ID_CUSTOM,
                                        ns=self._session.uid)
 
-        for m in rpc.UMGR_METRICS:
-            self._callbacks[m] = dict()
-
-        # we always invke the default state cb
-        self._callbacks[rpc.UNIT_STATE][self._default_state_cb.__name__] = {
-                'cb'      : self._default_state_cb,
-                'cb_data' : None}
-
         # If staging directives exist, expand them to the full dict version.  Do
         # not, however, expand any URLs as of yet, as we likely don't have
         # sufficient information about pilot sandboxes etc.
         expand_description(self._descr)
 
-        self._umgr.advance(self.as_dict(), rps.NEW, publish=False, push=False)
+        # only keep what is not default
+        self._descr = self._compact(self._descr)
+
+        # on bulk submission, the umgr advances all new units at once
+        if advance:
+            self._umgr.advance(self.as_dict(), rps.NEW,
+                               publish=False, push=False)
 
 
     # --------------------------------------------------------------------------
     #
-    def __repr__(self):
+    @classmethod
+    def _compact(cls, descr):
+        '''
+        Return a copy of the given description dict with all default values
+        removed, and with string values interned.
+        '''
 
-        return str(self.as_dict())
+        ret = dict()
+        for k, v in descr.items():
+
+            if k in cls._descr_defaults:
+                d = cls._descr_defaults[k]
+                if type(v) is type(d) and v == d:
+                    continue
+
+            if type(v) is str:
+                v = sys.intern(v)
+
+            ret[k] = v
+
+        return ret
 
 
     # --------------------------------------------------------------------------
     #
-    def __str__(self):
+    def _expand(self):
+        '''
+        Return the full unit description as dict, i.e., the compacted
+        description merged into the description defaults.
+        '''
 
-        return str([self.uid, self.pilot, self.state])
+        ret = dict(self._descr_defaults)
+        for k in self._descr_mutable:
+            ret[k] = copy.copy(ret[k])
+        ret.update(self._descr)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __repr__(self):
+
+        return str(self.as_dict())
 
 
     # --------------------------------------------------------------------------
     #
-    def _default_state_cb(self, unit, state=None):
+    def __str__(self):
 
-        self._log.info("[Callback]: unit %s state: %s.", self.uid, self.state)
+        return str([self.uid, self.pilot, self.state])
 
 
     # --------------------------------------------------------------------------
@@ -151,14 +208,36 @@ class ComputeUnit(object):
         # we update all fields
         # FIXME: well, not all really :/
         # FIXME: setattr is ugly...  we should maintain all state in a dict.
-        for key in ['state', 'stdout', 'stderr', 'exit_code', 'pilot',
-                    'resource_sandbox', 'pilot_sandbox', 'unit_sandbox',
-                    'client_sandbox']:
+        for key in self._update_keys:
 
             val = unit_dict.get(key, None)
             if val is not None:
+                if key in self._intern_keys and type(val) is str:
+                    val = sys.intern(val)
                 setattr(self, "_%s" % key, val)
 
+        # new output replaces evicted output
+        if self._stdio and (unit_dict.get('stdout') is not None or
+                            unit_dict.get('stderr') is not None):
+            self._stdio = None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _evict(self, store):
+        '''
+        Move stdout and stderr into the given output store (see
+        `UnitManager._evict_output()`).  The properties read them back on
+        access.
+        '''
+
+        if self._stdio or (not self._stdout and not self._stderr):
+            return
+
+        self._stdio  = store.put(self._stdout, self._stderr)
+        self._stdout = None
+        self._stderr = None
+
         # callbacks are not invoked here anymore, but are bulked in the umgr
 
 
@@ -169,6 +248,21 @@ class ComputeUnit(object):
         Returns a Python dictionary representation of the object.
         """
 
+        ret = self._as_dict()
+        ret['description'] = self.description   # this is a deep copy
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _as_dict(self):
+        '''
+        Same as `as_dict()`, but the description is not deep-copied.  This is
+        used by the umgr to create the unit documents on bulk submission, which
+        are serialized right away (DB insert, component queues).
+        '''
+
         ret = {
             'type':             'unit',
             'umgr':             self.umgr.uid,
@@ -183,7 +277,7 @@ class ComputeUnit(object):
             'pilot_sandbox':    self.pilot_sandbox,
             'unit_sandbox':     self.unit_sandbox,
             'client_sandbox':   self.client_sandbox,
-            'description':      self.description   # this is a deep copy
+            'description':      self._expand()
         }
 
         return ret
@@ -242,7 +336,7 @@ class ComputeUnit(object):
         **Returns:**
             * A name (string).
         """
-        return self._descr.get('name')
+        return self._descr.get('name', self._descr_defaults['name'])
 
 
     # --------------------------------------------------------------------------
@@ -291,6 +385,9 @@ class ComputeUnit(object):
             * stdout (string)
         """
 
+        if self._stdio:
+            return self._umgr._load_output(self._stdio)[0]
+
         return self._stdout
 
 
@@ -311,6 +408,9 @@ class ComputeUnit(object):
             * stderr (string)
         """
 
+        if self._stdio:
+            return self._umgr._load_output(self._stdio)[1]
+
         return self._stderr
 
 
@@ -389,7 +489,7 @@ class ComputeUnit(object):
             * description (dict)
         """
 
-        return copy.deepcopy(self._descr)
+        return copy.deepcopy(self._expand())
 
 
     # --------------------------------------------------------------------------
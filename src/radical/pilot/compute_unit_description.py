@@ -435,5 +435,90 @@ class ComputeUnitDescription(ru.Description):
             raise ValueError("CU description needs 'executable' or 'kernel'")
 
 
+    # --------------------------------------------------------------------------
+    #
+    def as_verified_dict(self):
+        '''
+        Equivalent to `verify()` followed by `as_dict()`, but faster, which
+        matters for bulk submissions: the per-key verifiers are compiled from
+        the schema once per class, and values which already have the schema
+        type are only copied, not converted.  Other than `verify()`, this
+        method does not change the description itself.
+        '''
+
+        cls       = type(self)
+        verifiers = cls.__dict__.get('_verifiers_compiled')
+
+        if verifiers is None:
+            verifiers = {k: cls._compile(t) for k, t in cls._schema.items()}
+            cls._verifiers_compiled = verifiers
+
+        ret = dict()
+        for k, v in self._data.items():
+
+            if k.startswith('__'):
+                ret[k] = ru.Munch.demunch(v)
+                continue
+
+            verifier = verifiers.get(k)
+            if not verifier:
+                raise TypeError('%s: key %s not in schema' % (cls.__name__, k))
+
+            ret[k] = verifier(k, v)
+
+        self._verify()
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def _compile(cls, t):
+        '''
+        Return a function `f(key, val)` which verifies `val` against the schema
+        type `t`, like `ru.Description._verify_kvt()` does, and returns a copy
+        of it (for container types).  The function short-cuts the common case
+        where the value already has the expected type.
+        '''
+
+        # copy a value like `as_dict()` does
+        def _copy(v):
+            if isinstance(v, ru.Munch): return v.as_dict()
+            else                      : return ru.Munch.demunch(v)
+
+        # generic case: full verification, then copy
+        def _generic(k, v):
+            return _copy(cls._verify_kvt(k, v, t))
+
+        # untyped values and dicts are not converted, only copied
+        if t is None or t == {None: None}:
+            return lambda k, v: _copy(v)
+
+        if t in (int, str, float):
+            return lambda k, v: v if type(v) is t else _generic(k, v)
+
+        if t is bool:
+            return lambda k, v: v if v is True or v is False else _generic(k, v)
+
+        if isinstance(t, list) and t[0] in (int, str, float):
+            et = t[0]
+            def _list(k, v):
+                if type(v) is list and all(type(x) is et for x in v):
+                    return list(v)
+                return _generic(k, v)
+            return _list
+
+        if isinstance(t, dict) and list(t.items())[0] == (str, str):
+            def _dict(k, v):
+                if type(v) is dict and all(type(x) is str and type(y) is str
+                                           for x, y in v.items()):
+                    return dict(v)
+                return _generic(k, v)
+            return _dict
+
+        return _generic
+
+
 # ------------------------------------------------------------------------------
 
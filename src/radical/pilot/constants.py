@@ -90,6 +90,7 @@ import radical.saga.filesystem as _rsf
 
 CREATE_PARENTS = _rsf.CREATE_PARENTS  # Create parent directories if needed
 NON_FATAL      = 8192                # Don't fail the CU if input is missing
+CACHED         = 16384               # Transfer once per pilot, then link
 
 
 #
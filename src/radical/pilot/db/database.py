@@ -6,6 +6,7 @@ __license__   = 'MIT'
 
 import time
 import pymongo
+import threading as mt
 
 import radical.utils     as ru
 
@@ -61,11 +62,13 @@ class DBSession(object):
         if not self._c.count():
 
             # make 'uid', 'type' and 'state' indexes, as we frequently query
-            # based on combinations of those.  Only 'uid' is unique
+            # based on combinations of those.  Only 'uid' is unique.  'claim'
+            # is used to read back claimed units (see `claim_control()`)
             pma = pymongo.ASCENDING
             self._c.create_index([('uid',   pma)], unique=True,  sparse=False)
             self._c.create_index([('type',  pma)], unique=False, sparse=False)
             self._c.create_index([('state', pma)], unique=False, sparse=False)
+            self._c.create_index([('claim', pma)], unique=False, sparse=True)
 
             # insert the session doc
             self._can_delete = True
@@ -486,16 +489,56 @@ class DBSession(object):
 
     # --------------------------------------------------------------------------
     #
-    def tailed_control(self, collection, control, pattern, cb, cb_data=None):
+    def claim_control(self, control, pattern, collection=None, limit=None):
         '''
-        open a collection in capped mode, and create a tailing find-cursor on
-        it, where the find searches for the pattern:
+        Find documents matching `pattern` whose 'control' field is set to
+        `control + '_pending'`, and set that field to `control`, i.e., remove
+        the 'pending' postfix.  The claimed documents are returned in full, with
+        the updated 'control' field.  At most `limit` documents are claimed if
+        that is given.
 
-          pattern.extent({ 'control' : control + '_pending' })
+        Claims are atomic: the documents are marked with a unique claim token
+        by a single update which only matches documents which are still
+        pending, and are then read back by that token.  A document can thus
+        only be claimed once, even if multiple processes or threads (agents,
+        ingest threads) claim from the same pool of documents concurrently.
+        '''
+
+        if self.closed:
+            return list()
+
+        if collection: coll = self._db[collection]
+        else         : coll = self._c
+
+        token = ru.generate_id('claim', mode=ru.ID_UUID)
+        query = dict(pattern)
+        query['control'] = '%s_pending' % control
 
-        For any matching document, the 'control' field is updated to 'control',
-        ie. the 'pending' postfix is removed.  The resulting documents are
-        passed to the given callback as
+        if limit:
+            # select a batch of candidates - others may claim some of them
+            # before we do, so we may end up with less
+            cursor = coll.find(query, {'uid': 1}).limit(limit)
+            uids   = [doc['uid'] for doc in cursor]
+            if not uids:
+                return list()
+            query['uid'] = {'$in': uids}
+
+        res = coll.update(query, {'$set': {'control': control,
+                                           'claim'  : token}},
+                          multi=True)
+        if not res or not res.get('n'):
+            return list()
+
+        return list(coll.find({'claim': token}))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def tailed_control(self, collection, control, pattern, cb, cb_data=None,
+                             timeout=1.0, term=None, limit=None):
+        '''
+        Claim documents as `claim_control()` does (up to `limit` documents at
+        a time), and pass them to the given callback as
 
           cb(docs, cb_data=None)
 
@@ -504,10 +547,78 @@ class DBSession(object):
         matches the pattern.  The documents are returned in full, ie. with all
         available fields.
 
-        This method is blocking, and will never return.  It is adviseable to
-        call it in a thread.
+        The next claim is triggered by a MongoDB change stream as soon as any
+        document's 'control' field changes to `control + '_pending'`, and at
+        least every `timeout` seconds.  Change streams require MongoDB to run as
+        a replica set - otherwise, this method falls back to polling the
+        collection every `timeout` seconds.
+
+        This method is blocking, and only returns when the callback returns
+        `False` or when the `term` event is set.  It is adviseable to call it
+        in a thread.
         '''
-        raise NotImplementedError('duh!')
+
+        if collection: coll = self._db[collection]
+        else         : coll = self._c
+
+        if not term:
+            term = mt.Event()
+
+        wake    = mt.Event()
+        stop    = mt.Event()
+        watcher = mt.Thread(target=self._watch_control,
+                            args=[coll, '%s_pending' % control,
+                                  wake, stop, term, timeout])
+        watcher.daemon = True
+        watcher.start()
+
+        try:
+            while not term.is_set():
+
+                docs = self.claim_control(control, pattern, collection, limit)
+
+                if cb_data is not None: ret = cb(docs, cb_data=cb_data)
+                else                  : ret = cb(docs)
+
+                if ret is False:
+                    break
+
+                # if we got docs, more might be pending: claim again right away
+                if not docs:
+                    wake.wait(timeout)
+                    wake.clear()
+
+        finally:
+            stop.set()
+            watcher.join()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _watch_control(self, coll, value, wake, stop, term, timeout):
+        '''
+        Set the `wake` event whenever a document's 'control' field is set to
+        the given value, until `stop` or `term` are set.
+        '''
+
+        # `$all` updates and inserts set the control field in full documents
+        pipeline = [{'$match': {'$or': [
+                        {'fullDocument.control'                   : value},
+                        {'updateDescription.updatedFields.control': value}]}}]
+        try:
+            with coll.watch(pipeline,
+                            max_await_time_ms=int(timeout * 1000)) as stream:
+
+                self._log.info('watch control %s: change stream', value)
+
+                while not stop.is_set() and not term.is_set():
+                    if stream.try_next() is not None:
+                        wake.set()
+
+        except pymongo.errors.PyMongoError as e:
+            # no change streams on this DB instance
+            self._log.warn('watch control %s: poll every %.1fs (%s)',
+                           value, timeout, e)
 
 
 # ------------------------------------------------------------------------------
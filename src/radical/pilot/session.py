@@ -6,6 +6,7 @@ __license__   = "MIT"
 import os
 import sys
 import copy
+import zlib
 
 import radical.utils                as ru
 import radical.saga                 as rs
@@ -141,6 +142,7 @@ class Session(rs.Session):
         self._cache      = {'resource_sandbox' : dict(),
                             'session_sandbox'  : dict(),
                             'pilot_sandbox'    : dict(),
+                            'sandbox_layout'   : dict(),
                             'client_sandbox'   : self._cfg.client_sandbox,
                             'js_shells'        : dict(),
                             'fs_dirs'          : dict()}
@@ -901,6 +903,29 @@ class Session(rs.Session):
         return pilot_sandbox
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _get_sandbox_layout(self, pilot):
+        '''
+        Unit sandboxes are by default created in the pilot sandbox.  Resource
+        configs can set `unit_sandbox_layout` to `hashed` to spread them over
+        256 subdirectories instead, which avoids very large directories on
+        shared file systems.
+        '''
+
+        resource = pilot['description'].get('resource')
+        schema   = pilot['description'].get('access_schema')
+
+        with self._cache_lock:
+
+            if resource not in self._cache['sandbox_layout']:
+                rcfg   = self.get_resource_config(resource, schema)
+                layout = rcfg.get('unit_sandbox_layout', 'flat')
+                self._cache['sandbox_layout'][resource] = layout
+
+            return self._cache['sandbox_layout'][resource]
+
+
     # --------------------------------------------------------------------------
     #
     def _get_unit_sandbox(self, unit, pilot):
@@ -925,8 +950,13 @@ class Session(rs.Session):
 
         # default
         if not unit_sandbox:
+            uid          = unit['uid']
             unit_sandbox = ru.Url(self._get_pilot_sandbox(pilot))
-            unit_sandbox.path += "/%s/" % unit['uid']
+            if self._get_sandbox_layout(pilot) == 'hashed':
+                bucket = zlib.crc32(uid.encode('utf-8')) % 256
+                unit_sandbox.path += "/%02x/%s/" % (bucket, uid)
+            else:
+                unit_sandbox.path += "/%s/" % uid
 
         # cache
         unit['unit_sandbox'] = str(unit_sandbox)
@@ -52,7 +52,7 @@ class UMGRSchedulingComponent(rpu.Component):
         self._early        = dict()      # early-bound units, pid-sorted
         self._pilots       = dict()      # dict of known pilots
         self._pilots_lock  = ru.RLock()  # lock on the above dict
-        self._units        = dict()      # dict of scheduled unit IDs
+        self._units        = dict()      # pilot ID -> set of unit IDs
         self._units_lock   = ru.RLock()  # lock on the above dict
         self._waiting      = dict()      # dict for units waiting on deps
         self._waiting_lock = dict()      # lock on the above dict
@@ -302,11 +302,9 @@ class UMGRSchedulingComponent(rpu.Component):
 
             with self._units_lock:
                 for pid in self._units:
-                    for uid in uids:
-                        if uid in self._units[pid]:
-                            if pid not in to_cancel:
-                                to_cancel[pid] = list()
-                            to_cancel[pid].append(uid)
+                    found = [uid for uid in uids if uid in self._units[pid]]
+                    if found:
+                        to_cancel[pid] = found
 
             for pid in to_cancel:
                 self._session._dbs.pilot_command(cmd='cancel_units',
@@ -345,8 +343,8 @@ class UMGRSchedulingComponent(rpu.Component):
 
         with self._units_lock:
             if pid not in self._units:
-                self._units[pid] = list()
-            self._units[pid].append(uid)
+                self._units[pid] = set()
+            self._units[pid].add(uid)
 
 
     # --------------------------------------------------------------------------
@@ -4,8 +4,11 @@ __license__   = "MIT"
 
 
 import os
+import time
+import hashlib
 import tempfile
 import tarfile
+import collections
 
 import radical.utils as ru
 import radical.saga  as rs
@@ -31,6 +34,88 @@ UNIT_BULK_MKDIR_THRESHOLD = 16
 UNIT_BULK_MKDIR_MECHANISM = 'tar'
 
 
+# ------------------------------------------------------------------------------
+#
+class _InputCache(object):
+    '''
+    Book keeping for the input cache of a pilot: cached files are identified by
+    a key and evicted in LRU order once the cache exceeds its size (`0`: no
+    limit).  Entries are pinned while units which link them are alive, and
+    pinned entries are never evicted - so the size is a soft limit.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, size):
+
+        self._size    = size
+        self._used    = 0
+        self._entries = collections.OrderedDict()   # key: [size, pins]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get(self, key):
+        '''
+        Return `True` and pin the entry if `key` is cached, `False` otherwise.
+        '''
+
+        entry = self._entries.get(key)
+        if not entry:
+            return False
+
+        self._entries.move_to_end(key)
+        entry[1] += 1
+
+        return True
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put(self, key, size):
+        '''
+        Add and pin an entry.  Returns the list of keys evicted to make space
+        for it, or `None` if the entry can never fit (it is not added then).
+        '''
+
+        if self._size and size > self._size:
+            return None
+
+        evicted = list()
+        if self._size:
+            for old in list(self._entries):
+                if self._used + size <= self._size:
+                    break
+                old_size, pins = self._entries[old]
+                if not pins:
+                    del self._entries[old]
+                    self._used -= old_size
+                    evicted.append(old)
+
+        self._entries[key] = [size, 1]
+        self._used        += size
+
+        return evicted
+
+
+    # --------------------------------------------------------------------------
+    #
+    def release(self, key):
+
+        entry = self._entries.get(key)
+        if entry:
+            entry[1] -= 1
+
+
+    # --------------------------------------------------------------------------
+    #
+    def drop(self, key):
+
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._used -= entry[0]
+
+
 # ------------------------------------------------------------------------------
 #
 class Default(UMGRStagingInputComponent):
@@ -69,6 +154,19 @@ class Default(UMGRStagingInputComponent):
         # to this unit manager.
         self.register_subscriber(rpc.CONTROL_PUBSUB, self._base_command_cb)
 
+        # input files staged with the `CACHED` flag are transferred once per
+        # pilot into the pilot's input cache (one per stager instance), and
+        # are then linked into the unit sandboxes by the agent.  We keep track
+        # of the cache entries used by each unit and release them once the
+        # unit is final.
+        self._cache_dir   = 'input_cache/%s' % self._uid
+        self._cache_size  = self._cfg.get('input_cache_size', 0)
+        self._caches      = dict()
+        self._cache_pins  = dict()
+        self._cache_lock  = ru.RLock()
+
+        self.register_subscriber(rpc.STATE_PUBSUB, self._cache_state_cb)
+
 
     # --------------------------------------------------------------------------
     #
@@ -106,6 +204,30 @@ class Default(UMGRStagingInputComponent):
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _cache_state_cb(self, topic, msg):
+
+        # release the cache entries pinned by final units
+
+        if msg.get('cmd') != 'update':
+            return True
+
+        things = msg.get('arg')
+        if not isinstance(things, list):
+            things = [things]
+
+        with self._cache_lock:
+            for thing in things:
+                if thing.get('type')  != 'unit' or \
+                   thing.get('state') not in rps.FINAL:
+                    continue
+                for pid, key in self._cache_pins.pop(thing['uid'], []):
+                    self._caches[pid].release(key)
+
+        return True
+
+
     # --------------------------------------------------------------------------
     #
     def work(self, units):
@@ -127,8 +249,9 @@ class Default(UMGRStagingInputComponent):
             # no matter if we perform any staging or not, we will push the full
             # unit info to the DB on the next advance, and will pass control to
             # the agent.
-            unit['$all']    = True
-            unit['control'] = 'agent_pending'
+            unit['$all']       = True
+            unit['control']    = 'agent_pending'
+            unit['control_ts'] = time.time()
 
             # check if we have any staging directives to be enacted in this
             # component
@@ -391,6 +514,12 @@ class Default(UMGRStagingInputComponent):
                 src = complete_url(src, src_context, self._log)
                 tgt = complete_url(tgt, tgt_context, self._log)
 
+                if flags & rpc.CACHED and src.schema == 'file' \
+                                      and os.path.isfile(src.path):
+                    if self._stage_cached(unit, sd, src, saga_dir,
+                                          tgt_context):
+                        continue
+
                 self._prof.prof('staging_in_start', uid=uid, msg=did)
                 saga_dir.copy(src, tgt, flags=flags)
                 self._prof.prof('staging_in_stop', uid=uid, msg=did)
@@ -410,5 +539,83 @@ class Default(UMGRStagingInputComponent):
                            publish=True, push=True)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _stage_cached(self, unit, sd, src, saga_dir, tgt_context):
+        '''
+        Stage the source file of the given TRANSFER directive via the input
+        cache of the unit's pilot: the file is transferred on a cache miss,
+        and on a hit only the directive for the agent to link it from the cache
+        into the unit sandbox is added.  Cache keys are derived from the source
+        URL, size and mtime.  Returns `False` if the file does not fit into
+        the cache and needs a plain transfer.
+        '''
+
+        uid = unit['uid']
+        pid = unit['pilot']
+        did = sd['uid']
+
+        st  = os.stat(src.path)
+        key = hashlib.sha1(('%s:%d:%d' % (src, st.st_size, st.st_mtime_ns))
+                           .encode('utf-8')).hexdigest()
+
+        with self._cache_lock:
+
+            if pid not in self._caches:
+                self._caches[pid] = _InputCache(self._cache_size)
+            cache = self._caches[pid]
+
+            hit = cache.get(key)
+            if not hit:
+                evicted = cache.put(key, st.st_size)
+                if evicted is None:
+                    self._log.debug('too large for cache: %s', src)
+                    return False
+
+            self._cache_pins.setdefault(uid, list()).append([pid, key])
+
+        path = 'pilot:///%s/%s' % (self._cache_dir, key)
+
+        if hit:
+            self._prof.prof('staging_in_cache_hit', uid=uid, msg=did)
+
+        else:
+            self._prof.prof('staging_in_cache_miss', uid=uid, msg=did)
+
+            for old in evicted:
+                old_url = 'pilot:///%s/%s' % (self._cache_dir, old)
+                old_url = complete_url(old_url, tgt_context, self._log)
+                try:
+                    saga_dir.remove(old_url)
+                except Exception:
+                    self._log.exception('cache eviction failed: %s', old_url)
+
+            self._prof.prof('staging_in_start', uid=uid, msg=did)
+            try:
+                saga_dir.copy(src, complete_url(path, tgt_context, self._log),
+                              flags=rs.fs.CREATE_PARENTS)
+            except Exception:
+                # the entry is gone, so is the pin: the unit must not release
+                # an entry which is re-added for another unit later on
+                with self._cache_lock:
+                    cache.drop(key)
+                    pins = self._cache_pins[uid]
+                    pins.remove([pid, key])
+                    if not pins:
+                        del self._cache_pins[uid]
+                raise
+            self._prof.prof('staging_in_stop', uid=uid, msg=did)
+
+        # the agent links the cached file into the unit sandbox
+        unit['description']['input_staging'].append(
+                {'action' : rpc.LINK,
+                 'flags'  : rpc.DEFAULT_FLAGS,
+                 'uid'    : did,
+                 'source' : path,
+                 'target' : sd['target']})
+
+        return True
+
+
 # ------------------------------------------------------------------------------
 
@@ -5,6 +5,8 @@ __license__   = "MIT"
 
 import os
 import time
+import queue
+import itertools
 import threading as mt
 
 import radical.utils as ru
@@ -22,6 +24,120 @@ if os.environ.get('RADICAL_PILOT_BULK_CB', '').lower() in ['true', 'yes', '1']:
     _USE_BULK_CB = True
 
 
+# ------------------------------------------------------------------------------
+#
+class _UnitWaiter(object):
+    '''
+    A waiter tracks a set of units until each of them has reached (or passed)
+    a given state value.  It is notified by the umgr on every unit state
+    change, so that waiting does not require to poll the units.
+    '''
+
+    def __init__(self, uids, check_val):
+
+        self.pending   = set(uids)
+        self.check_val = check_val
+        self._done     = list()
+        self._cond     = mt.Condition()
+
+
+    def check(self, unit):
+        '''
+        Move the given unit to the done list if it is waited upon and has
+        reached the target state.  Returns `True` if the unit is done.
+        '''
+
+        if unit.uid not in self.pending:
+            return False
+
+        if  unit.state not in rps.FINAL and \
+            rps._unit_state_values[unit.state] < self.check_val:
+            return False
+
+        with self._cond:
+            self.pending.discard(unit.uid)
+            self._done.append(unit)
+            self._cond.notify()
+
+        return True
+
+
+    def get(self, timeout):
+        '''
+        Return all units which have become done since the last call.  Blocks
+        for up to `timeout` seconds if there are none.
+        '''
+
+        with self._cond:
+            if not self._done and self.pending:
+                self._cond.wait(timeout)
+
+            ret, self._done = self._done, list()
+
+        return ret
+
+
+# ------------------------------------------------------------------------------
+#
+class _OutputStore(object):
+    '''
+    An append-only file which holds the stdout and stderr of units which have
+    been evicted from memory (see `UnitManager._evict_output()`).  `put()`
+    returns a small reference tuple which `get()` resolves again.
+    '''
+
+    def __init__(self, path):
+
+        self.path  = path
+        self._lock = mt.Lock()
+        self._fd   = None
+        self._size = 0
+
+
+    def put(self, stdout, stderr):
+
+        out = b'' if stdout is None else stdout.encode('utf-8')
+        err = b'' if stderr is None else stderr.encode('utf-8')
+
+        with self._lock:
+
+            if self._fd is None:
+                self._fd   = os.open(self.path, os.O_WRONLY | os.O_CREAT |
+                                                os.O_APPEND, 0o600)
+                self._size = os.fstat(self._fd).st_size
+
+            offset      = self._size
+            self._size += os.write(self._fd, out + err)
+
+        # keep track of `None` values
+        return (offset, -1 if stdout is None else len(out),
+                        -1 if stderr is None else len(err))
+
+
+    def get(self, ref):
+
+        offset, n_out, n_err = ref
+
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            data = os.pread(fd, max(n_out, 0) + max(n_err, 0), offset)
+        finally:
+            os.close(fd)
+
+        out = None if n_out < 0 else data[:max(n_out, 0)].decode('utf-8')
+        err = None if n_err < 0 else data[max(n_out, 0):].decode('utf-8')
+
+        return out, err
+
+
+    def close(self):
+
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
 # ------------------------------------------------------------------------------
 #
 class UnitManager(rpu.Component):
@@ -68,6 +184,10 @@ class UnitManager(rpu.Component):
     NOTE: State notifications can arrive out of order wrt the unit state model!
     """
 
+    # output of final units is only kept in memory if eviction is disabled
+    _evict  = False
+    _output = None
+
     # --------------------------------------------------------------------------
     #
     def __init__(self, session, cfg='default', scheduler=None):
@@ -88,9 +208,10 @@ class UnitManager(rpu.Component):
 
         self._pilots      = dict()
         self._pilots_lock = ru.RLock('umgr.pilots_lock')
-        self._uids        = list()   # known UIDs
+        self._uids        = set()    # known UIDs
         self._units       = dict()
         self._units_lock  = ru.RLock('umgr.units_lock')
+        self._waiters     = list()   # see wait_units(), as_completed()
         self._callbacks   = dict()
         self._cb_lock     = ru.RLock('umgr.cb_lock')
         self._terminate   = mt.Event()
@@ -128,6 +249,9 @@ class UnitManager(rpu.Component):
         rpu.Component.__init__(self, cfg, session=session)
         self.start()
 
+        # stdout / stderr of final units can be evicted to disk
+        self._evict = self._cfg.get('evict_output', False)
+
         self._log.info('started umgr %s', self._uid)
         self._rep.info('<<create unit manager')
 
@@ -155,10 +279,22 @@ class UnitManager(rpu.Component):
         self.register_timed_cb(self._state_pull_cb,
                                timer=self._cfg['db_poll_sleeptime'])
 
-        # register callback which pulls units back from agent
-        # FIXME: this should be a tailing cursor in the update worker
-        self.register_timed_cb(self._unit_pull_cb,
-                               timer=self._cfg['db_poll_sleeptime'])
+        # pull units back from agent, either on DB changes or in regular
+        # intervals
+        if self._cfg.get('db_ingest', 'poll') == 'tail':
+            self._ingest = mt.Thread(target=self._session._dbs.tailed_control,
+                                     args=[None, 'umgr',
+                                           {'type': 'unit',
+                                            'umgr': self.uid},
+                                           self._tail_units_cb],
+                                     kwargs={'timeout':
+                                                 self._cfg['db_poll_sleeptime'],
+                                             'term': self._terminate})
+            self._ingest.daemon = True
+            self._ingest.start()
+        else:
+            self.register_timed_cb(self._unit_pull_cb,
+                                   timer=self._cfg['db_poll_sleeptime'])
 
         # also listen to the state pubsub for unit state changes
         self.register_subscriber(rpc.STATE_PUBSUB, self._state_sub_cb)
@@ -221,6 +357,9 @@ class UnitManager(rpu.Component):
 
         self._cmgr.close()
 
+        if self._output:
+            self._output.close()
+
         self._log.info("Closed UnitManager %s." % self._uid)
 
         self._closed = True
@@ -380,36 +519,37 @@ class UnitManager(rpu.Component):
 
         # pull units from the agent which are about to get back
         # under umgr control, and push them into the respective queues
-        # FIXME: this should also be based on a tailed cursor
-        # FIXME: Unfortunately, 'find_and_modify' is not bulkable, so we have
-        #        to use 'find'.  To avoid finding the same units over and over
-        #        again, we update the 'control' field *before* running the next
-        #        find -- so we do it right here.
-        unit_cursor = self.session._dbs._c.find({'type'    : 'unit',
-                                                 'umgr'    : self.uid,
-                                                 'control' : 'umgr_pending'})
-
-        if not unit_cursor.count():
-            # no units whatsoever...
-          # self._log.info("units pulled:    0")
-            return True  # this is not an error
+        units = self._session._dbs.claim_control('umgr', {'type': 'unit',
+                                                          'umgr': self.uid})
+        return self._ingest_units_cb(units)
 
-        # update the units to avoid pulling them again next time.
-        units = list(unit_cursor)
-        uids  = [unit['uid'] for unit in units]
 
-        self._log.info("units pulled:    %d", len(uids))
+    # --------------------------------------------------------------------------
+    #
+    def _tail_units_cb(self, units):
+
+        # the tail thread is not a component callback, but publishes on the
+        # same state pubsub: hold the callback lock like those do
+        with self._cb_lock:
+            return self._ingest_units_cb(units)
 
-        for unit in units:
-            unit['control'] = 'umgr'
 
-        self._session._dbs._c.update({'type'  : 'unit',
-                                      'uid'   : {'$in'     : uids}},
-                                     {'$set'  : {'control' : 'umgr'}},
-                                     multi=True)
+    # --------------------------------------------------------------------------
+    #
+    def _ingest_units_cb(self, units):
+
+        if self._terminate.is_set():
+            return False
+
+        if not units:
+            # no units whatsoever...
+          # self._log.info("units pulled:    0")
+            return True  # this is not an error
 
         self._log.info("units pulled: %4d", len(units))
         self._prof.prof('get', msg="bulk size: %d" % len(units), uid=self.uid)
+        self._prof_ingest(units)
+
         for unit in units:
 
             # we need to make sure to have the correct state:
@@ -545,6 +685,12 @@ class UnitManager(rpu.Component):
                 self._units[uid]._update(unit_dict)
                 to_notify.append([unit, s])
 
+                for waiter in self._waiters:
+                    waiter.check(unit)
+
+                if self._evict and s in rps.FINAL:
+                    self._evict_output(unit)
+
                 # we don't usually advance state at this point, but just keep up
                 # with state changes reported from elsewhere
                 if advance:
@@ -556,6 +702,30 @@ class UnitManager(rpu.Component):
             return to_notify
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _evict_output(self, unit):
+        '''
+        Move the stdout and stderr of the given (final) unit from memory into
+        the umgr's output store in the session directory.
+        '''
+
+        if not self._output:
+            self._output = _OutputStore('%s/%s.output'
+                                        % (self._cfg.path, self._uid))
+        unit._evict(self._output)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _load_output(self, ref):
+        '''
+        Return the stdout and stderr of a unit evicted by `_evict_output()`.
+        '''
+
+        return self._output.get(ref)
+
+
     # --------------------------------------------------------------------------
     #
     def _unit_cb(self, unit, state):
@@ -805,8 +975,6 @@ class UnitManager(rpu.Component):
               * A list of :class:`radical.pilot.ComputeUnit` objects.
         """
 
-        from .compute_unit import ComputeUnit
-
         ret_list = True
         if not isinstance(descriptions, list):
             ret_list     = False
@@ -817,32 +985,185 @@ class UnitManager(rpu.Component):
 
         # we return a list of compute units
         self._rep.progress_tgt(len(descriptions), label='submit')
+        units, unit_docs = self._create_units(descriptions, progress=True)
+        self._rep.progress_done()
+
+        self._insert_units(unit_docs)
+
+        if ret_list: return units
+        else       : return units[0]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stream_units(self, descriptions, chunk_size=1024, max_pending=None):
+        """
+        Submits :class:`radical.pilot.ComputeUnit` instances to the unit
+        manager like `submit_units()`, but in chunks: the units of each chunk
+        are handed over to the scheduler as soon as that chunk is inserted
+        into the database, and the DB insert of one chunk overlaps with the
+        creation of the next.  The time until the first units get scheduled is
+        thus independent of the total number of units.
+
+        Submission is subject to backpressure: no new chunk is created while
+        `max_pending` (default: `8 * chunk_size`) or more streamed units have
+        not yet passed the umgr scheduler (i.e., are waiting for a pilot).
+
+        **Arguments:**
+            * **descriptions** [iterable of
+              :class:`radical.pilot.ComputeUnitDescription`]: The descriptions
+              of the compute units to create.  A generator can be passed, and
+              it is only consumed as far as the submission progresses.
+            * **chunk_size** [`int`]: number of units to insert and advance
+              as one bulk.
+            * **max_pending** [`int`]: max number of unscheduled units.
+
+        **Returns:**
+              * An iterator of :class:`radical.pilot.ComputeUnit` objects,
+                which yields the units once they got submitted.  Submission
+                progresses as the iterator is consumed.
+
+        **Example**::
+
+            cud   = {'executable': '/bin/date'}
+            descr = (rp.ComputeUnitDescription(cud) for _ in range(1000000))
+
+            for unit in umgr.stream_units(descr):
+                ...
+        """
+
+        if chunk_size < 1:
+            raise ValueError('invalid chunk size %s' % chunk_size)
+
+        if not max_pending:
+            max_pending = 8 * chunk_size
+
+        # units are inserted and handed over to the scheduler in a separate
+        # thread.  The queue is bounded so that chunk creation runs at most one
+        # chunk ahead.
+        todo   = queue.Queue(maxsize=1)
+        done   = queue.Queue()
+        error  = list()
+        waiter = self._add_waiter([], rps.UMGR_STAGING_INPUT_PENDING)
+
+        def _inserter():
+            while True:
+                chunk = todo.get()
+                if chunk is None:
+                    break
+                if error:
+                    continue
+                try:
+                    self._insert_units(chunk[1])
+                    done.put(chunk[0])
+                except Exception as e:
+                    self._log.exception('chunk insert failed')
+                    error.append(e)
+
+        thread = mt.Thread(target=_inserter, name='%s.stream' % self._uid)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            descriptions = iter(descriptions)
+            while not error and not self._terminate.is_set():
+
+                chunk = list(itertools.islice(descriptions, chunk_size))
+                if not chunk:
+                    break
+
+                # backpressure: wait for the scheduler to catch up
+                while len(waiter.pending) >= max_pending:
+                    if error or self._terminate.is_set():
+                        break
+                    waiter.get(1.0)
+
+                if error or self._terminate.is_set():
+                    break
+
+                units, unit_docs = self._create_units(chunk)
+
+                # units are tracked before being handed over, so that we
+                # don't miss their state updates
+                waiter.pending.update([unit.uid for unit in units])
+                waiter.get(0)
+                todo.put([units, unit_docs])
+
+                # yield what has been submitted so far
+                while not done.empty():
+                    for unit in done.get():
+                        yield unit
+
+        finally:
+            todo.put(None)
+            thread.join()
+            self._del_waiter(waiter)
+
+        if error:
+            raise error[0]
+
+        while not done.empty():
+            for unit in done.get():
+                yield unit
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _create_units(self, descriptions, progress=False):
+        '''
+        Create units for the given descriptions, register them, and advance
+        them to `NEW`.  Returns the units and the respective unit documents.
+        '''
+
+        from .compute_unit import ComputeUnit
+
+        # units w/o explicit uid get their uids allocated in one call
+        n_auto = len([ud for ud in descriptions if not ud.get('uid')])
+        uids   = iter(rpu.generate_ids('unit.%(item_counter)06d', n_auto,
+                                       ns=self._session.uid))
+
         units = list()
         for ud in descriptions:
 
             if not ud.executable:
                 raise ValueError('compute unit executable must be defined')
 
-            unit = ComputeUnit(umgr=self, descr=ud)
+            uid  = None if ud.get('uid') else next(uids)
+            unit = ComputeUnit(umgr=self, descr=ud, uid=uid, advance=False)
             units.append(unit)
 
-            # keep units around
-            with self._units_lock:
-                self._units[unit.uid] = unit
-
             if self._session._rec:
                 ru.write_json(ud.as_dict(), "%s/%s.batch.%03d.json"
                         % (self._session._rec, unit.uid, self._rec_id))
 
-            self._rep.progress()
+            if progress:
+                self._rep.progress()
 
-        self._rep.progress_done()
+        # keep units around
+        with self._units_lock:
+            self._units.update({unit.uid: unit for unit in units})
 
         if self._session._rec:
             self._rec_id += 1
 
+        # Create the unit documents once and advance all units to `NEW` as
+        # a bulk.  The docs share the unit descriptions: they are only
+        # serialized, by the DB insert and when pushed to the next component.
+        unit_docs = [u._as_dict() for u in units]
+        self.advance(unit_docs, rps.NEW, publish=False, push=False)
+
+        return units, unit_docs
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _insert_units(self, unit_docs):
+        '''
+        Insert the given unit documents into the database, and hand the units
+        over to the scheduler.
+        '''
+
         # insert units into the database, as a bulk.
-        unit_docs = [u.as_dict() for u in units]
         self._session._dbs.insert_units(unit_docs)
 
         # Only after the insert can we hand the units over to the next
@@ -850,9 +1171,6 @@ class UnitManager(rpu.Component):
         self.advance(unit_docs, rps.UMGR_SCHEDULING_PENDING,
                      publish=True, push=True)
 
-        if ret_list: return units
-        else       : return units[0]
-
 
     # --------------------------------------------------------------------------
     #
@@ -933,59 +1251,29 @@ class UnitManager(rpu.Component):
                     if unit.state not in rps.FINAL:
                         uids.append(uid)
 
-        if   not state                  : states = rps.FINAL
-        elif not isinstance(state, list): states = [state]
-        else                            : states =  state
-
-        # we simplify state check by waiting for the *earliest* of the given
-        # states - if the unit happens to be in any later state, we are sure the
-        # earliest has passed as well.
-        check_state_val = rps._unit_state_values[rps.FINAL[-1]]
-        for state in states:
-            check_state_val = min(check_state_val,
-                                  rps._unit_state_values[state])
-
         ret_list = True
         if not isinstance(uids, list):
             ret_list = False
             uids = [uids]
 
-        start    = time.time()
-        to_check = None
+        start  = time.time()
+        waiter = self._add_waiter(uids, state)
 
-        with self._units_lock:
-            to_check = [self._units[uid] for uid in uids]
+        # units are handed to us by the waiter as they reach the wait criteria,
+        # so the cost of waiting does not depend on the number of units
+        self._rep.progress_tgt(len(uids), label='wait')
+        try:
+            while waiter.pending and not self._terminate.is_set():
 
-        # We don't want to iterate over all units again and again, as that would
-        # duplicate checks on units which were found in matching states.  So we
-        # create a list from which we drop the units as we find them in
-        # a matching state
-        self._rep.progress_tgt(len(to_check), label='wait')
-        while to_check and not self._terminate.is_set():
+                # check timeout
+                wait = 1.0
+                if timeout:
+                    wait = min(wait, timeout - (time.time() - start))
+                    if wait <= 0:
+                        self._log.debug ("wait timed out")
+                        break
 
-            # check timeout
-            if timeout and (timeout <= (time.time() - start)):
-                self._log.debug ("wait timed out")
-                break
-
-            time.sleep (0.1)
-
-            # FIXME: print percentage...
-          # print 'wait units: %s' % [[u.uid, u.state] for u in to_check]
-
-            check_again = list()
-            for unit in to_check:
-
-                # we actually don't check if a unit is in a specific (set of)
-                # state(s), but rather check if it ever *has been* in any of
-                # those states
-                if unit.state not in rps.FINAL and \
-                    rps._unit_state_values[unit.state] < check_state_val:
-                    # this unit does not match the wait criteria
-                    check_again.append(unit)
-
-                else:
-                    # stop watching this unit
+                for unit in waiter.get(wait):
                     if unit.state in [rps.FAILED]:
                         self._rep.progress()  # (color='error', c='-')
                     elif unit.state in [rps.CANCELED]:
@@ -993,11 +1281,11 @@ class UnitManager(rpu.Component):
                     else:
                         self._rep.progress()  # (color='ok', c='+')
 
-            to_check = check_again
+        finally:
+            self._del_waiter(waiter)
 
         self._rep.progress_done()
 
-
         # grab the current states to return
         state = None
         with self._units_lock:
@@ -1007,14 +1295,105 @@ class UnitManager(rpu.Component):
         for state in sorted(set(states)):
             self._rep.info('\t%-10s: %5d\n' % (state, sdict[state]))
 
-        if to_check: self._rep.warn('>>timeout\n')
-        else       : self._rep.ok  ('>>ok\n')
+        if waiter.pending: self._rep.warn('>>timeout\n')
+        else             : self._rep.ok  ('>>ok\n')
 
         # done waiting
         if ret_list: return states
         else       : return states[0]
 
 
+    # --------------------------------------------------------------------------
+    #
+    def as_completed(self, uids=None, state=None, timeout=None):
+        """
+        Returns an iterator which yields :class:`radical.pilot.ComputeUnits`
+        as they reach a specific state.  Units which are already in that state
+        are yielded first.  The arguments are the same as for `wait_units()`,
+        but if `uids` is `None`, *all* known ComputeUnits are considered,
+        including those which have terminated already.
+
+        The iterator stops when all units have been yielded, or when the
+        timeout is reached.
+
+        **Example**::
+
+            for unit in umgr.as_completed(umgr.submit_units(descriptions)):
+                print(unit.uid, unit.state, unit.stdout)
+        """
+
+        if not uids:
+            with self._units_lock:
+                uids = list(self._units.keys())
+
+        if not isinstance(uids, list):
+            uids = [uids]
+
+        # also accept unit instances
+        uids = [uid if isinstance(uid, str) else uid.uid for uid in uids]
+
+        start  = time.time()
+        waiter = self._add_waiter(uids, state)
+
+        try:
+            while not self._terminate.is_set():
+
+                wait = 1.0
+                if timeout:
+                    wait = min(wait, timeout - (time.time() - start))
+                    if wait <= 0:
+                        self._log.debug ("as_completed timed out")
+                        break
+
+                units = waiter.get(wait)
+                for unit in units:
+                    yield unit
+
+                if not units and not waiter.pending:
+                    break
+
+        finally:
+            self._del_waiter(waiter)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _add_waiter(self, uids, state):
+        '''
+        Create and register a waiter for the given units and state(s), and
+        feed it all units which are already in the target state(s).
+        '''
+
+        if   not state                  : states = rps.FINAL
+        elif not isinstance(state, list): states = [state]
+        else                            : states =  state
+
+        # we simplify state check by waiting for the *earliest* of the given
+        # states - if the unit happens to be in any later state, we are sure the
+        # earliest has passed as well.
+        check_state_val = rps._unit_state_values[rps.FINAL[-1]]
+        for state in states:
+            check_state_val = min(check_state_val,
+                                  rps._unit_state_values[state])
+
+        waiter = _UnitWaiter(uids, check_state_val)
+
+        with self._units_lock:
+            for uid in uids:
+                waiter.check(self._units[uid])
+            self._waiters.append(waiter)
+
+        return waiter
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _del_waiter(self, waiter):
+
+        with self._units_lock:
+            self._waiters.remove(waiter)
+
+
     # --------------------------------------------------------------------------
     #
     def cancel_units(self, uids=None):
@@ -1200,7 +1579,7 @@ class UnitManager(rpu.Component):
         if uid in self._uids:
             return False
         else:
-            self._uids.append(uid)
+            self._uids.add(uid)
             return True
 
 
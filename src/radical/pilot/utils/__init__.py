@@ -32,9 +32,12 @@ if os.uname()[0] == 'Darwin':
 # ------------------------------------------------------------------------------
 #
 from .db_utils     import *
+from .prof_bin     import *
 from .prof_utils   import *
 from .misc         import *
+from .metrics      import *
 from .session      import *
+from .staging      import *
 from .component    import *
 
 
@@ -12,6 +12,25 @@ import radical.utils   as ru
 from ..          import constants      as rpc
 from ..          import states         as rps
 
+from .metrics    import Metrics
+
+
+# ------------------------------------------------------------------------------
+#
+# In delta mode (`state_delta` config setting), unit updates which would
+# otherwise publish the complete unit dict only publish the fields below, which
+# are the ones changed by components after the unit has been inserted into the
+# DB.  The unit description and other static fields are not sent again.
+#
+_DELTA_KEYS = ['uid', 'type', 'state', 'control', 'control_ts', 'pilot',
+               'target_state', 'exit_code', 'stdout', 'stderr', 'slots',
+               'client_sandbox', 'resource_sandbox', 'pilot_sandbox',
+               'unit_sandbox', 'unit_sandbox_path']
+
+# time (in ms) to wait for further replies when draining an input which has
+# things (see `Component._drain_input()`)
+_DRAIN_WAIT = 10
+
 
 # ------------------------------------------------------------------------------
 #
@@ -360,6 +379,11 @@ class Component(object):
     multithreading implementation.
     '''
 
+    # publish only changed unit fields (see `_DELTA_KEYS`), set from the
+    # `state_delta` config setting in `__init__`
+    _delta   = False
+    _metrics = None
+
 
     # --------------------------------------------------------------------------
     #
@@ -403,12 +427,14 @@ class Component(object):
         self._ctype      = "%s.%s" % (self.__class__.__module__,
                                       self.__class__.__name__)
         self._number     = cfg.get('number', 0)
+        self._delta      = cfg.get('state_delta', False)
         self._name       = cfg.get('name.%s' %  self._number,
                                    '%s.%s'   % (self._ctype, self._number))
 
         self._bridges    = list()       # communication bridges
         self._components = list()       # sub-components
         self._inputs     = dict()       # queues to get things from
+        self._input_rr   = 0            # round-robin offset over inputs
         self._outputs    = dict()       # queues to send things to
         self._workers    = dict()       # methods to work on things
         self._publishers = dict()       # channels to send notifications to
@@ -420,6 +446,13 @@ class Component(object):
 
         self._subscribers = dict()      # ZMQ Subscriber classes
 
+        # metrics are only collected if a publication interval is configured
+        # (see `publish_metrics()`)
+        self._metrics_cfg  = cfg.get('metrics') or dict()
+        self._metrics_last = 0.0
+        if self._metrics_cfg.get('interval'):
+            self._metrics = Metrics(self._uid)
+
         if self._owner == self.uid:
             self._owner = 'root'
 
@@ -537,8 +570,9 @@ class Component(object):
     #
     def _cancel_monitor_cb(self, topic, msg):
         '''
-        We listen on the control channel for cancel requests, and append any
-        found UIDs to our cancel list.
+        We listen on the control channel for cancel requests, and add any
+        found UIDs to our cancel set.  Requests for large numbers of units are
+        registered in one set update.
         '''
 
         # FIXME: We do not check for types of things to cancel - the UIDs are
@@ -558,10 +592,10 @@ class Component(object):
             if not isinstance(uids, list):
                 uids = [uids]
 
-            self._log.debug('register for cancellation: %s', uids)
+            self._log.debug('register for cancellation: %d', len(uids))
 
             with self._cancel_lock:
-                self._cancel_list += uids
+                self._cancel_list.update(uids)
 
         if cmd == 'terminate':
             self._log.info('got termination command')
@@ -573,6 +607,40 @@ class Component(object):
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def register_cancel_set(self, uids, lock):
+        '''
+        Expire the cancel requests in the set `uids` (guarded by `lock`) after
+        `cancel_ttl` seconds (config setting, 0 disables expiry).  Uids leave
+        such sets when the thing is canceled or becomes final, but requests for
+        things which are final already, or which never pass this component,
+        would otherwise be kept for the lifetime of the session.  Sets are swept
+        once per ttl, and a sweep removes all uids which were present on the
+        previous sweep, so requests expire after one to two ttl periods.
+        '''
+
+        ttl = self._cfg.get('cancel_ttl')
+        if not ttl:
+            return
+
+        with self._cb_lock:
+            if not self._cancel_sets:
+                self.register_timed_cb(self._cancel_sweep_cb, timer=ttl)
+            self._cancel_sets.append([uids, lock, set()])
+
+
+    def _cancel_sweep_cb(self):
+
+        for uids, lock, seen in self._cancel_sets:
+            with lock:
+                uids.difference_update(seen)
+                seen.clear()
+                seen.update(uids)
+
+        return True
+
+
     # --------------------------------------------------------------------------
     #
     @property
@@ -604,10 +672,23 @@ class Component(object):
         self.register_publisher(rpc.CONTROL_PUBSUB)
 
         # set controller callback to handle cancellation requests
-        self._cancel_list = list()
+        # uids of things to cancel.  Entries are removed when the thing is
+        # canceled, or when it is dropped in a final state.
+        self._cancel_list = set()
         self._cancel_lock = ru.RLock('comp.cancel_lock.%s' % self._uid)
         self.register_subscriber(rpc.CONTROL_PUBSUB, self._cancel_monitor_cb)
 
+        # cancel requests for things which never pass this component expire
+        self._cancel_sets = list()
+        self.register_cancel_set(self._cancel_list, self._cancel_lock)
+
+        # publish metrics from a timed callback: like all callbacks, it runs
+        # under the callback lock, so it does not interfere with other threads
+        # publishing on the control pubsub
+        if self._metrics:
+            self.register_timed_cb(self.publish_metrics,
+                                   timer=self._metrics_cfg['interval'])
+
         # call component level initialize
         self.initialize()
         self._prof.prof('component_init')
@@ -692,8 +773,14 @@ class Component(object):
         if name in self._inputs:
             raise ValueError('input %s already registered' % name)
 
+        # the weight determines how many bulks are drained from the input
+        # per work_cb iteration, relative to the other inputs
+        weights = self._cfg.get('input_weights') or dict()
+
         self._inputs[name] = {'queue'  : self.get_input_ep(input),
-                              'states' : states}
+                              'states' : states,
+                              'weight' : weights.get(input, 1),
+                              'last'   : time.time()}
 
         self._log.debug('registered input %s', name)
 
@@ -1029,6 +1116,13 @@ class Component(object):
         (round-robin).  For each thing received, it will route that thing to the
         respective worker method.  Once the thing is worked upon, the next
         attempt on getting a thing is up.
+
+        Each input is drained for up to `weight` bridge replies per iteration
+        (see the `input_weights` config setting).  The bridge decides how many
+        things a reply holds, so `input_bulk` things per weight unit is a soft
+        limit: no further reply is requested once it is reached, but a reply is
+        never split.  The round-robin starts at a different input on each
+        iteration.  If no input has any things, we wait on the inputs in turn.
         '''
 
         # if no action occurs in this iteration, idle
@@ -1036,76 +1130,175 @@ class Component(object):
             time.sleep(0.1)
             return True
 
-        for name in self._inputs:
+        names = list(self._inputs.keys())
+        self._input_rr = (self._input_rr + 1) % len(names)
+        names = names[self._input_rr:] + names[:self._input_rr]
+        bulk  = self._cfg.get('input_bulk') or 1024
+        got   = 0
 
-            input  = self._inputs[name]['queue']
-            states = self._inputs[name]['states']
+        for name in names:
 
-            # FIXME: a simple, 1-thing caching mechanism would likely
-            #        remove the req/res overhead completely (for any
-            #        non-trivial worker).
-            things = input.get_nowait(500)  # in microseconds
-            things = ru.as_list(things)
+            things = self._drain_input(name, bulk)
+            if things:
+                got += len(things)
+                self._work_on(name, things)
 
-            if not things:
-                return True
+        if not got:
+            self._wait_inputs(names, bulk, timeout=100)
+
+        # keep work_cb registered
+        return True
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _drain_input(self, name, bulk, timeout=0):
+        '''
+        Get up to `weight` replies from the named input.  The bridge only
+        answers one outstanding request per endpoint, so only the first get
+        uses `timeout` (in ms, non-blocking by default): any further get has to
+        wait for the reply to the request sent by the previous one, and waits
+        for up to `_DRAIN_WAIT` ms.  That wait is the latency cost of input
+        weights larger than one, and is only paid while the input has things.
+
+        The profiler event `input_drain` reports the number of things received,
+        the drain rate (things/s since the last drain of this input), and
+        whether the input may have more things: that is the case if the last
+        reply was a full bulk (`input_bulk` things or more).
+        '''
+
+        info   = self._inputs[name]
+        input  = info['queue']
+        limit  = bulk * info['weight']
+        things = list()
+        full   = 0
+
+        for _ in range(info['weight']):
+
+            ret = input.get_nowait(timeout)  # in milliseconds
+            if not ret:
+                full = 0
+                break
+
+            ret     = ru.as_list(ret)
+            things += ret
+            full    = int(len(ret) >= bulk)
+            if len(things) >= limit:
+                break
+
+            timeout = _DRAIN_WAIT
+
+        if things:
+            now  = time.time()
+            rate = len(things) / max(now - info['last'], 1e-6)
+            info['last'] = now
+            self._prof.prof('input_drain', msg='%s %d %.1f %d'
+                                               % (name, len(things), rate, full))
+
+            if self._metrics:
+                self._metrics.inc    ('units_in', len(things), input.channel)
+                self._metrics.observe('bulk_in',  len(things), input.channel)
+
+        return things
 
-            # the worker target depends on the state of things, so we
-            # need to sort the things into buckets by state before
-            # pushing them
-            buckets = dict()
-            for thing in things:
-                state = thing.get('state')  # can be stateless
-                uid   = thing.get('uid')    # and not have uids
-                self._prof.prof('get', uid=uid, state=state)
 
-                if state not in buckets:
-                    buckets[state] = list()
-                buckets[state].append(thing)
+    # --------------------------------------------------------------------------
+    #
+    def _wait_inputs(self, names, bulk, timeout):
+        '''
+        Wait until any input has things, or until the timeout (in ms) passed,
+        and work on the things received.  The input endpoints do not expose
+        a common handle to wait on, so each input is waited on in turn, for
+        an equal share of the timeout.
+        '''
+
+        tslice = max(1, int(timeout / len(names)))
+
+        for name in names:
 
-            # We now can push bulks of things to the workers
+            things = self._drain_input(name, bulk, timeout=tslice)
+            if things:
+                self._work_on(name, things)
+                return
 
-            for state,things in buckets.items():
 
-                assert(state in states), 'cannot handle state %s' % state
-                assert(state in self._workers), 'no worker for state %s' % state
+    # --------------------------------------------------------------------------
+    #
+    def _work_on(self, name, things):
 
-                try:
-                    to_cancel = list()
+        states = self._inputs[name]['states']
 
-                    for thing in things:
+        # the worker target depends on the state of things, so we
+        # need to sort the things into buckets by state before
+        # pushing them
+        buckets = dict()
+        for thing in things:
+            state = thing.get('state')  # can be stateless
+            uid   = thing.get('uid')    # and not have uids
+            self._prof.prof('get', uid=uid, state=state)
 
-                        uid = thing.get('uid')
+            if state not in buckets:
+                buckets[state] = list()
+            buckets[state].append(thing)
 
-                        # FIXME: this can become expensive over time
-                        #        if the cancel list is never cleaned
-                        if uid and uid in self._cancel_list:
-                            with self._cancel_lock:
-                                self._cancel_list.remove(uid)
-                            to_cancel.append(thing)
+        # We now can push bulks of things to the workers
 
-                        self._log.debug('got %s (%s)', uid, state)
+        for state,things in buckets.items():
 
-                    if to_cancel:
-                        # only advance stateful entities, otherwise just drop
-                        if state:
-                            self.advance(to_cancel, rps.CANCELED, publish=True,
-                                                                  push=False)
-                    with self._work_lock:
-                        self._workers[state](things)
+            assert(state in states), 'cannot handle state %s' % state
+            assert(state in self._workers), 'no worker for state %s' % state
 
-                except Exception:
+            try:
+                to_cancel = list()
 
-                    # this is not fatal -- only the 'things' fail, not
-                    # the component
-                    self._log.exception("work %s failed", self._workers[state])
+                for thing in things:
 
+                    uid = thing.get('uid')
+
+                    if uid and uid in self._cancel_list:
+                        with self._cancel_lock:
+                            self._cancel_list.discard(uid)
+                        to_cancel.append(thing)
+
+                    self._log.debug('got %s (%s)', uid, state)
+
+                if to_cancel:
+                    # only advance stateful entities, otherwise just drop
                     if state:
-                        self.advance(things, rps.FAILED, publish=True,
-                                                         push=False)
+                        self.advance(to_cancel, rps.CANCELED, publish=True,
+                                                              push=False)
+                with self._work_lock:
+                    self._workers[state](things)
 
-        # keep work_cb registered
-        return True
+            except Exception:
+
+                # this is not fatal -- only the 'things' fail, not
+                # the component
+                self._log.exception("work %s failed", self._workers[state])
+
+                if state:
+                    self.advance(things, rps.FAILED, publish=True,
+                                                     push=False)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _prof_ingest(self, things):
+        '''
+        Profile the latency between handing things over via the DB (`control`
+        set to `*_pending`, timestamped in `control_ts`) and ingesting them
+        here.  Components on different hosts are subject to clock skew.
+        '''
+
+        now  = time.time()
+        lats = [now - thing['control_ts'] for thing in things
+                                          if  thing.get('control_ts')]
+        if not lats:
+            return
+
+        self._prof.prof('ingest', uid=self._uid,
+                        msg='bulk: %d latency: %.3f / %.3f'
+                            % (len(lats), sum(lats) / len(lats), max(lats)))
 
 
     # --------------------------------------------------------------------------
@@ -1129,7 +1322,11 @@ class Component(object):
         optionally 'type' set.
 
         If 'thing' contains an '$all' key, the complete dict is published;
-        otherwise, *only the state* is published.
+        otherwise, *only the state* is published.  If `state_delta` is enabled
+        in the component config, units are never published in full: instead of
+        the complete dict, only the mutable fields in `_DELTA_KEYS` are sent.
+        The exception is the handover to the agent (`control` set to
+        `agent_pending`), as the agent pulls the complete unit from the DB.
 
         This is evaluated in self.publish.
         '''
@@ -1173,15 +1370,24 @@ class Component(object):
 
             # If '$all' is set, we update the complete thing_dict.
             # Things in final state are also published in full.
+            # In delta mode, 'full' is limited to the `_DELTA_KEYS` for units.
             # If '$set' is set, we also publish all keys listed in there.
             # In all other cases, we only send 'uid', 'type' and 'state'.
             for thing in things:
-                if '$all' in thing:
-                    del(thing['$all'])
-                    to_publish.append(thing)
+                if '$all' in thing or thing['state'] in rps.FINAL:
+                    if '$all' in thing:
+                        del(thing['$all'])
+
+                    if self._delta and thing['type'] == 'unit' \
+                                   and thing.get('control') != 'agent_pending':
+                        tmp = {key: thing[key] for key in _DELTA_KEYS
+                                               if  key in thing}
+                        for key in thing.get('$set', []):
+                            tmp[key] = thing[key]
+                        to_publish.append(tmp)
 
-                elif thing['state'] in rps.FINAL:
-                    to_publish.append(thing)
+                    else:
+                        to_publish.append(thing)
 
                 else:
                     tmp = {'uid'   : thing['uid'],
@@ -1213,7 +1419,13 @@ class Component(object):
 
               # ts = time.time()
                 if _state in rps.FINAL:
-                    # things in final state are dropped
+                    # things in final state are dropped, and any cancel request
+                    # for them has expired
+                    if self._metrics:
+                        self._metrics.inc('units_final', len(_things), _state)
+                    with self._cancel_lock:
+                        self._cancel_list.difference_update(
+                                          [thing['uid'] for thing in _things])
                     for thing in _things:
                         self._log.debug('final %s [%s]', thing['uid'], _state)
                         self._prof.prof('drop', uid=thing['uid'], state=_state,
@@ -1242,6 +1454,12 @@ class Component(object):
                 self._log.debug('put bulk %s: %s', _state, len(_things))
                 output.put(_things)
 
+                if self._metrics:
+                    self._metrics.inc    ('units_out', len(_things),
+                                          output.channel)
+                    self._metrics.observe('bulk_out',  len(_things),
+                                          output.channel)
+
                 ts = time.time()
                 for thing in _things:
                     self._prof.prof('put', uid=thing['uid'], state=_state,
@@ -1269,6 +1487,38 @@ class Component(object):
         self._publishers[pubsub].put(pubsub, msg)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def publish_metrics(self):
+        '''
+        Publish a snapshot of the component metrics on the control pubsub, if
+        the configured interval passed since the last publication.  This is
+        registered as timed callback in `_initialize()`, and always returns
+        `True` to stay registered.
+        '''
+
+        if not self._metrics:
+            return True
+
+        if rpc.CONTROL_PUBSUB not in self._publishers:
+            # not initialized, yet
+            return True
+
+        now = time.time()
+        if now - self._metrics_last < self._metrics_cfg['interval']:
+            return True
+
+        self._metrics_last = now
+        self.update_metrics()
+        self.publish(rpc.CONTROL_PUBSUB, {'cmd': 'metrics',
+                                          'arg': self._metrics.snapshot()})
+        return True
+
+
+    def update_metrics(self):
+        pass  # can be overloaded to set gauges before publication
+
+
 # ------------------------------------------------------------------------------
 #
 class Worker(Component):
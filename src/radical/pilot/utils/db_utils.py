@@ -1,15 +1,29 @@
 
 import os
 import sys
+import json
 import time
 import datetime
 
+import concurrent.futures as cf
+
 import radical.utils as ru
 
-from ..states import AGENT_EXECUTING
+from ..states import AGENT_EXECUTING, FINAL
 
 
 _CACHE_BASEDIR = '/tmp/rp_cache_%d/' % os.getuid ()
+_CACHE_VERSION = 1
+
+# types of session docs, and the types of which docs do not change anymore
+# once they reach a final state
+_DOC_TYPES     = ['session', 'pmgr', 'pilot', 'umgr', 'unit']
+_STATEFUL      = ['pilot', 'unit']
+
+# number of docs fetched per query on cache refresh, and number of concurrent
+# queries
+_FETCH_BULK    = 1024
+_FETCH_WORKERS = 4
 
 
 # ------------------------------------------------------------------------------
@@ -53,67 +67,246 @@ def get_last_session(db):
 
 
 # ------------------------------------------------------------------------------
-def get_session_docs(db, sid, cache=None, cachedir=None):
-
-    # session docs may have been cached in /tmp/rp_cache_<uid>/<sid>.json -- in
-    # that case we pull it from there instead of the database, which will be
-    # much quicker.  Also, we do cache any retrieved docs to that place, for
-    # later use.  An optional cachdir parameter changes that default location
-    # for lookup and storage.
-    if  not cachedir:
+#
+def get_session_docs(db, sid, cache=None, cachedir=None, fields=None):
+    '''
+    Return the documents of session `sid`, as dict of doc lists per doc type
+    (`session` is a single doc).  Each pilot doc gets a list of the `unit_ids`
+    of the units assigned to that pilot.
+
+    Docs are cached in `<cachedir>/<sid>/` (`cachedir` defaults to
+    `/tmp/rp_cache_<uid>/`), with one shard per doc type holding one compact
+    json doc per line, and an index with the state of all pilots and units.
+    Once all pilots and units are final, the cache is used w/o contacting the
+    DB.  For sessions which are still running, the cache is refreshed
+    incrementally: only docs which are new or not yet final are fetched, and
+    the DB queries are executed concurrently.
+
+    `fields` limits the returned docs to the given fields per doc type, like
+    `{'unit': ['uid', 'state']}` -- `uid` (and `pilot` for units) are always
+    included.  The cache always holds the complete docs.  `cache` can name
+    a single json file as written by earlier versions, which is used instead
+    of the cache if it exists.
+    '''
+
+    if not fields:
+        fields = dict()
+
+    if cache and os.path.isfile(cache):
+        try:
+            json_data = ru.read_json(cache)
+            docs      = {dtype: json_data[dtype] for dtype in _DOC_TYPES}
+            docs['session'] = [docs['session']]
+            return _get_docs(docs, fields)
+
+        except Exception as e:
+            # continue w/o cache
+            sys.stderr.write("cannot read session cache at %s (%s)\n"
+                             % (cache, e))
+
+    if not cachedir:
         cachedir = _CACHE_BASEDIR
 
-    if  not cache:
-        cache = "%s/%s.json" % (cachedir, sid)
+    path  = '%s/%s' % (cachedir, sid)
+    index = _read_cache_index(path)
+    docs  = dict()
 
     try:
-        if  os.path.isfile (cache):
-          # print 'using cache: %s' % cache
-            return ru.read_json (cache)
+        if not index or not index['final']:
+            index, docs = _sync_cache(db, sid, path, index)
+
+        for dtype in _DOC_TYPES:
+            if dtype not in docs:
+                docs[dtype] = _read_cache_shard(path, dtype, fields.get(dtype))
+
     except Exception as e:
-        # continue w/o cache
-        sys.stderr.write("cannot read session cache at %s (%s)\n" % (cache, e))
+        if not index:
+            raise
 
+        # go to the DB for all docs
+        sys.stderr.write("cannot read session cache at %s (%s)\n" % (path, e))
+        _, docs = _sync_cache(db, sid, path, None)
 
-    # cache not used or not found -- go to db
-    json_data = dict()
+    return _get_docs(docs, fields)
 
-    # convert bson to json, i.e. serialize the ObjectIDs into strings.
-    json_data['session'] = bson2json(list(db[sid].find({'type': 'session'})))
-    json_data['pmgr'   ] = bson2json(list(db[sid].find({'type': 'pmgr'   })))
-    json_data['pilot'  ] = bson2json(list(db[sid].find({'type': 'pilot'  })))
-    json_data['umgr'   ] = bson2json(list(db[sid].find({'type': 'umgr'   })))
-    json_data['unit'   ] = bson2json(list(db[sid].find({'type': 'unit'   })))
 
-    if  len(json_data['session']) == 0:
-        raise ValueError ('no session %s in db' % sid)
+# ------------------------------------------------------------------------------
+#
+def _get_docs(docs, fields):
 
-  # if  len(json_data['session']) > 1:
-  #     print 'more than one session document -- picking first one'
+    json_data = dict()
+    for dtype in _DOC_TYPES:
+        keep = fields.get(dtype)
+        if keep is None:
+            json_data[dtype] = docs[dtype]
+        else:
+            keep = _get_keep(dtype, keep)
+            json_data[dtype] = [{k: doc[k] for k in keep if k in doc}
+                                for doc in docs[dtype]]
 
     # there can only be one session, not a list of one
     json_data['session'] = json_data['session'][0]
 
-    # we want to add a list of handled units to each pilot doc
+    # add the list of handled units to each pilot doc, in one pass over units
+    unit_ids = dict()
+    for unit in json_data['unit']:
+        unit_ids.setdefault(unit.get('pilot'), list()).append(unit['uid'])
+
     for pilot in json_data['pilot']:
+        pilot['unit_ids'] = unit_ids.get(pilot['uid'], list())
+
+    return json_data
+
+
+def _get_keep(dtype, keep):
+
+    keep = set(keep) | {'uid'}
+    if dtype == 'unit':
+        keep.add('pilot')
+
+    return keep
+
+
+# ------------------------------------------------------------------------------
+#
+def _read_cache_index(path):
+
+    try:
+        with open('%s/index.json' % path) as fin:
+            index = json.load(fin)
+
+        if index.get('version') == _CACHE_VERSION:
+            return index
+
+    except Exception:
+        # no (usable) cache
+        pass
+
+    return None
+
+
+# ------------------------------------------------------------------------------
+#
+def _read_cache_shard(path, dtype, keep=None):
+
+    if keep is not None:
+        keep = _get_keep(dtype, keep)
+
+    ret = list()
+    with open('%s/%s.json' % (path, dtype)) as fin:
+        for line in fin:
+            doc = json.loads(line)
+            if keep is not None:
+                doc = {k: doc[k] for k in keep if k in doc}
+            ret.append(doc)
+
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+def _write_cache_shard(path, dtype, docs):
+
+    fname = '%s/%s.json' % (path, dtype)
+    tmp   = '%s.%d.tmp' % (fname, os.getpid())
+
+    with open(tmp, 'w') as fout:
+        for doc in docs:
+            fout.write(json.dumps(doc, separators=(',', ':')))
+            fout.write('\n')
+
+    os.rename(tmp, fname)
 
-        pilot['unit_ids'] = list()
 
-        for unit in json_data['unit']:
+# ------------------------------------------------------------------------------
+#
+def _sync_cache(db, sid, path, index):
+
+    # Fetch docs from the DB and update the cache.  W/o cache index, all docs
+    # are fetched.  Otherwise, the docs of pilots and units are only fetched if
+    # they are not cached yet, or if their cached state is not final: final
+    # docs do not change anymore.  The docs of all other types are fetched
+    # again.  Returns the new index and the complete docs of all types.
 
-            if  unit['pilot'] == pilot['uid']:
-                pilot['unit_ids'].append (unit['uid'])
+    coll = db[sid]
+    jobs = dict()
+
+    for dtype in _DOC_TYPES:
+        if index and dtype in _STATEFUL:
+            continue
+        jobs[(dtype, 0)] = [{'type': dtype}, None]
+
+    if index:
+        for dtype in _STATEFUL:
+
+            cached = index['states'][dtype]
+            fetch  = [doc['uid']
+                      for doc in coll.find({'type': dtype}, ['uid', 'state'])
+                      if  cached.get(doc['uid']) not in FINAL]
+
+            for n in range(0, len(fetch), _FETCH_BULK):
+                chunk = fetch[n:n + _FETCH_BULK]
+                jobs[(dtype, n)] = [{'type': dtype, 'uid': {'$in': chunk}}, None]
+
+    def _fetch(query):
+        # convert bson to json, i.e. serialize the ObjectIDs into strings.
+        return bson2json(list(coll.find(query)))
+
+    with cf.ThreadPoolExecutor(max_workers=_FETCH_WORKERS) as pool:
+        for job in jobs.values():
+            job[1] = pool.submit(_fetch, job[0])
+
+    fetched = dict()
+    for (dtype, _), (_, future) in sorted(jobs.items()):
+        fetched.setdefault(dtype, list()).extend(future.result())
+
+    if not fetched['session']:
+        raise ValueError('no session %s in db' % sid)
+
+    docs = dict()
+    for dtype in _DOC_TYPES:
+
+        if dtype in _STATEFUL and index:
+            # merge updated docs into the cached ones
+            if not fetched.get(dtype):
+                continue
+            merged = {doc['uid']: doc for doc in _read_cache_shard(path, dtype)}
+            merged.update({doc['uid']: doc for doc in fetched[dtype]})
+            docs[dtype] = list(merged.values())
+        else:
+            docs[dtype] = fetched[dtype]
+
+    states = {dtype: dict() for dtype in _STATEFUL}
+    if index:
+        states = index['states']
+    for dtype in _STATEFUL:
+        for doc in fetched.get(dtype, list()):
+            states[dtype][doc['uid']] = doc.get('state')
+
+    index = {'version': _CACHE_VERSION,
+             'final'  : bool(states['pilot']) and
+                        all(state in FINAL for dtype in _STATEFUL
+                                           for state in states[dtype].values()),
+             'states' : states}
 
-    # if we got here, we did not find a cached version -- thus add this dataset
-    # to the cache
     try:
-        os.system ('mkdir -p %s' % cachedir)
-        ru.write_json (json_data, "%s/%s.json" % (cachedir, sid))
+        os.makedirs(path, exist_ok=True)
+
+        for dtype in docs:
+            _write_cache_shard(path, dtype, docs[dtype])
+
+        # the index is written last, so that it never refers to docs which are
+        # not in the shards
+        tmp = '%s/index.json.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as fout:
+            json.dump(index, fout)
+        os.rename(tmp, '%s/index.json' % path)
+
     except Exception:
         # we can live without cache, no problem...
         pass
 
-    return json_data
+    return index, docs
 
 
 # ------------------------------------------------------------------------------
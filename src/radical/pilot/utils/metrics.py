@@ -0,0 +1,356 @@
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import copy
+import json
+import time
+import bisect
+import threading   as mt
+import socketserver
+import http.server
+
+import radical.utils as ru
+
+
+# ------------------------------------------------------------------------------
+#
+# Components collect metrics about the things they handle: counters (things
+# received from and pushed to queues, things spawned, ...), gauges (wait pool
+# size) and histograms (bulk sizes, scheduling latency).  A label (the queue or
+# state a value refers to) distinguishes values of the same metric.  Components
+# publish snapshots of their metrics on the control pubsub (see
+# `Component.publish_metrics()`), and agent.0 collects and serves those
+# snapshots via HTTP (see `MetricsServer`).
+#
+SIZE_BUCKETS    = [1, 4, 16, 64, 256, 1024, 4096]
+LATENCY_BUCKETS = [0.001, 0.01, 0.1, 1.0, 10.0, 100.0, 1000.0]
+
+
+# ------------------------------------------------------------------------------
+#
+class Metrics(object):
+    '''
+    A thread safe set of counters, gauges and histograms, which are identified
+    by name and (optional) label.  Histogram buckets are defined by their upper
+    bounds, values larger than the last bound are counted in an extra bucket.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, uid):
+
+        self.uid       = uid
+        self._lock     = mt.Lock()
+        self._counters = dict()    # name: {label: value}
+        self._gauges   = dict()    # name: {label: value}
+        self._hists    = dict()    # name: {label: histogram}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def inc(self, name, val=1, label=''):
+
+        with self._lock:
+            vals        = self._counters.setdefault(name, dict())
+            vals[label] = vals.get(label, 0) + val
+
+
+    # --------------------------------------------------------------------------
+    #
+    def set(self, name, val, label=''):
+
+        with self._lock:
+            self._gauges.setdefault(name, dict())[label] = val
+
+
+    # --------------------------------------------------------------------------
+    #
+    def observe(self, name, vals, label='', buckets=None):
+        '''
+        Add a value (or a list of values) to a histogram.  The buckets of
+        a histogram are fixed on its first observation (default:
+        `SIZE_BUCKETS`).
+        '''
+
+        vals = ru.as_list(vals)
+
+        with self._lock:
+
+            hists = self._hists.setdefault(name, dict())
+            hist  = hists.get(label)
+
+            if hist is None:
+                bounds = list(buckets or SIZE_BUCKETS)
+                hist   = {'buckets': bounds,
+                          'counts' : [0] * (len(bounds) + 1),
+                          'count'  : 0,
+                          'sum'    : 0.0}
+                hists[label] = hist
+
+            for val in vals:
+                hist['counts'][bisect.bisect_left(hist['buckets'], val)] += 1
+                hist['sum'] += val
+
+            hist['count'] += len(vals)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def snapshot(self):
+        '''
+        Return a copy of all metrics, as dict which can be serialized to json.
+        '''
+
+        with self._lock:
+            return {'uid'     : self.uid,
+                    'ts'      : time.time(),
+                    'counters': copy.deepcopy(self._counters),
+                    'gauges'  : copy.deepcopy(self._gauges),
+                    'hists'   : copy.deepcopy(self._hists)}
+
+
+# ------------------------------------------------------------------------------
+#
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        srv = self.server.metrics
+
+        if self.path == '/metrics':
+            body  = srv.get_text().encode('utf-8')
+            ctype = 'text/plain; version=0.0.4'
+
+        elif self.path == '/metrics.json':
+            body  = json.dumps(srv.get_metrics()).encode('utf-8')
+            ctype = 'application/json'
+
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type',   ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, *args):
+        # requests are not logged (and unix sockets have no client address)
+        pass
+
+
+class _TCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# ------------------------------------------------------------------------------
+#
+class MetricsServer(object):
+    '''
+    Collect the metrics snapshots published by components, and serve them via
+    HTTP on `endpoint`, which is either `tcp://<host>:<port>` or the path of
+    a unix socket:
+
+        curl --unix-socket metrics.sock http://localhost/metrics
+        curl --unix-socket metrics.sock http://localhost/metrics.json
+
+    `/metrics` returns the Prometheus text format, `/metrics.json` returns the
+    snapshot of each component with the age of the snapshot and the rate of
+    each counter (per second, over the last two snapshots).  Both include the
+    depth of each queue, i.e., the number of things pushed to that queue minus
+    the number of things pulled from it, over all components.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, endpoint, log):
+
+        self._endpoint = endpoint
+        self._log      = log
+        self._lock     = mt.Lock()
+        self._snaps    = dict()    # uid: [last snapshot, previous snapshot]
+        self._server   = None
+        self._thread   = None
+        self.addr      = None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def start(self):
+
+        if self._endpoint.startswith('tcp://'):
+            host, port   = self._endpoint[6:].rsplit(':', 1)
+            self._server = _TCPServer((host, int(port)), _Handler)
+            self.addr    = 'tcp://%s:%d' % self._server.server_address[:2]
+
+        else:
+            # remove stale sockets from earlier runs
+            if os.path.exists(self._endpoint):
+                os.unlink(self._endpoint)
+            self._server = _UnixServer(self._endpoint, _Handler)
+            self.addr    = os.path.abspath(self._endpoint)
+
+        self._server.metrics = self
+        self._thread = mt.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        self._log.info('serving metrics on %s', self.addr)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stop(self):
+
+        if not self._server:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+        if not self.addr.startswith('tcp://'):
+            try:
+                os.unlink(self.addr)
+            except OSError:
+                pass
+
+        self._server = None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def collect_cb(self, topic, msg):
+        '''
+        Subscriber callback for the control pubsub.
+        '''
+
+        if msg['cmd'] == 'metrics':
+            self.collect(msg['arg'])
+
+        return True
+
+
+    def collect(self, snap):
+
+        with self._lock:
+            last = self._snaps.get(snap['uid'])
+            self._snaps[snap['uid']] = [snap, last[0] if last else None]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get_metrics(self):
+        '''
+        Return the collected metrics as dict with the keys `ts`, `components`
+        (per component uid: `age`, `counters`, `gauges`, `hists` and `rates`)
+        and `queues` (per queue name: depth).
+        '''
+
+        now = time.time()
+
+        with self._lock:
+            snaps = dict(self._snaps)
+
+        comps  = dict()
+        queues = dict()
+
+        for uid, (snap, prev) in sorted(snaps.items()):
+
+            rates = dict()
+            if prev and snap['ts'] > prev['ts']:
+                ttc = snap['ts'] - prev['ts']
+                for name, vals in snap['counters'].items():
+                    pvals = prev['counters'].get(name, dict())
+                    rates[name] = {label: (val - pvals.get(label, 0)) / ttc
+                                   for label, val in vals.items()}
+
+            comps[uid] = {'age'     : now - snap['ts'],
+                          'counters': snap['counters'],
+                          'gauges'  : snap['gauges'],
+                          'hists'   : snap['hists'],
+                          'rates'   : rates}
+
+            counters = snap['counters']
+            for queue, n in counters.get('units_out', dict()).items():
+                queues[queue] = queues.get(queue, 0) + n
+            for queue, n in counters.get('units_in', dict()).items():
+                queues[queue] = queues.get(queue, 0) - n
+
+        return {'ts'        : now,
+                'components': comps,
+                'queues'    : queues}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get_text(self):
+        '''
+        Return the collected metrics in the Prometheus text format.  Metric
+        names are prefixed with `rp_`, and the component uid and value label
+        are passed as `component` and `label` labels.
+        '''
+
+        metrics = self.get_metrics()
+        series  = dict()    # name: [type, [lines]]
+
+        def _add(name, mtype, line):
+            series.setdefault(name, [mtype, list()])[1].append(line)
+
+        for uid, comp in metrics['components'].items():
+
+            for kind, mtype, suffix in [['counters', 'counter', '_total'],
+                                        ['gauges',   'gauge',   '']]:
+                for name, vals in comp[kind].items():
+                    for label, val in vals.items():
+                        _add('rp_%s%s' % (name, suffix), mtype,
+                             '%s %s' % (_labels(uid, label), val))
+
+            for name, hists in comp['hists'].items():
+                name = 'rp_%s' % name
+                for label, hist in hists.items():
+                    n = 0
+                    for bound, count in zip(hist['buckets'] + ['+Inf'],
+                                            hist['counts']):
+                        n += count
+                        _add(name, 'histogram', '_bucket%s %d'
+                             % (_labels(uid, label, le=bound), n))
+                    _add(name, 'histogram', '_sum%s %s'
+                         % (_labels(uid, label), hist['sum']))
+                    _add(name, 'histogram', '_count%s %d'
+                         % (_labels(uid, label), hist['count']))
+
+        for queue, depth in sorted(metrics['queues'].items()):
+            _add('rp_queue_depth', 'gauge', '{queue="%s"} %d' % (queue, depth))
+
+        ret = list()
+        for name, (mtype, lines) in sorted(series.items()):
+            ret.append('# TYPE %s %s' % (name, mtype))
+            ret += ['%s%s' % (name, line) for line in lines]
+
+        return '\n'.join(ret) + '\n'
+
+
+# ------------------------------------------------------------------------------
+#
+def _labels(uid, label, le=None):
+
+    ret = 'component="%s"' % uid
+    if label:
+        ret += ',label="%s"' % label
+    if le is not None:
+        ret += ',le="%s"' % le
+
+    return '{%s}' % ret
+
+
+# ------------------------------------------------------------------------------
+
@@ -1,6 +1,7 @@
 
 import os
 import time
+import codecs
 import errno
 
 import radical.utils as ru
@@ -26,6 +27,49 @@ def tail(txt, maxlen=MAX_IO_LOGLENGTH):
         return txt
 
 
+# ------------------------------------------------------------------------------
+#
+def tail_file(fname, maxlen=MAX_IO_LOGLENGTH, headlen=0):
+    '''
+    Return the last `maxlen` bytes of the given file as string, prepended by
+    the first `headlen` bytes if those are requested.  As in `tail()`,
+    a notification is inserted where content is left out.  Only the returned
+    bytes are read, so the cost does not depend on the size of the file.
+
+    Returns `None` if the content cannot be decoded as UTF-8.
+    '''
+
+    with open(fname, 'rb') as fin:
+
+        size = os.fstat(fin.fileno()).st_size
+
+        if size <= headlen + maxlen:
+            data = fin.read(headlen + maxlen)
+            try:
+                return data.decode('utf-8')
+            except UnicodeDecodeError:
+                return None
+
+        head = fin.read(headlen) if headlen else b''
+        fin.seek(size - maxlen)
+        tail = fin.read(maxlen)
+
+    # the cuts may have split multibyte characters: drop the incomplete
+    # characters at the end of the head and at the begin of the tail
+    n = 0
+    while n < 3 and n < len(tail) and 0x80 <= tail[n] < 0xC0:
+        n += 1
+
+    try:
+        head = codecs.getincrementaldecoder('utf-8')().decode(head)
+        tail = tail[n:].decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+    if head: return "%s\n[... CONTENT SHORTENED ...]\n%s" % (head, tail)
+    else   : return "[... CONTENT SHORTENED ...]\n%s" % tail
+
+
 # ------------------------------------------------------------------------------
 #
 def get_rusage():
@@ -97,5 +141,26 @@ def create_tar(tgt, dnames):
     fout.close()
 
 
-# ----------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+#
+def generate_ids(template, n, ns):
+    '''
+    Return `n` ids for an `ru.ID_CUSTOM` template, like `n` calls to
+    `ru.generate_id(template, ru.ID_CUSTOM, ns=ns)` would do.  Those calls
+    lock, read and write the counter file in the namespace once per id.  If
+    radical.utils provides a bulk call (`ru.generate_ids()`), it is used to
+    reserve the whole block of counter values at once, otherwise the ids are
+    generated one by one.
+    '''
+
+    if n <= 0:
+        return list()
+
+    bulk = getattr(ru, 'generate_ids', None)
+    if bulk:
+        return bulk(template, n, mode=ru.ID_CUSTOM, ns=ns)
 
+    return [ru.generate_id(template, ru.ID_CUSTOM, ns=ns) for _ in range(n)]
+
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,396 @@
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+
+import radical.utils as ru
+
+
+# ------------------------------------------------------------------------------
+#
+# Binary profiles store a (combined) session profile in columns: timestamps as
+# float64, and all other profile fields as ids into a table of interned
+# strings.  Ids are stored as uint8, uint16 or uint32, depending on the largest
+# id in the respective column, and the largest value of that type represents
+# `None`.  Two indexes map uids and event names to the rows they occur in, so
+# that single entity timelines can be read without touching the other rows.
+# The file layout is (all sections 8-byte aligned, native byte order):
+#
+#   header     : magic, byte order, column types, #rows, #strings, #uids,
+#                #events, size of string data, size of metadata
+#   times      : float64[#rows]
+#   columns    : ids[#rows] for event, comp, tid, uid, state, msg, entity
+#   strings    : uint64[#strings + 1] offsets, utf-8 string data
+#   uid index  : uint32[#uids] string ids (sorted by string),
+#                uint32[#uids + 1] offsets into rows, uint32[#rows] rows
+#   event index: same as uid index
+#   metadata   : json (sid, time sync accuracy, hostmap)
+#
+_MAGIC   = b'RPBPROF1'
+_HEADER  = struct.Struct('=8s8s8sIIIIQQ')
+_COLUMNS = [ru.EVENT, ru.COMP, ru.TID, ru.UID, ru.STATE, ru.MSG, ru.ENTITY]
+_TYPES   = {'B': 0xff, 'H': 0xffff, 'I': 0xffffffff}
+_NONE    = _TYPES['I']
+
+
+# ------------------------------------------------------------------------------
+#
+def _align(n):
+
+    return (n + 7) & ~7
+
+
+def _pad(fout):
+
+    fout.write(b'\0' * (_align(fout.tell()) - fout.tell()))
+
+
+# ------------------------------------------------------------------------------
+#
+def write_binary_profile(fname, profile, sid=None, accuracy=0.0, hostmap=None):
+    '''
+    Write the given profile (a list of profile rows as returned by
+    `get_session_profile()`) to `fname` in the binary profile format.  All
+    fields but the timestamp are stored as strings (or `None`).  The file is
+    written to a temporary name first and then renamed, so that readers never
+    see partial files.
+    '''
+
+    n_rows = len(profile)
+    times  = array.array('d', [0.0]) * n_rows
+    cols   = [array.array('I', [0]) * n_rows for _ in _COLUMNS]
+    ids    = dict()
+    strs   = list()
+
+    for r, row in enumerate(profile):
+
+        times[r] = row[ru.TIME]
+
+        for c, col in enumerate(_COLUMNS):
+
+            val = row[col]
+            if val is None:
+                cols[c][r] = _NONE
+                continue
+
+            key = ids.get(val)
+            if key is None:
+                key      = len(strs)
+                ids[val] = key
+                strs.append(str(val))
+            cols[c][r] = key
+
+    data    = [s.encode('utf-8') for s in strs]
+    offsets = array.array('Q', [0]) * (len(data) + 1)
+    for i, d in enumerate(data):
+        offsets[i + 1] = offsets[i] + len(d)
+
+    indexes = [_create_index(cols[_COLUMNS.index(col)], strs)
+               for col in [ru.UID, ru.EVENT]]
+    cols    = [_shrink(col) for col in cols]
+    types   = ''.join(col.typecode for col in cols).encode()
+
+    meta = json.dumps({'sid'     : sid,
+                       'accuracy': accuracy,
+                       'hostmap' : hostmap or dict()}).encode('utf-8')
+
+    tmp = '%s.%d.tmp' % (fname, os.getpid())
+    with open(tmp, 'wb') as fout:
+
+        fout.write(_HEADER.pack(_MAGIC, sys.byteorder.encode(), types, n_rows,
+                                len(strs), len(indexes[0][0]),
+                                len(indexes[1][0]), offsets[-1], len(meta)))
+        _pad(fout)
+
+        for arr in [times] + cols:
+            arr.tofile(fout)
+            _pad(fout)
+
+        offsets.tofile(fout)
+        for d in data:
+            fout.write(d)
+        _pad(fout)
+
+        for index in indexes:
+            for arr in index:
+                arr.tofile(fout)
+                _pad(fout)
+
+        fout.write(meta)
+
+    os.rename(tmp, fname)
+
+
+# ------------------------------------------------------------------------------
+#
+def _shrink(col):
+
+    # use the smallest type which can hold all ids of the column and `None`
+    ids = [key for key in col if key != _NONE]
+    top = max(ids) if ids else 0
+
+    for code, none in sorted(_TYPES.items(), key=lambda x: x[1]):
+        if top < none:
+            break
+
+    if code == 'I':
+        return col
+
+    return array.array(code, [none if key == _NONE else key for key in col])
+
+
+# ------------------------------------------------------------------------------
+#
+def _create_index(col, strs):
+
+    rows = dict()
+    for r, key in enumerate(col):
+        if key != _NONE:
+            rows.setdefault(key, list()).append(r)
+
+    keys   = array.array('I', sorted(rows, key=lambda k: strs[k]))
+    starts = array.array('I', [0]) * (len(keys) + 1)
+    order  = array.array('I')
+
+    for i, key in enumerate(keys):
+        order.extend(rows[key])
+        starts[i + 1] = len(order)
+
+    return keys, starts, order
+
+
+# ------------------------------------------------------------------------------
+#
+class BinaryProfile(object):
+    '''
+    Read access to a binary profile.  The file is memory mapped, and rows are
+    only decoded when requested, so that the timeline of a single uid or event
+    can be read without loading the whole profile:
+
+        with BinaryProfile(fname) as prof:
+            for row in prof.rows(uid='unit.000000'):
+                print(row[ru.TIME], row[ru.EVENT])
+
+    Rows are returned as lists in the layout of `radical.utils` profiles.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, fname):
+
+        self._fname = fname
+        self._fin   = open(fname, 'rb')
+
+        try:
+            self._mmap = mmap.mmap(self._fin.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except:
+            self._fin.close()
+            raise
+
+        self._base  = memoryview(self._mmap)
+        self._views = [self._base]
+
+        try:
+            self._load()
+        except:
+            self.close()
+            raise
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _load(self):
+
+        magic, order, types, n_rows, n_strs, n_uids, n_events, n_data, \
+                n_meta = _HEADER.unpack_from(self._mmap, 0)
+
+        if magic != _MAGIC:
+            raise ValueError('%s is not a binary profile' % self._fname)
+
+        if order.rstrip(b'\0').decode() != sys.byteorder:
+            raise ValueError('%s: byte order mismatch' % self._fname)
+
+        self._len = n_rows
+        self._off = _align(_HEADER.size)
+
+        self._times = self._view('d', n_rows)
+        self._cols  = dict()
+        self._nones = dict()
+        for col, code in zip(_COLUMNS, types.decode()):
+            self._cols [col] = self._view(code, n_rows)
+            self._nones[col] = _TYPES[code]
+
+        self._offsets = self._view('Q', n_strs + 1)
+        self._data    = self._off
+        self._off     = _align(self._off + n_data)
+        self._strs    = [None] * n_strs
+
+        self._index = dict()
+        for col, n in [[ru.UID, n_uids], [ru.EVENT, n_events]]:
+            self._index[col] = [self._view('I', n),
+                                self._view('I', n + 1),
+                                self._view('I', n_rows)]
+
+        meta = json.loads(self._mmap[self._off:self._off + n_meta].decode())
+
+        self.sid      = meta['sid']
+        self.accuracy = meta['accuracy']
+        self.hostmap  = meta['hostmap']
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _view(self, fmt, n):
+
+        size = n * struct.calcsize(fmt)
+        view = self._base[self._off:self._off + size].cast(fmt)
+
+        self._views.append(view)
+        self._off = _align(self._off + size)
+
+        return view
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        # views need to be released before the mmap can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._views = list()
+
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+
+        self._fin.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __len__(self):
+        return self._len
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _str(self, key):
+
+        # decode strings once, so that rows share string objects
+        ret = self._strs[key]
+        if ret is None:
+            start = self._data + self._offsets[key]
+            stop  = self._data + self._offsets[key + 1]
+            ret   = self._mmap[start:stop].decode('utf-8')
+            self._strs[key] = ret
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def row(self, idx):
+        '''
+        Return the profile row with the given index.
+        '''
+
+        ret = [None] * ru.PROF_KEY_MAX
+
+        ret[ru.TIME] = self._times[idx]
+        for col in _COLUMNS:
+            key = self._cols[col][idx]
+            if key != self._nones[col]:
+                ret[col] = self._str(key)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _find(self, col, val):
+
+        # binary search of `val` in the index keys (sorted by string), return
+        # the row indexes of that value
+        keys, starts, order = self._index[col]
+
+        lo = 0
+        hi = len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._str(keys[mid]) < val: lo = mid + 1
+            else                         : hi = mid
+
+        if lo == len(keys) or self._str(keys[lo]) != val:
+            return list()
+
+        return order[starts[lo]:starts[lo + 1]].tolist()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def rows(self, uid=None, event=None):
+        '''
+        Return all profile rows, in profile order.  If `uid` and / or `event`
+        are given, only rows for that uid and / or event name are returned.
+        '''
+
+        if uid is None and event is None:
+
+            # decode column by column
+            cols = [self._times.tolist()]
+            for col in _COLUMNS:
+                none = self._nones[col]
+                strs = {key: self._str(key) for key in set(self._cols[col])
+                                            if  key != none}
+                strs[none] = None
+                cols.append(list(map(strs.__getitem__, self._cols[col])))
+
+            return list(map(list, zip(*cols)))
+
+        if uid is not None and event is not None:
+            events = set(self._find(ru.EVENT, event))
+            idxs   = [idx for idx in self._find(ru.UID, uid) if idx in events]
+        elif uid is not None:
+            idxs   = self._find(ru.UID, uid)
+        else:
+            idxs   = self._find(ru.EVENT, event)
+
+        return [self.row(idx) for idx in idxs]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def uids(self):
+        '''
+        Return the sorted list of uids in the profile.
+        '''
+
+        return [self._str(key) for key in self._index[ru.UID][0]]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def events(self):
+        '''
+        Return the sorted list of event names in the profile.
+        '''
+
+        return [self._str(key) for key in self._index[ru.EVENT][0]]
+
+
+# ------------------------------------------------------------------------------
+
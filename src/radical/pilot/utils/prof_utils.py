@@ -2,11 +2,14 @@
 
 import os
 import glob
+import math
+import array
 
 import radical.utils as ru
 
-from ..       import states as s
-from .session import fetch_json
+from ..        import states as s
+from .session  import fetch_json
+from .prof_bin import write_binary_profile, BinaryProfile
 
 _debug = os.environ.get('RP_PROF_DEBUG')
 
@@ -562,10 +565,75 @@ def get_hostmap_deprecated(profiles):
 # ------------------------------------------------------------------------------
 #
 def get_session_profile(sid, src=None):
+    '''
+    Return the combined profile of the session, the accuracy of the time
+    synchronization, and the hostmap.  If the session profiles were converted
+    by `convert_session_profile()` (and did not change since), the binary
+    profile is used, which is much faster to load than the CSV profiles.
+    '''
+
+    if not src:
+        src = "%s/%s" % (os.getcwd(), sid)
+
+    fname = _get_binary_profile(sid, src)
+    if fname:
+        with BinaryProfile(fname) as prof:
+            return prof.rows(), prof.accuracy, prof.hostmap
+
+    return _read_session_profile(sid, src)
+
+
+# ------------------------------------------------------------------------------
+#
+def convert_session_profile(sid, src=None, force=False):
+    '''
+    Read the CSV profiles of the session and store the combined profile in the
+    binary profile `<src>/<sid>.bprof`.  The binary profile is used by
+    `get_session_profile()` from then on, and can be read via `BinaryProfile`
+    to query the timeline of individual entities.  An existing binary profile
+    is only rewritten if the CSV profiles changed, or if `force` is set.
+    Returns the file name.
+    '''
 
     if not src:
         src = "%s/%s" % (os.getcwd(), sid)
 
+    if not force:
+        fname = _get_binary_profile(sid, src)
+        if fname:
+            return fname
+
+    profile, accuracy, hostmap = _read_session_profile(sid, src)
+
+    fname = '%s/%s.bprof' % (src, sid)
+    write_binary_profile(fname, profile, sid, accuracy, hostmap)
+
+    return fname
+
+
+# ------------------------------------------------------------------------------
+#
+def _get_binary_profile(sid, src):
+
+    # return the name of the binary profile if it is newer than all CSV
+    # profiles, `None` otherwise
+    fname = '%s/%s.bprof' % (src, sid)
+
+    if not os.path.isfile(fname):
+        return None
+
+    mtime = os.path.getmtime(fname)
+    for prof in glob.glob("%s/*.prof" % src) + glob.glob("%s/*/*.prof" % src):
+        if os.path.getmtime(prof) > mtime:
+            return None
+
+    return fname
+
+
+# ------------------------------------------------------------------------------
+#
+def _read_session_profile(sid, src):
+
     if os.path.exists(src):
         # we have profiles locally
         profiles  = glob.glob("%s/*.prof"   % src)
@@ -744,15 +812,20 @@ def get_node_index(node_list, node, cpn, gpn):
 
 # ------------------------------------------------------------------------------
 #
-def get_duration(thing, dur):
-
+def get_duration(thing, dur, cache=None):
+    '''
+    Return the time of the first start event and of the last stop event of the
+    duration `dur` for `thing`, or `[None, None]`.  Durations often share their
+    events, and if a `cache` dict is passed, timestamps are looked up only once
+    per event.
+    '''
 
     for e in dur:
         if ru.STATE in e and ru.EVENT not in e:
             e[ru.EVENT] = 'state'
 
-    t0 = thing.timestamps(event=dur[0])
-    t1 = thing.timestamps(event=dur[1])
+    t0 = _get_timestamps(thing, dur[0], cache)
+    t1 = _get_timestamps(thing, dur[1], cache)
 
     if not len(t0) or not len(t1):
         return [None, None]
@@ -760,6 +833,21 @@ def get_duration(thing, dur):
     return(t0[0], t1[-1])
 
 
+# ------------------------------------------------------------------------------
+#
+def _get_timestamps(thing, event, cache):
+
+    # event lists (alternatives) are not cached
+    if cache is None or not isinstance(event, dict):
+        return thing.timestamps(event=event)
+
+    key = frozenset(event.items())
+    if key not in cache:
+        cache[key] = thing.timestamps(event=event)
+
+    return cache[key]
+
+
 # ------------------------------------------------------------------------------
 #
 def cluster_resources(resources):
@@ -768,40 +856,15 @@ def cluster_resources(resources):
     #   - [r0, r1] tuples (ranges of core, gpu indexes)
     # cluster continuous stretches of resources
 
-    ret = list()
     idx = set()
     for r in resources:
-        if isinstance(r, int):
-            idx.add(r)
-        else:
-            for i in range(r[0], r[1] + 1):
-                idx.add(i)
-
-    r0 = None
-    r1 = None
-    for i in sorted(list(idx)):
-        if r0 is None:
-            r0 = i
-            continue
-        if r1 is None:
-            if i == r0 + 1:
-                r1 = i
-                continue
-            ret.append([r0, r0])
-            r0 = None
-            continue
-        if i == r1 + 1:
-            r1 = i
-            continue
-        ret.append([r0, r1])
-        r0 = i
-        r1 = None
+        if isinstance(r, int): idx.add(r)
+        else                 : idx.update(range(r[0], r[1] + 1))
 
-    if r0 is not None:
-        if r1 is not None:
-            ret.append([r0, r1])
-        else:
-            ret.append([r0, r0])
+    ret = list()
+    for i in sorted(idx):
+        if ret and i == ret[-1][1] + 1: ret[-1][1] = i
+        else                          : ret.append([i, i])
 
     return ret
 
@@ -811,12 +874,9 @@ def cluster_resources(resources):
 def _get_pilot_provision(pilot):
 
     pid   = pilot.uid
-    cpn   = pilot.cfg['resource_details']['rm_info']['cores_per_node']
-    gpn   = pilot.cfg['resource_details']['rm_info']['gpus_per_node']
+    info  = _get_pilot_info(pilot)
     ret   = dict()
 
-    nodes, _, _ = _get_nodes(pilot)
-
     for metric in PILOT_DURATIONS['provide']:
 
         boxes  = list()
@@ -826,8 +886,8 @@ def _get_pilot_provision(pilot):
             t0 = pilot.events [0][ru.TIME]
             t1 = pilot.events[-1][ru.TIME]
 
-        for node in nodes:
-            r0, r1 = get_node_index(nodes, node, cpn, gpn)
+        for node in info['nodes']:
+            r0, r1 = _get_node_range(info, node)
             boxes.append([t0, t1, r0, r1])
 
         ret['total'] = {pid: boxes}
@@ -901,20 +961,52 @@ def get_consumed_resources(session, udurations=None):
 
     log = ru.Logger('radical.pilot.utils')
 
+    # The pilot data needed to locate the unit resources (node indexes,
+    # resources per node, durations) are collected once per pilot, and units
+    # are inspected in a single pass.  That pass also collects, for each pilot
+    # resource, the time of first and last use by any unit (`t_min`, `t_max`),
+    # needed for the 'warm' and 'drain' metrics below.
     consumed = dict()
-    for e in session.get(etype=['pilot', 'unit']):
+    infos    = dict()
+    pilots   = session.get(etype='pilot')
 
-        if   e.etype == 'pilot': data = _get_pilot_consumption(e)
-        elif e.etype == 'unit' : data = _get_unit_consumption(session,  e,
-                                                              udurations)
+    for pilot in pilots:
 
-        for metric in data:
+        info = _get_pilot_info(pilot, udurations)
+        size = len(info['nodes']) * info['rpn']
 
-            if metric not in consumed:
-                consumed[metric] = dict()
+        info['t_min'] = array.array('d', [math.inf])  * size
+        info['t_max'] = array.array('d', [-math.inf]) * size
+        infos[pilot.uid] = info
 
-            for uid in data[metric]:
-                consumed[metric][uid] = data[metric][uid]
+        _add_consumption(consumed, _get_pilot_consumption(pilot, info))
+
+    for unit in session.get(etype='unit'):
+
+        pid = unit.cfg.get('pilot')
+        if not pid or 'slots' not in unit.cfg:
+            continue
+
+        info      = infos[pid]
+        durations = info['durations']['consume']
+        resources = _get_unit_resources(unit, info)
+
+        cache     = dict()
+
+        _add_consumption(consumed, _get_unit_boxes(unit, resources,
+                                                   durations, cache))
+
+        try:
+            u_min = _get_timestamps(unit, durations['exec_queue'][0], cache)[0]
+            u_max = _get_timestamps(unit, durations['unschedule'][1], cache)[-1]
+        except:
+            continue
+
+        t_min = info['t_min']
+        t_max = info['t_max']
+        for idx in resources:
+            if t_min[idx] > u_min: t_min[idx] = u_min
+            if t_max[idx] < u_max: t_max[idx] = u_max
 
 
     # we defined two additional metrics, 'warmup' and 'drain', which are defined
@@ -922,122 +1014,55 @@ def get_consumed_resources(session, udurations=None):
     # when the pilot becomes active, to the time the resource is first consumed
     # by a unit.  `drain` is the inverse: the  time from when any unit last
     # consumed the resource to the time when the pilot begins termination.
-    for pilot in session.get(etype='pilot'):
-
-        if udurations:
-            # print('DEBUG: using udurations')
-            unit_durations = udurations
-        elif pilot.cfg['task_launch_method'] == 'PRTE':
-            # print('DEBUG: using prte configuration')
-            unit_durations = UNIT_DURATIONS_PRTE
-        else:
-            # print('DEBUG: using default configuration')
-            unit_durations = UNIT_DURATIONS_DEFAULT
+    for pilot in pilots:
 
-        pt    = pilot.timestamps
-        log.debug('timestamps:')
-        for ts in pt():
-            log.debug('    %10.2f  %-20s  %-15s  %-15s  %-15s  %-15s  %s',
-                           ts[0],  ts[1], ts[2], ts[3], ts[4], ts[5], ts[6])
+        pid  = pilot.uid
+        info = infos[pid]
+        pt   = pilot.timestamps
 
         p_min = pt(event=PILOT_DURATIONS['consume']['ignore'][0]) [0]
         p_max = pt(event=PILOT_DURATIONS['consume']['ignore'][1])[-1]
       # p_max = pilot.events[-1][ru.TIME]
         log.debug('pmin, pmax: %10.2f / %10.2f', p_min, p_max)
 
-        pid = pilot.uid
-        cpn = pilot.cfg['resource_details']['rm_info']['cores_per_node']
-        gpn = pilot.cfg['resource_details']['rm_info']['gpus_per_node']
-
-        nodes, _, pnodes = _get_nodes(pilot)
-
-        # find resource utilization scope for all resources. We begin filling
-        # the resource dict with
-        #
-        #   resource_id : [t_min=None, t_max=None]
-        #
-        # and then iterate over all units.  Wen we find a unit using some
-        # resource id, we set or adjust t_min / t_max.
-        resources = dict()
-        for pnode in pnodes:
-            idx = get_node_index(nodes, pnode, cpn, gpn)
-            for c in range(idx[0], idx[1] + 1):
-                resources[c] = [None, None]
-
-
-        for unit in session.get(etype='unit'):
-
-            if unit.cfg.get('pilot') != pid:
-                continue
-
-            try:
-                snodes = unit.cfg['slots']['nodes']
-                ut     = unit.timestamps
-                u_min  = ut(event=unit_durations['consume']['exec_queue'][0]) [0]
-                u_max  = ut(event=unit_durations['consume']['unschedule'][1])[-1]
-            except:
-                continue
-
-            for snode in snodes:
-
-                node  = [snode['name'], snode['uid']]
-                r0, _ = get_node_index(nodes, node, cpn, gpn)
-
-                for core_map in snode['core_map']:
-                    for core in core_map:
-                        idx = r0 + core
-                        t_min = resources[idx][0]
-                        t_max = resources[idx][1]
-                        if t_min is None or t_min > u_min: t_min = u_min
-                        if t_max is None or t_max < u_max: t_max = u_max
-                        resources[idx] = [t_min, t_max]
-
-                for gpu_map in snode['gpu_map']:
-                    for gpu in gpu_map:
-                        idx = r0 + cpn + gpu
-                        t_min = resources[idx][0]
-                        t_max = resources[idx][1]
-                        if t_min is None or t_min > u_min: t_min = u_min
-                        if t_max is None or t_max < u_max: t_max = u_max
-                        resources[idx] = [t_min, t_max]
-
-        # now sift through resources and find buckets of pairs with same t_min
-        # or same t_max
+        # sift through the resources of the (non-agent) pilot nodes and find
+        # buckets of resources with same t_min or same t_max.  Resources are
+        # visited in index order, so the buckets are sorted.
         bucket_min  = dict()
         bucket_max  = dict()
         bucket_none = list()
-        for idx in resources:
 
-            t_min = resources[idx][0]
-            t_max = resources[idx][1]
+        t_min = info['t_min']
+        t_max = info['t_max']
+        for pnode in info['pnodes']:
 
-            if t_min is None:
+            r0, r1 = _get_node_range(info, pnode)
+            for idx in range(r0, r1 + 1):
 
-                assert(t_max is None)
-                bucket_none.append(idx)
+                if t_min[idx] == math.inf:
+                    bucket_none.append(idx)
+                    continue
 
-            else:
+                if t_min[idx] not in bucket_min:
+                    bucket_min[t_min[idx]] = list()
+                bucket_min[t_min[idx]].append(idx)
 
-                if t_min not in bucket_min:
-                    bucket_min[t_min] = list()
-                bucket_min[t_min].append(idx)
-
-                if t_max not in bucket_max:
-                    bucket_max[t_max] = list()
-                bucket_max[t_max].append(idx)
+                if t_max[idx] not in bucket_max:
+                    bucket_max[t_max[idx]] = list()
+                bucket_max[t_max[idx]].append(idx)
 
         boxes_warm  = list()
         boxes_drain = list()
         boxes_idle  = list()
 
         # now cluster all lists and add the respective boxes
-        for t_min in bucket_min:
-            for r in cluster_resources(bucket_min[t_min]):
-                boxes_warm.append([p_min, t_min, r[0], r[1]])
+        for tmin in bucket_min:
+            for r in cluster_resources(bucket_min[tmin]):
+                boxes_warm.append([p_min, tmin, r[0], r[1]])
 
-        for t_max in bucket_max:
-            for r in cluster_resources(bucket_max[t_max]):
-                boxes_drain.append([t_max, p_max, r[0], r[1]])
+        for tmax in bucket_max:
+            for r in cluster_resources(bucket_max[tmax]):
+                boxes_drain.append([tmax, p_max, r[0], r[1]])
 
         for r in cluster_resources(bucket_none):
             boxes_idle.append([p_min, p_max, r[0], r[1]])
@@ -1055,6 +1080,19 @@ def get_consumed_resources(session, udurations=None):
     return consumed
 
 
+# ------------------------------------------------------------------------------
+#
+def _add_consumption(consumed, data):
+
+    for metric in data:
+
+        if metric not in consumed:
+            consumed[metric] = dict()
+
+        for uid in data[metric]:
+            consumed[metric][uid] = data[metric][uid]
+
+
 # ------------------------------------------------------------------------------
 #
 def _get_nodes(pilot):
@@ -1074,7 +1112,55 @@ def _get_nodes(pilot):
 
 # ------------------------------------------------------------------------------
 #
-def _get_pilot_consumption(pilot):
+def _get_pilot_info(pilot, udurations=None):
+    '''
+    Collect what is needed to map unit slots to resource indexes of the given
+    pilot: the pilot nodes, the number of resources per node, the index of the
+    first resource of each node, and the unit durations to use.
+    '''
+
+    rm_info = pilot.cfg['resource_details']['rm_info']
+    cpn     = rm_info['cores_per_node']
+    gpn     = rm_info['gpus_per_node']
+
+    nodes, anodes, pnodes = _get_nodes(pilot)
+
+    # same result as `get_node_index()`, but w/o a list search per lookup
+    index = dict()
+    for i, node in enumerate(nodes):
+        index.setdefault(tuple(node), i * (cpn + gpn))
+
+    # we heuristically switch between PRTE event traces and normal (fork) event
+    # traces
+    if udurations:
+        durations = udurations
+    elif pilot.cfg['task_launch_method'] == 'PRTE':
+        durations = UNIT_DURATIONS_PRTE
+    else:
+        durations = UNIT_DURATIONS_DEFAULT
+
+    return {'cpn'      : cpn,
+            'gpn'      : gpn,
+            'rpn'      : cpn + gpn,
+            'nodes'    : nodes,
+            'anodes'   : anodes,
+            'pnodes'   : pnodes,
+            'index'    : index,
+            'durations': durations}
+
+
+# ------------------------------------------------------------------------------
+#
+def _get_node_range(info, node):
+
+    r0 = info['index'][tuple(node)]
+
+    return [r0, r0 + info['rpn'] - 1]
+
+
+# ------------------------------------------------------------------------------
+#
+def _get_pilot_consumption(pilot, info=None):
 
     # Pilots consume resources in different ways:
     #
@@ -1094,10 +1180,11 @@ def _get_pilot_consumption(pilot):
     # overheads.
 
     pid   = pilot.uid
-    cpn   = pilot.cfg['resource_details']['rm_info']['cores_per_node']
-    gpn   = pilot.cfg['resource_details']['rm_info']['gpus_per_node']
     ret   = dict()
 
+    if not info:
+        info = _get_pilot_info(pilot)
+
     # Account for agent resources.  Agents use full nodes, i.e., cores and GPUs
     # We happen to know that agents use the first nodes in the allocation and
     # their resource tuples thus start at index `0`, but for completeness we
@@ -1111,11 +1198,9 @@ def _get_pilot_consumption(pilot):
 
     # Substract agent nodes from the nodelist, so that we correctly attribute
     # other global pilot metrics to the remaining nodes.
-    nodes, anodes, pnodes = _get_nodes(pilot)
-
-    if anodes and t0 is not None:
-        for anode in anodes:
-            r0, r1 = get_node_index(nodes, anode, cpn, gpn)
+    if info['anodes'] and t0 is not None:
+        for anode in info['anodes']:
+            r0, r1 = _get_node_range(info, anode)
             boxes.append([t0, t1, r0, r1])
 
     ret['agent'] = {pid: boxes}
@@ -1130,8 +1215,8 @@ def _get_pilot_consumption(pilot):
         t0, t1 = get_duration(pilot, PILOT_DURATIONS['consume'][metric])
 
         if t0 is not None:
-            for node in pnodes:
-                r0, r1 = get_node_index(nodes, node, cpn, gpn)
+            for node in info['pnodes']:
+                r0, r1 = _get_node_range(info, node)
                 boxes.append([t0, t1, r0, r1])
 
         ret[metric] = {pid: boxes}
@@ -1145,12 +1230,15 @@ def _get_unit_consumption(session, unit, udurations=None):
 
     # we need to know what pilot the unit ran on.  If we don't find a designated
     # pilot, no resources were consumed
-    uid = unit.uid
     pid = unit.cfg['pilot']
 
     if not pid:
         return dict()
 
+    # Units consume only those resources they are scheduled on.
+    if 'slots' not in unit.cfg:
+        return dict()
+
     # get the pilot for inspection
     pilot = session.get(uid=pid)
 
@@ -1158,21 +1246,25 @@ def _get_unit_consumption(session, unit, udurations=None):
         assert(len(pilot) == 1)
         pilot = pilot[0]
 
-    # FIXME: it is inefficient to query those values again and again
-    cpn   = pilot.cfg['resource_details']['rm_info']['cores_per_node']
-    gpn   = pilot.cfg['resource_details']['rm_info']['gpus_per_node']
-    nodes, _, _ = _get_nodes(pilot)
+    info      = _get_pilot_info(pilot, udurations)
+    resources = _get_unit_resources(unit, info)
 
-    # Units consume only those resources they are scheduled on.
-    if 'slots' not in unit.cfg:
-        return dict()
+    return _get_unit_boxes(unit, resources, info['durations']['consume'],
+                           dict())
+
+
+# ------------------------------------------------------------------------------
+#
+def _get_unit_resources(unit, info):
 
-    snodes    = unit.cfg['slots']['nodes']
+    # return the indexes of all cores and gpus the unit is scheduled on
+    cpn       = info['cpn']
+    index     = info['index']
     resources = list()
-    for snode in snodes:
 
-        node  = [snode['name'], snode['uid']]
-        r0, _ = get_node_index(nodes, node, cpn, gpn)
+    for snode in unit.cfg['slots']['nodes']:
+
+        r0 = index[(snode['name'], snode['uid'])]
 
         for core_map in snode['core_map']:
             for core in core_map:
@@ -1182,26 +1274,26 @@ def _get_unit_consumption(session, unit, udurations=None):
             for gpu in gpu_map:
                 resources.append(r0 + cpn + gpu)
 
+    return resources
+
+
+# ------------------------------------------------------------------------------
+#
+def _get_unit_boxes(unit, resources, durations, cache=None):
+
+    uid = unit.uid
+
     # find continuous stretched of resources to minimize number of boxes
     resources = cluster_resources(resources)
 
-    # we heuristically switch between PRTE event traces and normal (fork) event
-    # traces
-    if udurations:
-        unit_durations = udurations
-    elif pilot.cfg['task_launch_method'] == 'PRTE':
-        unit_durations = UNIT_DURATIONS_PRTE
-    else:
-        unit_durations = UNIT_DURATIONS_DEFAULT
-
     if _debug:
         print()
 
     ret = dict()
-    for metric in unit_durations['consume']:
+    for metric in durations:
 
         boxes = list()
-        t0, t1 = get_duration(unit, unit_durations['consume'][metric])
+        t0, t1 = get_duration(unit, durations[metric], cache)
 
 
         if t0 is not None:
@@ -1215,7 +1307,7 @@ def _get_unit_consumption(session, unit, udurations=None):
         else:
             if _debug:
                 print('%s: %-15s : -------------- ' % (unit.uid, metric))
-                dur = unit_durations['consume'][metric]
+                dur = durations[metric]
                 print(dur)
 
                 for e in dur:
@@ -83,7 +83,8 @@ def fetch_profiles (sid, dburl=None, src=None, tgt=None, access=None,
 
     _, db, _, _, _ = ru.mongodb_connect (dburl)
 
-    json_docs = get_session_docs(db, sid)
+    json_docs = get_session_docs(db, sid, fields={'pilot': ['pilot_sandbox'],
+                                                  'unit' : []})
 
     pilots = json_docs['pilot']
     num_pilots = len(pilots)
@@ -256,7 +257,8 @@ def fetch_logfiles (sid, dburl=None, src=None, tgt=None, access=None,
 
     _, db, _, _, _ = ru.mongodb_connect (dburl)
 
-    json_docs = get_session_docs(db, sid)
+    json_docs = get_session_docs(db, sid, fields={'pilot': ['pilot_sandbox'],
+                                                  'unit' : []})
 
     pilots = json_docs['pilot']
     num_pilots = len(pilots)
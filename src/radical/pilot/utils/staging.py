@@ -0,0 +1,348 @@
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import time
+import errno
+import shutil
+
+import threading          as mt
+import concurrent.futures as cf
+
+from ..   import constants as rpc
+
+from .misc import rec_makedir
+
+
+# linux ioctl which clones a file by sharing its blocks (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+try:
+    import fcntl as _fcntl
+except ImportError:
+    _fcntl = None
+
+
+# ------------------------------------------------------------------------------
+#
+def copy_file(src, tgt, hardlink=False):
+    '''
+    Copy the file `src` to `tgt` (which can be a directory), without passing
+    the data through user space where possible: a reflink is tried first, then
+    `os.copy_file_range()`, and a buffered copy only if both are unsupported.
+    If `hardlink` is set, read-only files are hard-linked instead of copied.
+    Permission bits are copied as in `shutil.copy()`.  Returns the number of
+    bytes copied.
+    '''
+
+    if os.path.isdir(tgt):
+        tgt = os.path.join(tgt, os.path.basename(src))
+
+    st = os.stat(src)
+
+    if hardlink and not st.st_mode & 0o222:
+        try:
+            os.link(src, tgt)
+            return 0
+        except OSError:
+            # different file system, or links are not permitted: copy
+            pass
+
+    with open(src, 'rb') as fsrc, open(tgt, 'wb') as ftgt:
+
+        sfd  = fsrc.fileno()
+        tfd  = ftgt.fileno()
+        done = 0
+
+        if _fcntl:
+            try:
+                _fcntl.ioctl(tfd, _FICLONE, sfd)
+                done = st.st_size
+            except OSError:
+                pass
+
+        if not done and hasattr(os, 'copy_file_range'):
+            try:
+                while done < st.st_size:
+                    n = os.copy_file_range(sfd, tfd, st.st_size - done)
+                    if not n:
+                        break
+                    done += n
+            except OSError as e:
+                # not supported for this pair of files - fall back to a copy
+                if done or e.errno not in [errno.EXDEV, errno.ENOSYS,
+                                           errno.EINVAL, errno.EOPNOTSUPP]:
+                    raise
+
+        if done < st.st_size:
+            fsrc.seek(done)
+            ftgt.seek(done)
+            shutil.copyfileobj(fsrc, ftgt)
+
+    shutil.copymode(src, tgt)
+
+    return st.st_size
+
+
+# ------------------------------------------------------------------------------
+#
+class _SharedOp(object):
+    '''
+    A staging operation which can occur more than once in a bulk.  The first
+    unit which gets to it performs it, others wait for its result.  A unit
+    which fails on an earlier operation never gets to it, and then the next
+    unit which does performs it instead.
+    '''
+
+    def __init__(self):
+
+        self._cond    = mt.Condition()
+        self._running = False
+        self._done    = False
+        self._error   = None
+
+
+    def perform(self, func):
+        '''
+        Call `func` unless the operation was performed already.  Returns
+        a tuple `[performed, error]`, where `error` is `None` on success, and
+        the exception raised by `func` otherwise (also if it was raised while
+        another unit performed the operation).
+        '''
+
+        with self._cond:
+            while self._running:
+                self._cond.wait()
+            if self._done:
+                return False, self._error
+            self._running = True
+
+        error = None
+        try:
+            func()
+        except Exception as e:
+            error = e
+
+        with self._cond:
+            self._running = False
+            self._done    = True
+            self._error   = error
+            self._cond.notify_all()
+
+        return True, error
+
+
+# ------------------------------------------------------------------------------
+#
+class StagingEngine(object):
+    '''
+    Enact local staging operations (COPY, LINK, MOVE) for bulks of units.
+    The operations of a unit are performed in order, but the units of a bulk
+    are staged concurrently by `staging_workers` threads, and at most
+    `staging_fs_limit` operations are active on any file system.  Operations
+    which occur more than once in a bulk (same action, source and target) are
+    only performed once.  Other actions are passed to the given `handlers`.
+
+    The engine collects the number of operations, bytes and time per action,
+    see `stats()`.
+    '''
+
+    _local = [rpc.COPY, rpc.LINK, rpc.MOVE]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg, log, prof, prefix, handlers=None):
+
+        self._log      = log
+        self._prof     = prof
+        self._prefix   = prefix
+        self._handlers = handlers or dict()
+        self._hardlink = cfg.get('staging_hardlink', False)
+        self._fs_limit = cfg.get('staging_fs_limit', 4)
+        self._fs_sems  = dict()
+        self._lock     = mt.Lock()
+        self._stats    = dict()
+        self._pool     = None
+
+        n_workers = cfg.get('staging_workers', 1)
+        if n_workers > 1:
+            self._pool = cf.ThreadPoolExecutor(max_workers=n_workers)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+        for action, stat in sorted(self.stats().items()):
+            self._log.info('staging %-8s: %6d ops, %10d bytes, %8.2fs, '
+                           '%8.1f ops/s, %8.1f MB/s', action, stat['ops'],
+                           stat['bytes'], stat['time'], stat['ops_rate'],
+                           stat['byte_rate'] / 1024 / 1024)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stats(self):
+        '''
+        Return the accumulated number of operations, bytes and time (summed
+        over all threads) per action, and the derived rates.
+        '''
+
+        ret = dict()
+        with self._lock:
+            for action, (ops, nbytes, ttc) in self._stats.items():
+                ret[action] = {'ops'      : ops,
+                               'bytes'    : nbytes,
+                               'time'     : ttc,
+                               'ops_rate' : ops    / ttc if ttc else 0.0,
+                               'byte_rate': nbytes / ttc if ttc else 0.0}
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stage(self, bulk):
+        '''
+        `bulk` is a list of `[unit, ops]` tuples, where `ops` is a list of
+        dicts with the keys `did`, `action`, `src` and `tgt` (local paths), and
+        `mkdir` (a directory to create first, or `None`).
+
+        This is a generator which yields `[unit, error]` tuples in the order of
+        the bulk, as soon as the respective unit is staged.  `error` is `None`
+        on success, the exception of the first failed operation otherwise.
+        '''
+
+        # find duplicated operations: they are performed by the first unit
+        # which gets to them, and the others use the result (see `_SharedOp`)
+        seen  = dict()
+        tasks = list()
+        for unit, ops in bulk:
+            staged = list()
+            for op in ops:
+                key = (op['action'], op['src'], op['tgt'])
+                if key not in seen:
+                    seen[key] = _SharedOp()
+                staged.append([op, seen[key]])
+            tasks.append([unit, staged])
+
+        if not self._pool:
+            for unit, staged in tasks:
+                yield unit, self._stage_unit(unit, staged)
+            return
+
+        futures = [[unit, self._pool.submit(self._stage_unit, unit, staged)]
+                   for unit, staged in tasks]
+        for unit, future in futures:
+            yield unit, future.result()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _stage_unit(self, unit, staged):
+
+        uid = unit['uid']
+
+        for op, shared in staged:
+
+            did = op['did']
+            self._prof.prof('%s_start' % self._prefix, uid=uid, msg=did)
+
+            performed, error = shared.perform(lambda: self._stage_op(uid, op))
+            if not performed:
+                self._log.debug('dedup staging %s: %s', did, op['tgt'])
+
+            if error:
+                self._log.error('%s failed for %s: %s', did, uid, error)
+                self._prof.prof('%s_fail' % self._prefix, uid=uid, msg=did)
+                return error
+
+            self._prof.prof('%s_stop' % self._prefix, uid=uid, msg=did)
+
+        return None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _stage_op(self, uid, op):
+
+        action = op['action']
+        src    = op['src']
+        tgt    = op['tgt']
+
+        if op['mkdir']:
+            self._log.debug("mkdir %s", op['mkdir'])
+            rec_makedir(op['mkdir'])
+
+        if action not in self._local:
+            return self._handlers[action](uid, src, tgt)
+
+        sems = self._get_sems(src, tgt)
+        for sem in sems:
+            sem.acquire()
+
+        try:
+            start  = time.time()
+            nbytes = 0
+
+            if action == rpc.COPY:
+                if os.path.isdir(src):
+                    sizes = list()
+                    def _copy(s, t):
+                        sizes.append(copy_file(s, t, self._hardlink))
+                    shutil.copytree(src, tgt, copy_function=_copy)
+                    nbytes = sum(sizes)
+                else:
+                    nbytes = copy_file(src, tgt, self._hardlink)
+
+            elif action == rpc.LINK:
+                # Fix issue/1513 if link source is file and target is folder:
+                # create the link with the same name as the source
+                if os.path.isfile(src) and os.path.isdir(tgt):
+                    os.symlink(src, os.path.join(tgt, os.path.basename(src)))
+                else:
+                    os.symlink(src, tgt)
+
+            elif action == rpc.MOVE:
+                shutil.move(src, tgt)
+
+            ttc = time.time() - start
+
+        finally:
+            for sem in reversed(sems):
+                sem.release()
+
+        with self._lock:
+            stat     = self._stats.setdefault(action, [0, 0, 0.0])
+            stat[0] += 1
+            stat[1] += nbytes
+            stat[2] += ttc
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_sems(self, src, tgt):
+
+        # limit concurrency per file system (device) of source and target.
+        # Semaphores are acquired in device order to avoid deadlocks.
+        devs = set()
+        for path in [src, os.path.dirname(tgt.rstrip('/'))]:
+            try:
+                devs.add(os.stat(path).st_dev)
+            except OSError:
+                pass
+
+        with self._lock:
+            for dev in devs:
+                if dev not in self._fs_sems:
+                    self._fs_sems[dev] = mt.BoundedSemaphore(self._fs_limit)
+            return [self._fs_sems[dev] for dev in sorted(devs)]
+
+
+# ------------------------------------------------------------------------------
+
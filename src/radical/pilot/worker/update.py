@@ -9,6 +9,7 @@ import pymongo
 import radical.utils     as ru
 
 from .. import utils     as rpu
+from .. import states    as rps
 from .. import constants as rpc
 
 
@@ -47,10 +48,10 @@ class Update(rpu.Worker):
         _, db, _, _, _   = ru.mongodb_connect(self._dburl)
         self._mongo_db   = db
         self._coll       = self._mongo_db[self._sid]
-        self._bulk       = self._coll.initialize_ordered_bulk_op()
         self._last       = time.time()        # time of last bulk push
-        self._uids       = list()             # list of collected uids
-        self._lock       = ru.Lock()          # protect _bulk
+        self._uids       = list()             # list of collected transitions
+        self._pending    = dict()             # (uid, type) -> update dict
+        self._lock       = ru.Lock()          # protect _pending
 
         self._bulk_time = self._cfg.bulk_time
         self._bulk_size = self._cfg.bulk_size
@@ -85,8 +86,20 @@ class Update(rpu.Worker):
            and len(self._uids) < self._bulk_size:
             return False
 
+        # each collected entity results in exactly one update op, which
+        # carries the union of all '$set' fields and all collected states.  As
+        # no two ops in the bulk touch the same document, the ops do not need
+        # to be applied in order, and an unordered bulk allows MongoDB to
+        # process them in parallel.
+        bulk = self._coll.initialize_unordered_bulk_op()
+        for (uid, ttype), update_dict in self._pending.items():
+            bulk.find({'uid' : uid,
+                       'type': ttype}).update(update_dict)
+
         try:
-            self._bulk.execute()
+            start = time.time()
+            bulk.execute()
+            stop  = time.time()
 
         except pymongo.errors.OperationFailure as e:
             self._log.exception('bulk exec error: %s' % e.details)
@@ -96,7 +109,12 @@ class Update(rpu.Worker):
             self._log.exception('mongodb error: %s', e)
             raise
 
-        self._prof.prof('update_pushed', msg='bulk size: %d' % len(self._uids))
+        # bulk metrics: number of DB ops, number of collected updates,
+        # coalescing ratio, and time spent in the DB
+        n_ops = len(self._pending)
+        n_upd = len(self._uids)
+        self._prof.prof('update_pushed', msg='bulk size: %d [%d] %.2f %.3fs'
+                        % (n_ops, n_upd, float(n_upd) / n_ops, stop - start))
 
       # for entry in self._uids:
       #
@@ -109,9 +127,9 @@ class Update(rpu.Worker):
       #         self._prof.prof('update_pushed', uid=uid)
 
         # empty bulk, refresh state
-        self._last = now
-        self._bulk = self._coll.initialize_ordered_bulk_op()
-        self._uids = list()
+        self._last    = now
+        self._uids    = list()
+        self._pending = dict()
 
         return True
 
@@ -169,6 +187,13 @@ class Update(rpu.Worker):
         For 'cmd' in ['state', 'state_flush'], only the 'uid' and 'state' fields
         of the given 'thing' are used, all other fields are ignored.  If 'state'
         does not exist, an exception is raised.
+
+        Updates for the same entity which arrive within one bulk window are
+        coalesced into a single DB operation: the '$set' fields are merged
+        (later values win), and all states are pushed in arrival order via
+        '$push: {states: {$each: [...]}}'.  The 'state' field is set to the
+        collapsed state of all collected states, so that updates which arrive
+        out-of-order within a bulk window do not move the state backwards.
         '''
 
         try:
@@ -198,37 +223,45 @@ class Update(rpu.Worker):
 
                 if 'clone' in uid:
                     # we don't push clone states to DB
-                    return True
+                    continue
 
               # self._prof.prof('update_request', msg=state, uid=uid)
 
                 if not state:
                     # nothing to push
-                    return True
-
-                # create an update document
-                update_dict          = dict()
-                update_dict['$set']  = dict()
-                update_dict['$push'] = dict()
-
-                for key,val in thing.items():
-                    # never set _id, states (to avoid index clash, doubled ops)
-                    if key not in ['_id', 'states', 'cmds']:
-                        update_dict['$set'][key] = val
-
-                # we set state, put (more importantly) we push the state onto
-                # the 'states' list, so that we can later get state progression
-                # in sync with the state model, even if they have been pushed
-                # here out-of-order
-                update_dict['$push']['states'] = state
+                    continue
 
                 with self._lock:
 
-                    # push the update request onto the bulk
+                    # add to the update document for that entity, or create
+                    # a new one
+                    update_dict = self._pending.get((uid, ttype))
+                    if not update_dict:
+                        update_dict = {'$set' : dict(),
+                                       '$push': {'states': {'$each': list()}}}
+                        self._pending[(uid, ttype)] = update_dict
+
+                    for key,val in thing.items():
+                        # never set _id, states (to avoid index clash, doubled
+                        # ops)
+                        if key not in ['_id', 'states', 'cmds']:
+                            update_dict['$set'][key] = val
+
+                    # we set state, put (more importantly) we push the state
+                    # onto the 'states' list, so that we can later get state
+                    # progression in sync with the state model, even if they
+                    # have been pushed here out-of-order
+                    states = update_dict['$push']['states']['$each']
+                    states.append(state)
+
+                    if   ttype == 'unit' : collapse = rps._unit_state_collapse
+                    elif ttype == 'pilot': collapse = rps._pilot_state_collapse
+                    else                 : collapse = None
+
+                    if collapse:
+                        update_dict['$set']['state'] = collapse(states)
+
                     self._uids.append([uid, ttype, state])
-                    self._bulk.find  ({'uid' : uid,
-                                       'type': ttype}) \
-                              .update(update_dict)
 
             with self._lock:
                 # attempt a timed update
@@ -7,7 +7,40 @@ __license__   = "MIT"
 from unittest import TestCase
 from unittest import mock
 
+import radical.utils            as ru
+import radical.pilot.states     as rps
+import radical.pilot.constants  as rpc
+
 from radical.pilot.utils.component import Component
+from radical.pilot.utils.metrics   import Metrics
+
+
+# ------------------------------------------------------------------------------
+#
+class _Getter(object):
+    '''
+    Mimic the request/reply protocol of a queue endpoint: a get sends
+    a request if none is outstanding, and only returns the reply (the next bulk
+    the bridge has) if the request was sent on an earlier call, or if the get
+    waits for it.
+    '''
+
+    def __init__(self, replies):
+        self.channel    = 'queue'
+        self.replies    = replies
+        self.timeouts   = list()
+        self._requested = False
+
+    def get_nowait(self, timeout=None):
+        self.timeouts.append(timeout)
+        if not self._requested:
+            self._requested = True
+            if not timeout:
+                return None
+        if not self.replies:
+            return None
+        self._requested = False
+        return self.replies.pop(0)
 
 
 # ------------------------------------------------------------------------------
@@ -34,5 +67,204 @@ class TestComponent(TestCase):
         component.output(things=[1,2], state='test_state')
 
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    def test_cancel(self, mocked_init):
+
+        component = Component(None, None)
+
+        component._log         = mock.Mock()
+        component._prof        = mock.Mock()
+        component._cancel_list = set()
+        component._cancel_lock = ru.RLock()
+        component._work_lock   = ru.RLock()
+        component._outputs     = dict()
+        component.publish      = mock.Mock()
+
+        uids = ['unit.%06d' % i for i in range(100000)]
+        component._cancel_monitor_cb(None, {'cmd': 'cancel_units',
+                                            'arg': {'uids': uids}})
+        component._cancel_monitor_cb(None, {'cmd': 'cancel_units',
+                                            'arg': {'uids': 'unit.x'}})
+        self.assertEqual(len(component._cancel_list), 100001)
+
+        # incoming things are canceled once, and the request is consumed
+        things = [{'uid': 'unit.000001', 'type': 'unit', 'state': 'A'},
+                  {'uid': 'unit.y',      'type': 'unit', 'state': 'A'}]
+        queue  = mock.Mock()
+        queue.get_nowait.side_effect = [things, None]
+        worker = mock.Mock()
+        component._cfg      = dict()
+        component._input_rr = 0
+        component._inputs   = {'in': {'queue' : queue,
+                                      'states': ['A'],
+                                      'weight': 2,
+                                      'last'  : 0.0}}
+        component._workers  = {'A': worker}
+
+        component.work_cb()
+
+        self.assertEqual(things[0]['state'], rps.CANCELED)
+        self.assertEqual(things[1]['state'], 'A')
+        self.assertNotIn('unit.000001', component._cancel_list)
+        self.assertEqual(len(component._cancel_list), 100000)
+
+        # requests for things dropped in a final state expire
+        component.advance({'uid': 'unit.000002', 'type': 'unit'},
+                          rps.DONE, publish=False, push=True)
+        self.assertNotIn('unit.000002', component._cancel_list)
+
+        # requests for things which do not pass the component expire after one
+        # to two ttl periods
+        component._cfg              = {'cancel_ttl': 60}
+        component._cb_lock          = ru.RLock()
+        component._cancel_sets      = list()
+        component.register_timed_cb = mock.Mock()
+
+        component.register_cancel_set(component._cancel_list,
+                                      component._cancel_lock)
+        component.register_timed_cb.assert_called_once_with(
+                                      component._cancel_sweep_cb, timer=60)
+
+        self.assertTrue(component._cancel_sweep_cb())
+        self.assertEqual(len(component._cancel_list), 99999)
+
+        component._cancel_list.add('unit.z')
+        self.assertTrue(component._cancel_sweep_cb())
+        self.assertEqual(component._cancel_list, {'unit.z'})
+
+        self.assertTrue(component._cancel_sweep_cb())
+        self.assertEqual(component._cancel_list, set())
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    def test_work_cb(self, mocked_init):
+
+        component = Component(None, None)
+
+        component._log         = mock.Mock()
+        component._prof        = mock.Mock()
+        component._cfg         = {'input_bulk': 2}
+        component._cancel_list = set()
+        component._work_lock   = ru.RLock()
+        component._input_rr    = 0
+
+        def _things(state, n):
+            return [{'uid': 'unit', 'type': 'unit', 'state': state}] * n
+
+        # input 'a' always has things, input 'b' has things once
+        qa = _Getter([_things('A', 2) for _ in range(10)])
+        qb = _Getter([_things('B', 1)])
+        wa = mock.Mock()
+        wb = mock.Mock()
+
+        component._inputs  = {'a': {'queue' : qa, 'states': ['A'],
+                                    'weight': 3,  'last'  : 0.0},
+                              'b': {'queue' : qb, 'states': ['B'],
+                                    'weight': 1,  'last'  : 0.0}}
+        component._workers = {'A': wa, 'B': wb}
+
+        # the first gets only send requests, so we wait on the inputs in turn
+        # (input 'b' comes first), for a share of the timeout each
+        self.assertTrue(component.work_cb())
+        self.assertEqual(wa.call_count, 0)
+        self.assertEqual(len(wb.call_args[0][0]), 1)
+        self.assertEqual(qb.timeouts, [0, 50])
+
+        # input 'a' is drained according to its weight, waiting for the replies
+        # after the first one, and the bulk limit (2 * 3) holds
+        self.assertTrue(component.work_cb())
+        self.assertEqual(len(wa.call_args[0][0]), 6)
+        self.assertEqual(qa.timeouts, [0, 0, 10, 10])
+
+        # a busy input does not starve the other one
+        self.assertTrue(component.work_cb())
+        self.assertEqual(wa.call_count, 2)
+        self.assertEqual(wb.call_count, 1)
+        self.assertEqual(qb.timeouts, [0, 50, 0, 0, 50])
+
+        # inputs may have more things if the last reply was a full bulk
+        def _drains():
+            return [c[1]['msg'].split()[3]
+                    for c in component._prof.prof.call_args_list
+                    if  c[0][0] == 'input_drain']
+
+        self.assertEqual(_drains(), ['0', '1', '1'])
+
+        # ... but not if it was not, or if the input ran empty
+        component._prof.reset_mock()
+        qa.replies = [_things('A', 2), _things('A', 1)]
+        self.assertEqual(len(component._drain_input('a', 2, timeout=10)), 3)
+        qa.replies = [_things('A', 2)]
+        self.assertEqual(len(component._drain_input('a', 2, timeout=10)), 2)
+        self.assertEqual(_drains(), ['0', '0'])
+
+        # the bulk limit is checked between replies: a reply is not split, but
+        # no further reply is requested
+        qa.replies = [_things('A', 5), _things('A', 5)]
+        qa.timeouts = list()
+        component._inputs['a']['weight'] = 1
+
+        self.assertEqual(len(component._drain_input('a', 2, timeout=10)), 5)
+        self.assertEqual(qa.timeouts, [10])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    def test_metrics(self, mocked_init):
+
+        component = Component(None, None)
+
+        component._uid          = 'comp.0000'
+        component._log          = mock.Mock()
+        component._prof         = mock.Mock()
+        component._cfg          = dict()
+        component._cancel_list  = set()
+        component._cancel_lock  = ru.RLock()
+        component._work_lock    = ru.RLock()
+        component._input_rr     = 0
+        component._metrics      = Metrics('comp.0000')
+        component._metrics_cfg  = {'interval': 10.0}
+        component._metrics_last = 0.0
+        component._publishers   = {rpc.CONTROL_PUBSUB: mock.Mock()}
+
+        things = [{'uid': 'unit.%d' % i, 'type': 'unit', 'state': 'A'}
+                  for i in range(3)]
+
+        queue = mock.Mock()
+        queue.channel = 'queue_a'
+        queue.get_nowait.side_effect = [things, None]
+        output = mock.Mock()
+        output.channel = 'queue_b'
+
+        component._inputs  = {'a': {'queue' : queue, 'states': ['A'],
+                                    'weight': 1,     'last'  : 0.0}}
+        component._workers = {'A': mock.Mock()}
+        component._outputs = {'B': output}
+
+        component.work_cb()
+        component.advance(things[:2], 'B',     publish=False, push=True)
+        component.advance(things[2:], rps.DONE, publish=False, push=True)
+
+        # publish_metrics is a timed callback, and stays registered
+        self.assertTrue(component.publish_metrics())
+        self.assertTrue(component.publish_metrics())  # interval did not pass
+
+        pub = component._publishers[rpc.CONTROL_PUBSUB]
+        self.assertEqual(pub.put.call_count, 1)
+
+        msg  = pub.put.call_args[0][1]
+        snap = msg['arg']
+        self.assertEqual(msg['cmd'], 'metrics')
+        self.assertEqual(snap['counters'], {'units_in'   : {'queue_a': 3},
+                                            'units_out'  : {'queue_b': 2},
+                                            'units_final': {rps.DONE : 1}})
+        self.assertEqual(snap['hists']['bulk_in']['queue_a']['count'], 1)
+
+
 # ------------------------------------------------------------------------------
 # pylint: enable=protected-access, unused-argument, no-value-for-parameter
@@ -53,14 +53,15 @@ class TestDefault(TestCase):
 
         # ----------------------------------------------------------------------
         #
-        def _handle_unit_side_effect(unit, actionables):
-            _advance_side_effect(unit, actionables, False, False)
+        def _handle_units_side_effect(staging_units):
+            for unit, actionables in staging_units:
+                _advance_side_effect(unit, actionables, False, False)
 
 
         tests = self.setUp()
         component = Default(cfg=None, session=None)
-        component._handle_unit = mock.MagicMock(
-                                       side_effect=_handle_unit_side_effect)
+        component._handle_units = mock.MagicMock(
+                                       side_effect=_handle_units_side_effect)
         component.advance = mock.MagicMock(side_effect=_advance_side_effect)
         component._log = ru.Logger('dummy')
 
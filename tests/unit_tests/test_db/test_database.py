@@ -0,0 +1,169 @@
+
+# pylint: disable=protected-access, no-value-for-parameter, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import time
+import threading as mt
+
+from unittest import mock
+from unittest import TestCase
+
+import pymongo
+
+from radical.pilot.db import DBSession
+
+
+# ------------------------------------------------------------------------------
+#
+class _Collection(object):
+    '''
+    A minimal in-memory stand-in for a pymongo collection which supports the
+    queries used by `DBSession.claim_control()`.  Like in MongoDB, a multi
+    update is atomic per document, but documents can change between a find
+    and an update.
+    '''
+
+    def __init__(self, docs):
+        self._docs = docs
+        self._lock = mt.Lock()
+
+    def _match(self, doc, query):
+        for k, v in query.items():
+            if isinstance(v, dict) and '$in' in v:
+                if doc.get(k) not in v['$in']: return False
+            elif doc.get(k) != v:
+                return False
+        return True
+
+    def find(self, query, fields=None):
+        with self._lock:
+            ret = [dict(doc) for doc in self._docs if self._match(doc, query)]
+        time.sleep(0.0001)   # make room for other claimers
+        cursor = mock.Mock()
+        cursor.__iter__ = lambda _: iter(ret)
+        cursor.limit    = lambda n: ret[:n]
+        return cursor
+
+    def update(self, query, update, multi=False):
+        n = 0
+        for doc in self._docs:
+            with self._lock:
+                if self._match(doc, query):
+                    doc.update(update['$set'])
+                    n += 1
+        return {'n': n}
+
+    def pending(self):
+        return [doc for doc in self._docs
+                    if  doc['control'].endswith('_pending')]
+
+
+# ------------------------------------------------------------------------------
+#
+class TestDBSession(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _dbs(self, finds):
+
+        dbs = DBSession(sid='rp.session.0000', dburl=None, cfg=None,
+                        log=mock.Mock(), connect=False)
+        dbs._c = mock.MagicMock()
+        dbs._c.find.side_effect = lambda query: finds.pop(0) if finds else []
+
+        return dbs
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_claim_control(self):
+
+        dbs   = self._dbs([])
+        dbs._c = _Collection([{'uid'    : 'unit.%04d' % i,
+                               'pilot'  : 'p.%d' % (i % 2),
+                               'control': 'agent_pending'} for i in range(6)])
+
+        docs = dbs.claim_control('agent', {'pilot': 'p.0'})
+        self.assertEqual([doc['uid'] for doc in docs],
+                         ['unit.0000', 'unit.0002', 'unit.0004'])
+        self.assertEqual([doc['control'] for doc in docs], ['agent'] * 3)
+
+        # claimed docs are not claimed again, limits are respected
+        self.assertEqual(dbs.claim_control('agent', {'pilot': 'p.0'}), [])
+        self.assertEqual(len(dbs.claim_control('agent', {}, limit=2)), 2)
+        self.assertEqual(len(dbs.claim_control('agent', {}, limit=2)), 1)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_claim_concurrent(self):
+
+        n      = 1000
+        dbs    = self._dbs([])
+        dbs._c = _Collection([{'uid'    : 'unit.%04d' % i,
+                               'control': 'agent_pending'} for i in range(n)])
+        claims = list()
+
+        def _claim():
+            while True:
+                docs = dbs.claim_control('agent', {}, limit=7)
+                if not docs and not dbs._c.pending():
+                    break
+                claims.extend([doc['uid'] for doc in docs])
+
+        threads = [mt.Thread(target=_claim) for _ in range(8)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        # every unit is claimed exactly once
+        self.assertEqual(len(claims), n)
+        self.assertEqual(len(set(claims)), n)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_tailed_control(self):
+
+        # change stream: the second claim is triggered by a change event long
+        # before the timeout
+        dbs    = self._dbs([[{'uid': 'unit.0000'}], [],
+                            [{'uid': 'unit.0001'}]])
+        events = [None, {'operationType': 'update'}]
+
+        def _try_next():
+            time.sleep(0.01)
+            return events.pop(0) if events else None
+
+        stream = dbs._c.watch.return_value.__enter__.return_value
+        stream.try_next.side_effect = _try_next
+
+        claimed = list()
+        def _cb(docs):
+            claimed.extend([doc['uid'] for doc in docs])
+            return len(claimed) < 2
+
+        start = time.time()
+        dbs.tailed_control(None, 'agent', {'type': 'unit'}, _cb, timeout=10)
+
+        self.assertEqual(claimed, ['unit.0000', 'unit.0001'])
+        self.assertLess(time.time() - start, 5)
+
+        # no change streams: poll every `timeout` seconds
+        dbs = self._dbs([[], [{'uid': 'unit.0002'}]])
+        dbs._c.watch.side_effect = pymongo.errors.OperationFailure('no rs')
+
+        calls = list()
+        def _cb_poll(docs, cb_data):
+            calls.append([doc['uid'] for doc in docs])
+            return len(calls) < 2
+
+        dbs.tailed_control(None, 'agent', {}, _cb_poll, cb_data='x',
+                           timeout=0.1)
+        self.assertEqual(calls, [[], ['unit.0002']])
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument, no-value-for-parameter
+
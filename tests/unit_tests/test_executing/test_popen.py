@@ -5,13 +5,22 @@ __copyright__ = "Copyright 2013-2016, http://radical.rutgers.edu"
 
 import unittest
 import os
+import time
+import shutil
+import tempfile
+import selectors
+import subprocess
+
+import threading as mt
 
 from unittest import mock
 
 import radical.utils as ru
 
 from radical.pilot.agent.launch_method.base import LaunchMethod
-from radical.pilot.agent.executing.popen    import Popen
+from radical.pilot.agent.executing.popen    import Popen, _WatchQueue
+
+import radical.pilot.states as rps
 
 
 # ------------------------------------------------------------------------------
@@ -97,15 +106,108 @@ class TestBase(unittest.TestCase):
         cu['proc'].wait    = mock.Mock(return_value=1)
 
         component = Popen()
-        component._cus_to_watch = list()
-        component._cus_to_cancel = list()
-        component._cus_to_watch.append(cu)
+        component._cus_to_watch = dict()
+        component._cus_to_cancel = set()
+        component._cus_to_watch[cu['uid']] = cu
         component.advance = mock.MagicMock(side_effect=_advance_side_effect)
         component._prof = mock.Mock()
+        component._prof_batch = None
         component.publish = mock.Mock()
         component._log = ru.Logger('dummy')
         component._check_running()
         self.assertEqual(cu['target_state'], global_state)
+        self.assertEqual(component._cus_to_watch, dict())
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    @mock.patch.object(Popen, 'initialize', return_value=None)
+    def test_wait_running(self, mocked_init, mocked_initialize):
+
+        if not hasattr(os, 'pidfd_open'):
+            return
+
+        component = Popen()
+        component._cancel_lock   = mt.RLock()
+        component._cus_to_cancel = set()
+        component._cus_to_watch  = dict()
+        component._pidfds        = dict()
+        component._watch_queue   = _WatchQueue()
+        component._selector      = selectors.DefaultSelector()
+        component._selector.register(component._watch_queue,
+                                     selectors.EVENT_READ)
+        component._prof     = mock.Mock()
+        component._prof_batch = None
+        component._log      = mock.Mock()
+        component.publish   = mock.Mock()
+        component.advance   = mock.Mock()
+
+        cus = [{'uid' : 'unit.0000',
+                'proc': subprocess.Popen(['sleep', '10'],
+                                         start_new_session=True)},
+               {'uid' : 'unit.0001',
+                'proc': subprocess.Popen(['false'],
+                                         start_new_session=True)}]
+        for cu in cus:
+            component._watch_queue.put(cu)
+
+        # the second unit is reported as done, the first one is still watched
+        start = time.time()
+        while not component.advance.called and time.time() - start < 10:
+            component._wait_running()
+
+        component.advance.assert_called_once_with(
+                cus[1], rps.AGENT_STAGING_OUTPUT_PENDING, publish=True,
+                push=True)
+        self.assertEqual(cus[1]['exit_code'], 1)
+        self.assertEqual(list(component._cus_to_watch), ['unit.0000'])
+        self.assertEqual(list(component._pidfds),       ['unit.0000'])
+
+        # cancel the first one
+        component._cus_to_cancel.add('unit.0000')
+        component._wait_running()
+
+        component.advance.assert_called_with(cus[0], rps.CANCELED,
+                                             publish=True, push=False)
+        self.assertEqual(component._cus_to_watch,  dict())
+        self.assertEqual(component._pidfds,        dict())
+        self.assertEqual(component._cus_to_cancel, set())
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    @mock.patch.object(Popen, 'initialize', return_value=None)
+    def test_prepare_sandboxes(self, mocked_init, mocked_initialize):
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        component = Popen()
+        component._prof = mock.Mock()
+        component._log  = mock.Mock()
+
+        os.makedirs('%s/00/unit.0001' % tmp)
+        open('%s/file' % tmp, 'w').close()
+
+        units = [{'uid'              : uid,
+                  'unit_sandbox_path': '%s/%s/%s/' % (tmp, parent, uid)}
+                 for uid, parent in [['unit.0000', '00'],
+                                     ['unit.0001', '00'],
+                                     ['unit.0002', '01'],
+                                     ['unit.0003', 'file']]]
+
+        with mock.patch('os.mkdir', wraps=os.mkdir) as mkdir:
+            component._prepare_sandboxes(units)
+
+        # one mkdir per sandbox, plus one per parent (3)
+        self.assertEqual(mkdir.call_count, 7)
+        for unit in units[:3]:
+            self.assertTrue(os.path.isdir(unit['unit_sandbox_path']))
+
+        # failures are logged, and reported on spawn
+        self.assertEqual(component._log.exception.call_count, 1)
+
 
     # --------------------------------------------------------------------------
     #
@@ -134,6 +236,7 @@ class TestBase(unittest.TestCase):
         component.gtod         = mock.Mock()
         component._pwd         = mock.Mock()
         component._prof        = mock.Mock()
+        component._prof_mode   = 'file'
         component._cu_tmp      = mock.Mock()
         component._watch_queue = mock.Mock()
         component._log         = ru.Logger('dummy')
@@ -142,5 +245,155 @@ class TestBase(unittest.TestCase):
         self.assertEqual(len(_pids), 0)
 
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    @mock.patch.object(Popen, 'initialize', return_value=None)
+    def test_spawn_template(self, mocked_init, mocked_initialize):
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        component = Popen()
+        component._cfg           = {'sid'            : 'sid0',
+                                    'pid'            : 'pid0',
+                                    'aid'            : 'aid0',
+                                    'launch_template': True,
+                                    'cu_pre_exec'    : ['export B=cu_pre']}
+        component._uid           = 'exec.0000'
+        component._pwd           = tmp
+        component._cu_tmp        = tmp
+        component.gtod           = 'date'
+        component._prof          = mock.Mock()
+        component._prof.enabled  = False
+        component._log           = mock.Mock()
+        component._watch_queue   = mock.Mock()
+        component._template      = None
+        component._template_env  = None
+
+        launcher = mock.Mock()
+        launcher.construct_command.return_value = \
+                                      ('echo "$RP_UNIT_ID $A $B $C"; false', None)
+
+        cus = list()
+        for i in range(2):
+            sbox = '%s/unit.%04d' % (tmp, i)
+            os.mkdir(sbox)
+            cu = {'uid'              : 'unit.%04d' % i,
+                  'slots'            : {},
+                  'unit_sandbox_path': sbox,
+                  'description'      : {'name'       : None,
+                                        'cpu_threads': 1,
+                                        'environment': {'A': 'a%d' % i},
+                                        'pre_exec'   : ['C=pre'],
+                                        'post_exec'  : ['echo post'],
+                                        'stdout'     : None,
+                                        'stderr'     : None}}
+            component.spawn(launcher=launcher, cu=cu)
+            cus.append(cu)
+
+        # one template for all units, no per-unit launch scripts
+        self.assertEqual(os.listdir(tmp).count('exec.0000.launch.sh'), 1)
+        for i, cu in enumerate(cus):
+            self.assertEqual(cu['proc'].wait(), 1)
+            self.assertFalse(os.path.exists('%s/%s.sh'
+                                            % (cu['unit_sandbox_path'],
+                                               cu['uid'])))
+            with open(cu['stdout_file']) as fin:
+                self.assertEqual(fin.read(), '%s a%d cu_pre pre\npost\n'
+                                             % (cu['uid'], i))
+
+        # launch methods which hop get a per-unit launch script
+        launcher.construct_command.return_value = ('true', '/bin/true')
+        cu = cus[0]
+        component.spawn(launcher=launcher, cu=cu)
+        cu['proc'].wait()
+        self.assertTrue(os.path.exists('%s/%s.sh' % (cu['unit_sandbox_path'],
+                                                     cu['uid'])))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    @mock.patch.object(Popen, 'initialize', return_value=None)
+    def test_prof_batch(self, mocked_init, mocked_initialize):
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        component = Popen()
+        component._cfg           = {'sid': 'sid0',
+                                    'pid': 'pid0',
+                                    'aid': 'aid0'}
+        component._uid           = 'exec.0000'
+        component._pwd           = tmp
+        component._cu_tmp        = tmp
+        component.gtod           = 'date +%s.%N'
+        component._prof          = mock.Mock()
+        component._prof.enabled  = True
+        component._prof_mode     = 'batch'
+        component._prof_batch    = '%s/exec.0000.uprof' % tmp
+        component._log           = mock.Mock()
+        component._watch_queue   = mock.Mock()
+        component._template      = None
+        component._template_env  = None
+
+        os.mkdir(component._prof_batch)
+
+        launcher = mock.Mock()
+        launcher.construct_command.return_value = ('true', None)
+
+        # one unit with a per-unit launch script, one via the template
+        cus = list()
+        for i in range(2):
+            sbox = '%s/unit.%04d' % (tmp, i)
+            os.mkdir(sbox)
+            cu = {'uid'              : 'unit.%04d' % i,
+                  'slots'            : {},
+                  'unit_sandbox_path': sbox,
+                  'description'      : {'name'       : None,
+                                        'cpu_threads': 1,
+                                        'environment': {},
+                                        'pre_exec'   : ['true'],
+                                        'post_exec'  : [],
+                                        'stdout'     : None,
+                                        'stderr'     : None}}
+            component._cfg['launch_template'] = bool(i)
+            component.spawn(launcher=launcher, cu=cu)
+            self.assertEqual(cu['proc'].wait(), 0)
+            cus.append(cu)
+
+        # no profiles in the unit sandboxes, the events are merged from the
+        # per-unit files in the batch directory, which are removed after
+        for cu in cus:
+            component._collect_events(cu['uid'])
+            self.assertFalse(os.path.exists('%s/%s' % (component._prof_batch,
+                                                       cu['uid'])))
+            self.assertFalse(os.path.exists('%s/%s.prof'
+                                            % (cu['unit_sandbox_path'],
+                                               cu['uid'])))
+            events = [c[1]['event'] for c in component._prof.prof.call_args_list
+                                    if  c[1].get('uid') == cu['uid']
+                                    and c[1].get('comp') == 'unit_script']
+            self.assertEqual(events, ['cu_start', 'cu_pre_start',
+                                      'cu_pre_stop', 'cu_exec_start',
+                                      'cu_exec_stop', 'cu_stop'])
+
+        self.assertEqual(os.listdir(component._prof_batch), [])
+
+        # units w/o events are skipped, invalid lines are logged
+        component._prof.reset_mock()
+        component._collect_events('unit.0002')
+        self.assertFalse(component._prof.prof.called)
+
+        with open('%s/unit.0002' % component._prof_batch, 'w') as fout:
+            fout.write('1,5\tev\tunit.0002\tmsg\ninvalid\n')
+        component._collect_events('unit.0002')
+        self.assertTrue(component._log.error.called)
+        component._prof.prof.assert_called_once_with(
+                ts=1.5, event='ev', comp='unit_script', tid='MainThread',
+                uid='unit.0002', state=rps.AGENT_EXECUTING, msg='msg')
+
+
 # ------------------------------------------------------------------------------
 # pylint: enable=protected-access, unused-argument, no-value-for-parameter
@@ -70,3 +70,135 @@ def test__convert_sdurations():
                                ru.STATE: 'arbitrary'},
                               {ru.EVENT: 'arbitrary',
                                ru.STATE: 'arbitrary'}]})
+
+
+# ------------------------------------------------------------------------------
+#
+class _Entity(object):
+
+    # mimics the parts of `radical.analytics.Entity` used by `prof_utils`
+
+    def __init__(self, uid, etype, cfg, events):
+
+        self.uid    = uid
+        self.etype  = etype
+        self.cfg    = cfg
+        self.events = [[t, e, 'comp', 'tid', uid, s, m]
+                       for t, e, s, m in events]
+
+    def timestamps(self, event=None):
+
+        return sorted(e[0] for e in self.events
+                      if all(e[k] == v for k, v in (event or {}).items()))
+
+
+class _Session(object):
+
+    def __init__(self, entities):
+
+        self._entities = entities
+
+    def get(self, etype=None, uid=None):
+
+        if uid:
+            return [e for e in self._entities if e.uid == uid]
+
+        etypes = etype if isinstance(etype, list) else [etype]
+        return [e for e in self._entities if e.etype in etypes]
+
+
+def _create_session():
+
+    from radical.pilot import states as s
+
+    nodes = [['a', 'a'], ['b', 'b'], ['c', 'c']]
+    pcfg  = {'task_launch_method': 'FORK',
+             'resource_details'  : {'rm_info': {
+                                       'cores_per_node': 2,
+                                       'gpus_per_node' : 1,
+                                       'node_list'     : nodes,
+                                       'agent_nodes'   : {'agent_1': ['x',
+                                                                      'x']}}}}
+    pilot = _Entity('pilot.0000', 'pilot', pcfg,
+                    [[ 0, 'bootstrap_0_start', None,          ''],
+                     [ 1, 'bootstrap_0_ok',    None,          ''],
+                     [ 2, 'state',             s.PMGR_ACTIVE, ''],
+                     [90, 'cmd',               None,  'cancel_pilot'],
+                     [99, 'bootstrap_0_stop',  None,          '']])
+
+    units = list()
+    for i, (t, snodes) in enumerate([
+            [10, [{'name': 'a', 'uid': 'a', 'core_map': [[0, 1]],
+                   'gpu_map': [[0]]}]],
+            [20, [{'name': 'b', 'uid': 'b', 'core_map': [[1]],
+                   'gpu_map': []}]],
+            [30, [{'name': 'a', 'uid': 'a', 'core_map': [[0]],
+                   'gpu_map': []},
+                  {'name': 'b', 'uid': 'b', 'core_map': [[0]],
+                   'gpu_map': []}]]]):
+
+        events = [[t + n, e, None, ''] for n, e in enumerate([
+                  'schedule_ok', 'state', 'exec_start', 'cu_start',
+                  'cu_exec_start', 'cu_exec_stop', 'cu_stop', 'exec_stop',
+                  'unschedule_stop'])]
+        events[1][2] = s.AGENT_EXECUTING
+        units.append(_Entity('unit.%04d' % i, 'unit',
+                             {'pilot': 'pilot.0000',
+                              'slots': {'nodes': snodes}}, events))
+
+    # a unit which never got scheduled
+    units.append(_Entity('unit.0003', 'unit', {'pilot': None}, []))
+
+    return _Session([pilot] + units)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_cluster_resources():
+    from radical.pilot.utils.prof_utils import cluster_resources
+
+    assert(cluster_resources([]) == [])
+    assert(cluster_resources([3, 1, 2, 7]) == [[1, 3], [7, 7]])
+    assert(cluster_resources([25, 27, 28, 29]) == [[25, 25], [27, 29]])
+    assert(cluster_resources([[4, 6], 3, [5, 9], 11]) == [[3, 9], [11, 11]])
+
+
+# ------------------------------------------------------------------------------
+#
+def test_get_consumed_resources():
+    import radical.pilot.utils as rpu
+    from radical.pilot.utils.prof_utils import _get_unit_consumption
+
+    session  = _create_session()
+    consumed = rpu.get_consumed_resources(session)
+
+    # 3 resources per node, agent node last
+    assert(consumed['agent']['pilot.0000'] == [[0, 99, 9, 11]])
+    assert(consumed['boot']['pilot.0000']  == [[0, 1, 0, 2],
+                                               [0, 1, 3, 5],
+                                               [0, 1, 6, 8]])
+
+    assert(consumed['exec_cmd']['unit.0000'] == [[14, 15, 0, 2]])
+    assert(consumed['exec_cmd']['unit.0001'] == [[24, 25, 4, 4]])
+    assert(consumed['exec_cmd']['unit.0002'] == [[34, 35, 0, 0],
+                                                 [34, 35, 3, 3]])
+    assert('unit.0003' not in consumed['exec_cmd'])
+
+    # same result when computed for a single unit
+    for uid in ['unit.0000', 'unit.0001', 'unit.0002']:
+        unit = session.get(uid=uid)[0]
+        data = _get_unit_consumption(session, unit)
+        for metric in data:
+            assert(data[metric][uid] == consumed[metric][uid])
+
+    assert(consumed['warm']['pilot.0000'] == [[2, 10, 0, 2],
+                                              [2, 30, 3, 3],
+                                              [2, 20, 4, 4]])
+    assert(consumed['drain']['pilot.0000'] == [[38, 90, 0, 0],
+                                               [38, 90, 3, 3],
+                                               [18, 90, 1, 2],
+                                               [28, 90, 4, 4]])
+    assert(consumed['idle']['pilot.0000'] == [[2, 90, 5, 8]])
+
+
+# ------------------------------------------------------------------------------
@@ -42,6 +42,7 @@ class TestBase(TestCase):
         for node, slot, new_state, result \
                 in zip(nodes, slots, new_states, results):
             component.nodes = node
+            component._index_nodes()
             if result == 'RuntimeError':
                 with self.assertRaises(RuntimeError):
                     component._change_slot_states(slots=slot,
@@ -51,6 +52,20 @@ class TestBase(TestCase):
                 self.assertEqual(component.nodes, result)
 
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_unschedule_units(self, mocked_init):
+
+        component = AgentSchedulingComponent()
+        component.unschedule_unit = mock.Mock()
+
+        units = [{'uid': 'unit.0000'}, {'uid': 'unit.0001'}]
+        component.unschedule_units(units)
+
+        self.assertEqual(component.unschedule_unit.call_count, 2)
+
+
     # ------------------------------------------------------------------------------
     #
     @mock.patch.object(AgentSchedulingComponent, '__init__',
@@ -71,6 +86,7 @@ class TestBase(TestCase):
         component._wait_pool     = list()
         component._wait_lock     = threading.RLock()
         component._slot_lock     = threading.RLock()
+        component._wait_ts       = None
 
         tests = self.setUp()['try_allocation']
         for input_data, result in zip(tests['setup'], tests['results']):
@@ -88,6 +104,89 @@ class TestBase(TestCase):
                              result['description']['environment'])
 
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_schedule_waitpool(self, mocked_init):
+
+        component = AgentSchedulingComponent()
+        component.advance     = mock.Mock()
+        component._waitpool   = dict()
+        component._wait_bins  = list()
+        component._wait_sizes = list()
+        component._wait_count = 0
+        component._wait_limit = None
+
+        # resource model: a pool of free cores
+        free  = {'cores': 4}
+        tried = list()
+
+        def try_allocation(task):
+            tried.append(task['uid'])
+            size = task['tuple_size'][0] * task['tuple_size'][1]
+            if size > free['cores']:
+                return False
+            free['cores'] -= size
+            return True
+
+        component._try_allocation = try_allocation
+
+        tasks = list()
+        for i, (procs, threads) in enumerate([(1, 1), (4, 2), (2, 1), (1, 1),
+                                              (2, 1), (4, 2)]):
+            task = {'uid'        : 'task.%d' % i,
+                    'description': {'cpu_processes'   : procs,
+                                    'cpu_threads'     : threads,
+                                    'gpu_processes'   : 0,
+                                    'cpu_process_type': None}}
+            component._set_tuple_size(task)
+            tasks.append(task)
+
+        component._waitpool_add(tasks)
+        self.assertEqual(component._wait_count, 6)
+        self.assertEqual([ts[:2] for ts in component._wait_bins],
+                         [(4, 2), (2, 1), (1, 1)])
+
+        # largest bin does not fit, then FIFO order within bins
+        resources, active = component._schedule_waitpool()
+        self.assertEqual(tried, ['task.1', 'task.2', 'task.4', 'task.0'])
+        self.assertFalse(resources)
+        self.assertTrue(active)
+        self.assertEqual(component._wait_count, 4)
+        self.assertEqual(component._wait_limit, 0)
+
+        # nothing freed: no bin is checked again
+        tried[:] = []
+        component._schedule_waitpool()
+        self.assertEqual(tried, [])
+
+        # one core freed: only the bins which could fit are checked
+        free['cores'] += 1
+        component._wait_limit += 1
+        component._schedule_waitpool()
+        self.assertEqual(tried, ['task.0', 'task.3'])
+        self.assertEqual(component._wait_count, 3)
+        self.assertEqual([ts[:2] for ts in component._wait_bins],
+                         [(4, 2), (1, 1)])
+
+        # a task which requests memory may fail on memory: it does not limit
+        # the bins checked
+        component._wait_limit = None
+        task = {'uid'        : 'task.6',
+                'description': {'cpu_processes'   : 4,
+                                'cpu_threads'     : 2,
+                                'gpu_processes'   : 0,
+                                'cpu_process_type': None,
+                                'mem_per_process' : 1024}}
+        component._set_tuple_size(task)
+        component._limit_waitpool(task)
+        self.assertIsNone(component._wait_limit)
+
+        task['description']['mem_per_process'] = 0
+        component._limit_waitpool(task)
+        self.assertEqual(component._wait_limit, 7)
+
+
     # --------------------------------------------------------------------------
     #
     @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
@@ -15,6 +15,7 @@ import radical.utils           as ru
 import radical.pilot.constants as rpc
 
 from   radical.pilot.agent.scheduler.continuous import Continuous
+from   radical.pilot.agent.scheduler.inventory  import Inventory
 
 
 # ------------------------------------------------------------------------------
@@ -87,10 +88,10 @@ class TestContinuous(TestCase):
                 try:
 
                     self.assertEqual(
-                        component.nodes[0]['cores'],
+                        list(component.nodes[0]['cores']),
                         [rpc.FREE] * rm_info['cores_per_node'])
                     self.assertEqual(
-                        component.nodes[0]['gpus'],
+                        list(component.nodes[0]['gpus']),
                         [rpc.FREE] * rm_info['gpus_per_node'])
 
                 except AssertionError:
@@ -123,6 +124,7 @@ class TestContinuous(TestCase):
                                      "path" : "/dev/null"},
                           'mem'   : 1024,
                           'gpus'  : [0, 0]}
+        component._inventory = Inventory([component.node])
         component._log = ru.Logger('dummy')
         component._rm_lfs_per_node = {"path" : "/dev/null", "size" : 1234}
         component.cores_per_slot   = 16
@@ -171,6 +173,8 @@ class TestContinuous(TestCase):
         unit['uid'] = cfg[1]['unit']['uid']
         unit['description'] = cfg[1]['unit']['description']
         component.nodes = cfg[1]['setup']['lm']['slots']['nodes']
+        component.nodes[0]['cores'] = [rpc.FREE]
+        component._inventory   = Inventory(component.nodes)
         component._tag_history = dict()
         component._rm_cores_per_node = 32
         component._rm_gpus_per_node  = 2
@@ -210,13 +214,15 @@ class TestContinuous(TestCase):
                 'slots'      : cfg[1]['setup']['lm']['slots']
                }
 
-        component.nodes = cfg[1]['setup']['lm']['slots']['nodes']
-        component._log  = ru.Logger('dummy')
+        component.nodes      = cfg[1]['setup']['lm']['slots']['nodes']
+        component._inventory = Inventory(component.nodes)
+        component._log       = ru.Logger('dummy')
 
         component.unschedule_unit(unit)
+        self.assertEqual(component._inventory.free_cores[0], 1)
         try:
-            self.assertEqual(component.nodes[0]['cores'], [0])
-            self.assertEqual(component.nodes[0]['gpus'], [0])
+            self.assertEqual(list(component.nodes[0]['cores']), [0])
+            self.assertEqual(list(component.nodes[0]['gpus']), [0])
         except:
             with pytest.raises(AssertionError):
                 raise
@@ -120,5 +120,47 @@ def test_state_cb(mocked_init, mocked_try_schedule, mocked_advance):
 
     component._state_cb(topic, msg)
 
+
+# ------------------------------------------------------------------------------
+#
+@mock.patch.object(ContinuousOrdered, '__init__', return_value=None)
+@mock.patch.object(ContinuousOrdered, '_try_schedule', return_value=None)
+def test_state_cb_delta(mocked_try_schedule, mocked_init):
+    '''
+    Test 5 check state_cb on state updates in delta mode (`state_delta`)
+    '''
+    component = ContinuousOrdered(cfg=None, session=None)
+    component._lock          = mt.RLock()
+    component._log           = ru.Logger('dummy')
+    component._prof          = mock.Mock()
+    component._delta         = True
+    component._trigger_state = rps.UMGR_STAGING_OUTPUT_PENDING
+    component._ns            = {'ns.0': {0: {'size': 1,
+                                             'uids': ['unit.000001'],
+                                             'done': list()}}}
+
+    unit = {'uid'        : 'unit.000001',
+            'type'       : 'unit',
+            'state'      : rps.AGENT_STAGING_OUTPUT,
+            'description': {'tags': {'order': {'ns'   : 'ns.0',
+                                               'order': 0,
+                                               'size' : 1}}}}
+    component._units = {unit['uid']: unit}
+
+    # the output stager publishes the complete unit, which in delta mode does
+    # not include the unit description
+    msgs = list()
+    component.publish = lambda pubsub, msg: msgs.append(msg)
+
+    thing = dict(unit)
+    thing['$all'] = True
+    component.advance(thing, rps.UMGR_STAGING_OUTPUT_PENDING,
+                      publish=True, push=False)
+    assert 'description' not in msgs[0]['arg'][0]
+
+    assert component._state_cb(None, msgs[0])
+    assert component._ns['ns.0'][0]['done'] == ['unit.000001']
+    mocked_try_schedule.assert_called_once_with()
+
 # ------------------------------------------------------------------------------
 # pylint: enable=protected-access, unused-argument, no-value-for-parameter
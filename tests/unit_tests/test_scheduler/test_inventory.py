@@ -0,0 +1,144 @@
+
+# pylint: disable=protected-access, no-value-for-parameter, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+from unittest import TestCase
+
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.scheduler.inventory import Inventory
+
+
+# ------------------------------------------------------------------------------
+#
+class TestInventory(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _nodes(self):
+
+        return [{'uid'  : 'node.0000',
+                 'name' : 'a',
+                 'cores': [rpc.FREE] * 8,
+                 'gpus' : [rpc.FREE] * 2,
+                 'lfs'  : {'size': 100, 'path': '/tmp'},
+                 'mem'  : 1024},
+                {'uid'  : 'node.0001',
+                 'name' : 'b',
+                 'cores': [rpc.DOWN] + [rpc.FREE] * 7,
+                 'gpus' : [rpc.FREE] * 2,
+                 'lfs'  : {'size': 100, 'path': '/tmp'},
+                 'mem'  : 1024}]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_init(self):
+
+        nodes = self._nodes()
+        inv   = Inventory(nodes)
+
+        self.assertEqual(len(inv), 2)
+        self.assertEqual(list(inv.free_cores), [8, 7])
+        self.assertEqual(list(inv.free_gpus),  [2, 2])
+        self.assertIsInstance(nodes[0]['cores'], bytearray)
+        self.assertEqual(inv.index('node.0001'), 1)
+
+        with self.assertRaises(RuntimeError):
+            inv.index('node.9999')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_find(self):
+
+        inv = Inventory(self._nodes())
+
+        self.assertEqual(inv.find_cores(1, 3),    [1, 2, 3])
+        self.assertEqual(inv.find_cores(1, 3, 6), None)
+        self.assertEqual(inv.find_gpus (0, 2),    [0, 1])
+        self.assertEqual(inv.find_gpus (0, 3),    None)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_change_slot_states(self):
+
+        nodes = self._nodes()
+        inv   = Inventory(nodes)
+        slots = {'nodes': [{'uid'     : 'node.0001',
+                            'core_map': [[1, 2], [3, 4]],
+                            'gpu_map' : [[1]],
+                            'lfs'     : {'size': 10, 'path': '/tmp'},
+                            'mem'     : 24}]}
+
+        inv.change_slot_states(slots, rpc.BUSY)
+        self.assertEqual(list(inv.free_cores), [8, 3])
+        self.assertEqual(list(inv.free_gpus),  [2, 1])
+        self.assertEqual(nodes[1]['lfs']['size'], 90)
+        self.assertEqual(nodes[1]['mem'], 1000)
+        self.assertEqual(inv.find_cores(1, 1), [5])
+        self.assertEqual(inv.status(), '|--------:--|!####---:-#|')
+
+        inv.change_slot_states(slots, rpc.FREE)
+        self.assertEqual(list(inv.free_cores), [8, 7])
+        self.assertEqual(list(inv.free_gpus),  [2, 2])
+        self.assertEqual(nodes[1]['lfs']['size'], 100)
+        self.assertEqual(nodes[1]['mem'], 1024)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_candidates(self):
+
+        nodes = self._nodes()
+        inv   = Inventory(nodes)
+
+        # best fit first: node 1 has one core less
+        self.assertEqual(list(inv.candidates(1, 0)), [1, 0])
+        self.assertEqual(list(inv.candidates(8, 0)), [0])
+        self.assertEqual(list(inv.candidates(1, 3)), [])
+
+        slots = {'nodes': [{'uid'     : 'node.0000',
+                            'core_map': [[0, 1, 2, 3, 4, 5, 6]],
+                            'gpu_map' : [[0], [1]],
+                            'lfs'     : {'size': 0, 'path': None},
+                            'mem'     : 0}]}
+
+        inv.change_slot_states(slots, rpc.BUSY)
+        self.assertEqual(list(inv.candidates(1, 0)), [0, 1])
+        self.assertEqual(list(inv.candidates(1, 1)), [1])
+        self.assertEqual(list(inv.candidates(2, 0)), [1])
+
+        inv.change_slot_states(slots, rpc.FREE)
+        self.assertEqual(list(inv.candidates(8, 2)), [0])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_release(self):
+
+        nodes = self._nodes()
+        inv   = Inventory(nodes)
+        slots = [{'nodes': [{'uid'     : 'node.0000',
+                             'core_map': [[n]],
+                             'gpu_map' : [],
+                             'lfs'     : {'size': 0, 'path': None},
+                             'mem'     : 0}]} for n in range(8)]
+
+        for s in slots:
+            inv.change_slot_states(s, rpc.BUSY)
+
+        self.assertEqual(list(inv.free_cores), [0, 7])
+        self.assertEqual(list(inv.candidates(1, 0)), [1])
+
+        inv.release(slots[:3])
+        self.assertEqual(list(inv.free_cores), [3, 7])
+        self.assertEqual(list(inv.candidates(1, 0)), [0, 1])
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument, no-value-for-parameter
+
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 # pylint: disable=unused-argument, no-value-for-parameter
+import sys
 import time
 
 from   unittest import mock
 from   unittest import TestCase
 
+import radical.utils as ru
 import radical.pilot as rp
 
+from radical.pilot import utils as rpu
+
 
 # ------------------------------------------------------------------------------
 #
@@ -17,7 +21,7 @@ class TestTask(TestCase):
 
         umgr = rp.UnitManager(session=None)
         umgr.advance = mock.Mock(return_value=True)
-        umgr._uids    = list()
+        umgr._uids    = set()
         umgr._uid     = 'umgr.0000'
         umgr._log     = mock.Mock()
         umgr._prof    = mock.Mock()
@@ -42,6 +46,109 @@ class TestTask(TestCase):
         descr = rp.ComputeUnitDescription({'executable': 'true'})
         self.assertEqual(rp.ComputeUnit(umgr, descr).uid, 'unit.000001')
 
+        # pre-allocated uids are used if the description has none
+        self.assertEqual(rp.ComputeUnit(umgr, descr, uid='baz').uid, 'baz')
+
+        # units are not advanced if the umgr does that in bulk
+        umgr.advance.reset_mock()
+        rp.ComputeUnit(umgr, descr, advance=False)
+        umgr.advance.assert_not_called()
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_task_compact(self, mocked_init):
+
+        umgr = rp.UnitManager(session=None)
+        umgr.advance  = mock.Mock(return_value=True)
+        umgr._uids    = set()
+        umgr._uid     = 'umgr.0000'
+        umgr._log     = mock.Mock()
+        umgr._session = mock.Mock()
+        umgr._session.uid = str(time.time())
+
+        descr = rp.ComputeUnitDescription({'executable': 'true',
+                                           'arguments' : ['1'],
+                                           'metadata'  : [{'a': 1}]})
+        check = rp.ComputeUnitDescription(descr.as_dict()).verify().as_dict()
+        check['input_staging']  = list()
+        check['output_staging'] = list()
+
+        unit = rp.ComputeUnit(umgr, descr)
+
+        # only non-default values are kept, the full description is returned
+        self.assertEqual(set(unit._descr), {'executable', 'arguments',
+                                            'metadata'})
+        self.assertEqual(unit.description, check)
+        self.assertEqual(unit.as_dict()['description'], check)
+        self.assertEqual(unit.name, '')
+        self.assertEqual(unit.metadata, [{'a': 1}])
+
+        # default containers are not shared between units
+        unit.description['environment']['A'] = 'b'
+        unit._as_dict()['description']['pre_exec'].append('x')
+        self.assertEqual(rp.ComputeUnit(umgr, descr).description, check)
+
+        # units are slotted, and shared strings are interned
+        with self.assertRaises(AttributeError):
+            unit.foo = 'bar'
+
+        sbox = 'file://localhost/tmp/'
+        unit._update({'uid'          : unit.uid,
+                      'state'        : rp.UMGR_SCHEDULING_PENDING,
+                      'pilot_sandbox': ''.join(sbox)})
+        self.assertIs(unit.pilot_sandbox, sys.intern(sbox))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_verified_dict(self):
+
+        descr = rp.ComputeUnitDescription({'executable'   : 'true',
+                                           'arguments'    : ['a', 1],
+                                           'environment'  : {'A': 'b'},
+                                           'cpu_processes': '4',
+                                           'restartable'  : 'yes',
+                                           'input_staging': ['a > b'],
+                                           'tags'         : {'x': 'y'}})
+        check = rp.ComputeUnitDescription(descr.as_dict()).verify().as_dict()
+        ret   = descr.as_verified_dict()
+
+        self.assertEqual(ret, check)
+        self.assertEqual(ret['arguments'],     ['a', '1'])
+        self.assertEqual(ret['cpu_processes'], 4)
+        self.assertEqual(ret['restartable'],   True)
+
+        # the result is a copy, the description itself is not changed
+        self.assertIsNot(ret['environment'],   descr['environment'])
+        self.assertIsNot(ret['input_staging'], descr['input_staging'])
+        self.assertEqual(descr['cpu_processes'], '4')
+
+        with self.assertRaises(TypeError):
+            rp.ComputeUnitDescription({'executable'   : 'true',
+                                       'cpu_processes': 'x'}
+                                     ).as_verified_dict()
+
+        with self.assertRaises(ValueError):
+            rp.ComputeUnitDescription({'arguments': ['a']}).as_verified_dict()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_generate_ids(self):
+
+        ns   = 'rp.test.%s' % time.time()
+        tmpl = 'unit.%(item_counter)06d'
+
+        self.assertEqual(ru.generate_id(tmpl, ru.ID_CUSTOM, ns=ns),
+                         'unit.000000')
+        self.assertEqual(rpu.generate_ids(tmpl, 3, ns=ns),
+                         ['unit.000001', 'unit.000002', 'unit.000003'])
+        self.assertEqual(rpu.generate_ids(tmpl, 0, ns=ns), [])
+        self.assertEqual(ru.generate_id(tmpl, ru.ID_CUSTOM, ns=ns),
+                         'unit.000004')
+
 
 # ------------------------------------------------------------------------------
 #
@@ -49,6 +156,9 @@ if __name__ == '__main__':
 
     tc = TestTask()
     tc.test_task_uid()
+    tc.test_task_compact()
+    tc.test_verified_dict()
+    tc.test_generate_ids()
 
 
 # ------------------------------------------------------------------------------
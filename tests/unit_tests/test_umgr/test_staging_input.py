@@ -0,0 +1,155 @@
+# pylint: disable=protected-access, unused-argument, no-value-for-parameter
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import tempfile
+
+from unittest import mock
+from unittest import TestCase
+
+import radical.utils as ru
+
+import radical.pilot.states    as rps
+import radical.pilot.constants as rpc
+
+from radical.pilot.umgr.staging_input.default import Default, _InputCache
+
+
+# ------------------------------------------------------------------------------
+#
+class TestStagingInput(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def test_input_cache(self):
+
+        cache = _InputCache(size=100)
+
+        self.assertFalse(cache.get('a'))
+        self.assertEqual(cache.put('a', 40), [])
+        self.assertEqual(cache.put('b', 40), [])
+        self.assertIsNone(cache.put('x', 101))
+        self.assertTrue(cache.get('a'))
+
+        # all entries are pinned: no eviction, size is exceeded
+        self.assertEqual(cache.put('c', 40), [])
+
+        # LRU order is 'b', 'a', 'c', but 'a' is pinned twice
+        for key in ['a', 'b', 'c']:
+            cache.release(key)
+        self.assertEqual(cache.put('d', 40), ['b', 'c'])
+
+        cache.release('a')
+        self.assertEqual(cache.put('e', 40), ['a'])
+
+        cache.drop('e')
+        self.assertFalse(cache.get('e'))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Default, '__init__', return_value=None)
+    def test_stage_cached(self, mocked_init):
+
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, b'data')
+        os.close(fd)
+        self.addCleanup(os.unlink, fname)
+
+        comp = Default(cfg=None, session=None)
+        comp._uid        = 'umgr.staging.input.0000'
+        comp._log        = mock.Mock()
+        comp._prof       = mock.Mock()
+        comp._cache_dir  = 'input_cache/%s' % comp._uid
+        comp._cache_size = 1024
+        comp._caches     = dict()
+        comp._cache_pins = dict()
+        comp._cache_lock = ru.RLock()
+
+        saga_dir = mock.Mock()
+        src      = ru.Url('file://localhost%s' % fname)
+        ctx      = {'pwd'     : 'file://localhost/p/unit.0000/',
+                    'unit'    : 'file://localhost/p/unit.0000/',
+                    'pilot'   : 'file://localhost/p/',
+                    'resource': 'file://localhost/'}
+
+        units = list()
+        for i in range(2):
+            unit = {'uid'        : 'unit.%04d' % i,
+                    'pilot'      : 'pilot.0000',
+                    'description': {'input_staging': []}}
+            sd   = {'uid'   : 'sd.%04d' % i,
+                    'action': rpc.TRANSFER,
+                    'flags' : rpc.CACHED,
+                    'source': str(src),
+                    'target': 'unit:///input.dat'}
+            self.assertTrue(comp._stage_cached(unit, sd, src, saga_dir, ctx))
+            units.append(unit)
+
+        # the file is transferred once, and linked for both units
+        self.assertEqual(saga_dir.copy.call_count, 1)
+        events = [c[0][0] for c in comp._prof.prof.call_args_list]
+        self.assertIn('staging_in_cache_miss', events)
+        self.assertIn('staging_in_cache_hit',  events)
+
+        links = [u['description']['input_staging'][0] for u in units]
+        self.assertEqual(links[0]['source'], links[1]['source'])
+        self.assertTrue(links[0]['source'].startswith(
+                                            'pilot:///input_cache/umgr.'))
+        self.assertEqual(links[0]['action'], rpc.LINK)
+        self.assertEqual(links[0]['target'], 'unit:///input.dat')
+
+        # final units release their pins
+        cache = comp._caches['pilot.0000']
+        key   = os.path.basename(links[0]['source'])
+        self.assertEqual(cache._entries[key][1], 2)
+
+        comp._cache_state_cb(None, {'cmd': 'update',
+                                    'arg': [{'type' : 'unit',
+                                             'uid'  : 'unit.0000',
+                                             'state': rps.DONE},
+                                            {'type' : 'unit',
+                                             'uid'  : 'unit.0001',
+                                             'state': rps.AGENT_EXECUTING}]})
+        self.assertEqual(cache._entries[key][1], 1)
+        self.assertNotIn('unit.0000', comp._cache_pins)
+
+        # files which don't fit are not cached
+        comp._cache_size = 2
+        self.assertFalse(comp._stage_cached({'uid': 'unit.0002',
+                                             'pilot': 'pilot.0002'},
+                                            {'uid': 'sd.0002'},
+                                            src, saga_dir, ctx))
+        comp._cache_size = 1024
+
+        # failed transfers leave no cache entry behind
+        saga_dir.copy.side_effect = OSError('copy failed')
+        with self.assertRaises(OSError):
+            comp._stage_cached({'uid': 'unit.0003', 'pilot': 'pilot.0001',
+                                'description': {'input_staging': []}},
+                               {'uid': 'sd.0003', 'target': 'input.dat'},
+                               src, saga_dir, ctx)
+        self.assertEqual(comp._caches['pilot.0001']._entries, {})
+        self.assertNotIn('unit.0003', comp._cache_pins)
+
+        # ... and no pin: the failed unit does not release the entry when it
+        # is re-added for another unit
+        saga_dir.copy.side_effect = None
+        unit = {'uid'        : 'unit.0004',
+                'pilot'      : 'pilot.0001',
+                'description': {'input_staging': []}}
+        self.assertTrue(comp._stage_cached(unit, {'uid': 'sd.0004',
+                                                  'target': 'input.dat'},
+                                           src, saga_dir, ctx))
+        comp._cache_state_cb(None, {'cmd': 'update',
+                                    'arg': [{'type' : 'unit',
+                                             'uid'  : 'unit.0003',
+                                             'state': rps.FAILED}]})
+        self.assertEqual(comp._caches['pilot.0001']._entries[key][1], 1)
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument, no-value-for-parameter
+
@@ -0,0 +1,268 @@
+
+# pylint: disable=protected-access, unused-argument, no-value-for-parameter
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import time
+import tempfile
+import threading as mt
+
+from unittest import mock
+from unittest import TestCase
+
+import radical.utils  as ru
+import radical.pilot  as rp
+
+import radical.pilot.states as rps
+
+
+# ------------------------------------------------------------------------------
+#
+class TestUnitManager(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _umgr(self, n):
+
+        umgr = rp.UnitManager(session=None)
+        umgr._log        = mock.Mock()
+        umgr._rep        = mock.Mock()
+        umgr._units_lock = ru.RLock()
+        umgr._terminate  = mt.Event()
+        umgr._waiters    = list()
+        umgr._units      = dict()
+
+        def _update(unit, unit_dict):
+            unit.state = unit_dict['state']
+
+        for i in range(n):
+            unit = mock.Mock()
+            unit.uid   = 'unit.%04d' % i
+            unit.state = rps.AGENT_EXECUTING
+            unit._update.side_effect = lambda d, u=unit: _update(u, d)
+            umgr._units[unit.uid] = unit
+
+        return umgr
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _finish(self, umgr, uids, state=rps.DONE):
+
+        for uid in uids:
+            umgr._update_unit({'uid': uid, 'state': state})
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_wait_units(self, mocked_init):
+
+        umgr = self._umgr(4)
+        umgr._units['unit.0000'].state = rps.DONE
+
+        # units in final states are not waited for, and a wait times out
+        states = umgr.wait_units(['unit.0000', 'unit.0001'], timeout=0.1)
+        self.assertEqual(states, [rps.DONE, rps.AGENT_EXECUTING])
+        self.assertEqual(umgr._waiters, list())
+
+        # waiting returns once the last unit has been updated
+        timer = mt.Timer(0.1, self._finish,
+                         args=[umgr, ['unit.0001', 'unit.0002', 'unit.0003']])
+        timer.start()
+        states = umgr.wait_units(timeout=10)
+        timer.join()
+
+        self.assertEqual(states, [rps.DONE] * 3)
+        self.assertEqual(umgr.wait_units('unit.0003',
+                                         state=rps.AGENT_EXECUTING), rps.DONE)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_as_completed(self, mocked_init):
+
+        umgr = self._umgr(4)
+        umgr._units['unit.0002'].state = rps.FAILED
+
+        # units are yielded in the order they complete, final ones first
+        timer = mt.Timer(0.1, self._finish,
+                         args=[umgr, ['unit.0003', 'unit.0000', 'unit.0001']])
+        timer.start()
+        uids = [unit.uid for unit in umgr.as_completed(timeout=10)]
+        timer.join()
+
+        self.assertEqual(uids, ['unit.0002', 'unit.0003',
+                                'unit.0000', 'unit.0001'])
+        self.assertEqual(umgr._waiters, list())
+
+        # the iterator stops on timeout
+        umgr = self._umgr(2)
+        units = list(umgr.as_completed(list(umgr._units.values()),
+                                       timeout=0.1))
+        self.assertEqual(units, list())
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _submit_umgr(self):
+
+        umgr = self._umgr(0)
+        umgr._uid      = 'umgr.0000'
+        umgr._uids     = set()
+        umgr._prof     = mock.Mock()
+        umgr._session  = mock.Mock()
+        umgr._rec_id   = 0
+        umgr.advance   = mock.Mock()
+
+        umgr._session.uid  = 'rp.test.%s' % time.time()
+        umgr._session._rec = None
+
+        return umgr
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_submit_units(self, mocked_init):
+
+        umgr = self._submit_umgr()
+
+        descrs = [rp.ComputeUnitDescription({'executable': 'true',
+                                             'arguments' : [str(i)]})
+                  for i in range(3)]
+        descrs[1].uid = 'foo'
+
+        units = umgr.submit_units(descrs)
+
+        self.assertEqual([u.uid for u in units],
+                         ['unit.000000', 'foo', 'unit.000001'])
+        self.assertEqual(set(umgr._units), {'unit.000000', 'foo',
+                                            'unit.000001'})
+
+        # all units are inserted and advanced as one bulk
+        docs = umgr._session._dbs.insert_units.call_args[0][0]
+        self.assertEqual([d['uid'] for d in docs], [u.uid for u in units])
+        self.assertEqual(docs[2]['description']['arguments'], ['2'])
+
+        states = [c[0][1] for c in umgr.advance.call_args_list]
+        self.assertEqual(states, [rps.NEW, rps.UMGR_SCHEDULING_PENDING])
+
+        # `unit.description` still returns a copy
+        self.assertIsNot(units[0].description, docs[0]['description'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_stream_units(self, mocked_init):
+
+        umgr  = self._submit_umgr()
+        held  = list()   # units handed to the scheduler, not yet scheduled
+        stats = {'max_held': 0}
+        lock  = mt.Lock()
+
+        def _advance(docs, state, **kwargs):
+            if state == rps.UMGR_SCHEDULING_PENDING:
+                with lock:
+                    held.extend([doc['uid'] for doc in docs])
+                    stats['max_held'] = max(stats['max_held'], len(held))
+
+        # the scheduler places the held units every few milliseconds
+        def _schedule():
+            while not umgr._terminate.is_set():
+                with lock:
+                    uids = list(held)
+                    del held[:]
+                self._finish(umgr, uids, rps.UMGR_STAGING_INPUT_PENDING)
+                time.sleep(0.01)
+
+        umgr.advance.side_effect = _advance
+        scheduler = mt.Thread(target=_schedule)
+        scheduler.start()
+
+        try:
+            descrs = (rp.ComputeUnitDescription({'executable': 'true'})
+                      for _ in range(20))
+            units  = list(umgr.stream_units(descrs, chunk_size=2,
+                                            max_pending=4))
+        finally:
+            umgr._terminate.set()
+            scheduler.join()
+
+        self.assertEqual([u.uid for u in units],
+                         ['unit.%06d' % i for i in range(20)])
+        self.assertEqual(umgr._session._dbs.insert_units.call_count, 10)
+        self.assertEqual(umgr._waiters, list())
+
+        # no chunk is created while `max_pending` units are unscheduled
+        self.assertLess(stats['max_held'], 4 + 2)
+
+        # insert errors are raised to the caller
+        umgr = self._submit_umgr()
+        umgr._session._dbs.insert_units.side_effect = RuntimeError('oops')
+        descrs = [rp.ComputeUnitDescription({'executable': 'true'})] * 4
+        with self.assertRaises(RuntimeError):
+            list(umgr.stream_units(descrs, chunk_size=2))
+
+        with self.assertRaises(ValueError):
+            list(umgr.stream_units(descrs, chunk_size=0))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_evict_output(self, mocked_init):
+
+        umgr  = self._submit_umgr()
+        descr = rp.ComputeUnitDescription({'executable': 'true'})
+        units = umgr.submit_units([descr] * 3)
+
+        umgr._evict = True
+        umgr._cfg   = ru.Config(cfg={'path': tempfile.mkdtemp()})
+
+        outputs = [('out 0', 'err 0'), ('out \u2713', None), (None, None)]
+        for unit, (out, err) in zip(units, outputs):
+            umgr._update_unit({'uid'   : unit.uid,
+                               'state' : rps.DONE,
+                               'stdout': out,
+                               'stderr': err})
+
+        # output is kept on disk, not in memory
+        self.assertEqual([unit._stdout for unit in units], [None] * 3)
+        self.assertIsNone(units[2]._stdio)
+
+        self.assertEqual([(u.stdout, u.stderr) for u in units], outputs)
+
+        # the store is still readable after the umgr closed it
+        umgr._output.close()
+        self.assertEqual(units[1].stdout, 'out \u2713')
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(rp.UnitManager, '__init__', return_value=None)
+    def test_tail_units_cb(self, mocked_init):
+
+        umgr = rp.UnitManager(session=None)
+        umgr._cb_lock = mock.MagicMock()
+
+        # units pulled by the tail thread are advanced (and published) under
+        # the callback lock
+        def _ingest(units):
+            self.assertTrue(umgr._cb_lock.__enter__.called)
+            self.assertFalse(umgr._cb_lock.__exit__.called)
+            return True
+
+        umgr._ingest_units_cb = mock.Mock(side_effect=_ingest)
+
+        self.assertTrue(umgr._tail_units_cb(['unit']))
+        umgr._ingest_units_cb.assert_called_once_with(['unit'])
+        self.assertTrue(umgr._cb_lock.__exit__.called)
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument, no-value-for-parameter
+
@@ -0,0 +1,173 @@
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import shutil
+import tempfile
+import threading as mt
+
+from unittest import TestCase
+
+import radical.pilot.utils as rpu
+
+
+# ------------------------------------------------------------------------------
+#
+class _Collection(object):
+    '''
+    A minimal in-memory stand-in for a pymongo collection which supports the
+    queries used by `get_session_docs()`, and records those queries.
+    '''
+
+    def __init__(self, docs):
+        self.docs    = docs
+        self.queries = list()
+        self._lock   = mt.Lock()
+
+    def _match(self, doc, query):
+        for k, v in query.items():
+            if isinstance(v, dict) and '$in' in v:
+                if doc.get(k) not in v['$in']: return False
+            elif doc.get(k) != v:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        with self._lock:
+            self.queries.append([query, projection])
+        ret = [dict(doc) for doc in self.docs if self._match(doc, query)]
+        if projection:
+            ret = [{k: doc[k] for k in projection + ['_id'] if k in doc}
+                   for doc in ret]
+        return iter(ret)
+
+
+# ------------------------------------------------------------------------------
+#
+class TestDBUtils(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def setUp(self):
+
+        self._tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp)
+
+        self._sid  = 'rp.session.0000'
+        self._docs = [{'_id': self._sid, 'uid': self._sid, 'type': 'session'},
+                      {'_id': 'pmgr.0000', 'uid': 'pmgr.0000', 'type': 'pmgr'},
+                      {'_id': 'umgr.0000', 'uid': 'umgr.0000', 'type': 'umgr'}]
+
+        for pid in ['pilot.0000', 'pilot.0001']:
+            self._docs.append({'_id': pid, 'uid': pid, 'type': 'pilot',
+                               'state': 'PMGR_ACTIVE'})
+
+        for i in range(5):
+            uid = 'unit.%06d' % i
+            self._docs.append({'_id': uid, 'uid': uid, 'type': 'unit',
+                               'pilot': 'pilot.000%d' % (i % 2),
+                               'state': 'DONE' if i < 3 else 'AGENT_EXECUTING',
+                               'stdout': 'out %d' % i})
+
+        self._coll = _Collection(self._docs)
+        self._db   = {self._sid: self._coll}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get(self, **kwargs):
+
+        return rpu.get_session_docs(self._db, self._sid, cachedir=self._tmp,
+                                    **kwargs)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_session_docs(self):
+
+        docs = self._get()
+
+        self.assertEqual(docs['session']['uid'], self._sid)
+        self.assertEqual([d['uid'] for d in docs['pmgr']], ['pmgr.0000'])
+        self.assertEqual(len(docs['unit']), 5)
+        self.assertEqual(docs['pilot'][0]['unit_ids'],
+                         ['unit.000000', 'unit.000002', 'unit.000004'])
+        self.assertEqual(docs['pilot'][1]['unit_ids'],
+                         ['unit.000001', 'unit.000003'])
+        self.assertEqual(sorted(os.listdir('%s/%s' % (self._tmp, self._sid))),
+                         ['index.json', 'pilot.json', 'pmgr.json',
+                          'session.json', 'umgr.json', 'unit.json'])
+
+        # a second call reads the cache, but needs to refresh the units and
+        # pilots which are not final
+        self._coll.queries = list()
+        self.assertEqual(self._get(), docs)
+
+        fetched = [q['uid']['$in'] for q, _ in self._coll.queries
+                                   if 'uid' in q]
+        self.assertEqual(sorted(fetched),
+                         [['pilot.0000', 'pilot.0001'],
+                          ['unit.000003', 'unit.000004']])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_session_docs_missing(self):
+
+        self._docs.pop(0)
+        with self.assertRaises(ValueError):
+            self._get()
+
+        self.assertFalse(os.path.exists('%s/%s' % (self._tmp, self._sid)))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_session_docs_refresh(self):
+
+        self._get()
+
+        # units progress and a new unit appears
+        for doc in self._docs:
+            if doc['type'] in ['pilot', 'unit']:
+                doc['state'] = 'DONE'
+        self._docs.append({'_id': 'unit.000005', 'uid': 'unit.000005',
+                           'type': 'unit', 'pilot': 'pilot.0001',
+                           'state': 'FAILED'})
+
+        docs = self._get()
+        self.assertEqual([d['state'] for d in docs['unit']],
+                         ['DONE'] * 5 + ['FAILED'])
+        self.assertEqual(docs['pilot'][1]['unit_ids'],
+                         ['unit.000001', 'unit.000003', 'unit.000005'])
+
+        # all docs are final now: the DB is not used anymore
+        self._coll.queries = list()
+        self.assertEqual(self._get(), docs)
+        self.assertEqual(self._coll.queries, [])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_session_docs_fields(self):
+
+        self._get()
+        docs = self._get(fields={'unit': ['state'], 'pilot': []})
+
+        self.assertEqual(docs['unit'][0], {'uid'  : 'unit.000000',
+                                           'pilot': 'pilot.0000',
+                                           'state': 'DONE'})
+        self.assertEqual(docs['pilot'][1],
+                         {'uid'     : 'pilot.0001',
+                          'unit_ids': ['unit.000001', 'unit.000003']})
+        self.assertIn('type', docs['pmgr'][0])
+
+        # the cache holds the complete docs
+        self.assertEqual(self._get()['unit'][0]['stdout'], 'out 0')
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument
+
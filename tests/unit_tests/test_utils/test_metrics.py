@@ -0,0 +1,141 @@
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import json
+import shutil
+import socket
+import tempfile
+
+from unittest import TestCase, mock
+
+import radical.pilot.utils as rpu
+
+
+# ------------------------------------------------------------------------------
+#
+class TestMetrics(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def test_metrics(self):
+
+        metrics = rpu.Metrics('comp.0000')
+
+        metrics.inc('units_in', 3, 'queue_a')
+        metrics.inc('units_in', 2, 'queue_a')
+        metrics.inc('units_spawned')
+        metrics.set('waitpool', 7)
+        metrics.observe('bulk_in', [1, 3, 4, 5000], 'queue_a')
+        metrics.observe('latency', 0.5, buckets=rpu.LATENCY_BUCKETS)
+
+        snap = metrics.snapshot()
+
+        self.assertEqual(snap['uid'], 'comp.0000')
+        self.assertEqual(snap['counters'], {'units_in'     : {'queue_a': 5},
+                                            'units_spawned': {''       : 1}})
+        self.assertEqual(snap['gauges'], {'waitpool': {'': 7}})
+
+        hist = snap['hists']['bulk_in']['queue_a']
+        self.assertEqual(hist['counts'], [1, 2, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(hist['count'], 4)
+        self.assertEqual(hist['sum'], 5008)
+        self.assertEqual(snap['hists']['latency']['']['counts'],
+                         [0, 0, 0, 1, 0, 0, 0, 0])
+
+        # snapshots are copies
+        metrics.inc('units_in', 1, 'queue_a')
+        self.assertEqual(snap['counters']['units_in']['queue_a'], 5)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_metrics_server(self):
+
+        srv = rpu.MetricsServer('unused', log=mock.Mock())
+
+        put = rpu.Metrics('comp.0000')
+        get = rpu.Metrics('comp.0001')
+
+        put.inc('units_out', 10, 'queue_a')
+        get.inc('units_in',   4, 'queue_a')
+        get.observe('bulk_in', 4, 'queue_a')
+
+        srv.collect_cb(None, {'cmd': 'cancel_units', 'arg': None})
+        srv.collect_cb(None, {'cmd': 'metrics', 'arg': put.snapshot()})
+
+        prev = get.snapshot()
+        srv.collect(prev)
+
+        get.inc('units_in', 2, 'queue_a')
+        snap = get.snapshot()
+        snap['ts'] = prev['ts'] + 1.0
+        srv.collect(snap)
+
+        metrics = srv.get_metrics()
+        self.assertEqual(metrics['queues'], {'queue_a': 4})
+        self.assertEqual(sorted(metrics['components']),
+                         ['comp.0000', 'comp.0001'])
+        self.assertEqual(metrics['components']['comp.0000']['rates'], {})
+        self.assertAlmostEqual(metrics['components']['comp.0001']
+                                      ['rates']['units_in']['queue_a'], 2.0)
+
+        text = srv.get_text().split('\n')
+        self.assertIn('# TYPE rp_units_in_total counter', text)
+        self.assertIn('rp_units_in_total{component="comp.0001",'
+                      'label="queue_a"} 6', text)
+        self.assertIn('rp_bulk_in_bucket{component="comp.0001",'
+                      'label="queue_a",le="4"} 1', text)
+        self.assertIn('rp_bulk_in_bucket{component="comp.0001",'
+                      'label="queue_a",le="+Inf"} 1', text)
+        self.assertIn('rp_bulk_in_count{component="comp.0001",'
+                      'label="queue_a"} 1', text)
+        self.assertIn('rp_queue_depth{queue="queue_a"} 4', text)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_metrics_server_http(self):
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        srv = rpu.MetricsServer('%s/metrics.sock' % tmp, log=mock.Mock())
+        srv.start()
+        self.addCleanup(srv.stop)
+
+        metrics = rpu.Metrics('comp.0000')
+        metrics.inc('units_spawned', 3)
+        srv.collect(metrics.snapshot())
+
+        def _get(path):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(srv.addr)
+            sock.sendall(b'GET %s HTTP/1.0\r\n\r\n' % path.encode())
+            data = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            sock.close()
+            head, body = data.decode().split('\r\n\r\n', 1)
+            return head.split('\r\n')[0], body
+
+        status, body = _get('/metrics.json')
+        self.assertIn('200', status)
+        self.assertEqual(json.loads(body)['components']['comp.0000']
+                                         ['counters']['units_spawned'], {'': 3})
+
+        status, body = _get('/metrics')
+        self.assertIn('200', status)
+        self.assertIn('rp_units_spawned_total{component="comp.0000"} 3', body)
+
+        status, _ = _get('/foo')
+        self.assertIn('404', status)
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument
+
@@ -0,0 +1,110 @@
+
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import time
+import tempfile
+import threading as mt
+
+from unittest import TestCase, mock
+
+import radical.utils       as ru
+import radical.pilot.utils as rpu
+
+
+# ------------------------------------------------------------------------------
+#
+class TestMisc(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _write(self, data):
+
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+        self.addCleanup(os.unlink, fname)
+
+        return fname
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_tail_file(self):
+
+        cut = '[... CONTENT SHORTENED ...]'
+
+        # small files are returned in full
+        fname = self._write(b'0123456789')
+        self.assertEqual(rpu.tail_file(fname, 10), '0123456789')
+        self.assertEqual(rpu.tail_file(fname, 5, 5), '0123456789')
+
+        # large files are cut
+        self.assertEqual(rpu.tail_file(fname, 4), '%s\n6789' % cut)
+        self.assertEqual(rpu.tail_file(fname, 4, 2), '01\n%s\n6789' % cut)
+
+        # multibyte characters split by the cuts are dropped
+        fname = self._write('✓abc✓'.encode('utf-8'))
+        self.assertEqual(rpu.tail_file(fname, 4, 2), '%s\nc✓' % cut)
+        self.assertEqual(rpu.tail_file(fname, 2, 4), '✓a\n%s\n' % cut)
+
+        # binary content is detected
+        fname = self._write(b'\xff\xfe\x00' * 10)
+        self.assertIsNone(rpu.tail_file(fname, 100))
+        self.assertIsNone(rpu.tail_file(fname, 4))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_generate_ids(self):
+
+        # mix `generate_ids()` and `ru.generate_id()`, sequentially and
+        # concurrently: the counters are continuous and unique
+        ns      = 'rp.test.%s' % time.time()
+        tmpl    = 'rp.%(item_counter)04d.unit'
+        ids     = list()
+        lock    = mt.Lock()
+
+        def _single():
+            uids = [ru.generate_id(tmpl, ru.ID_CUSTOM, ns=ns)
+                    for _ in range(10)]
+            with lock:
+                ids.extend(uids)
+
+        def _bulk():
+            uids = list()
+            for n in range(1, 5):
+                uids += rpu.generate_ids(tmpl, n, ns=ns)
+            with lock:
+                ids.extend(uids)
+
+        ids.append(ru.generate_id(tmpl, ru.ID_CUSTOM, ns=ns))
+        ids.extend(rpu.generate_ids(tmpl, 3, ns=ns))
+        ids.append(ru.generate_id(tmpl, ru.ID_CUSTOM, ns=ns))
+
+        self.assertEqual(ids, ['rp.0000.unit', 'rp.0001.unit', 'rp.0002.unit',
+                               'rp.0003.unit', 'rp.0004.unit'])
+        self.assertEqual(rpu.generate_ids(tmpl, 0, ns=ns), [])
+
+        threads = [mt.Thread(target=_single) for _ in range(4)] \
+                + [mt.Thread(target=_bulk)   for _ in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        self.assertEqual(sorted(ids), [tmpl % {'item_counter': i}
+                                       for i in range(5 + 4 * 10 + 4 * 10)])
+
+        # a bulk call of radical.utils is used if available
+        with mock.patch.object(ru, 'generate_ids', create=True,
+                               return_value=['a', 'b']) as mocked_bulk:
+            self.assertEqual(rpu.generate_ids(tmpl, 2, ns=ns), ['a', 'b'])
+            mocked_bulk.assert_called_once_with(tmpl, 2, mode=ru.ID_CUSTOM,
+                                                ns=ns)
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument
+
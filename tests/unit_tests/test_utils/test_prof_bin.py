@@ -0,0 +1,125 @@
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+import radical.utils       as ru
+import radical.pilot.utils as rpu
+
+
+# ------------------------------------------------------------------------------
+#
+class TestProfBin(TestCase):
+
+    _sid = 'rp.session.test.0000'
+
+    # --------------------------------------------------------------------------
+    #
+    def setUp(self):
+
+        self._tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp)
+
+        self._src = '%s/%s' % (self._tmp, self._sid)
+        os.makedirs('%s/pilot.0000' % self._src)
+
+        sync = 'host:127.0.0.1:%s:%s:sys'
+        with open('%s/umgr.0000.prof' % self._src, 'w') as fout:
+            fout.write('#time,event,comp,thread,uid,state,msg\n')
+            fout.write('10.0,sync_abs,umgr,MainThread,,,%s\n'
+                       % (sync % (10.0, 10.0)))
+            fout.write('11.0,advance,umgr,MainThread,unit.0000,NEW,\n')
+            fout.write('11.5,advance,umgr,MainThread,unit.0001,NEW,\n')
+            fout.write('12.0,publish,umgr,MainThread,unit.0000,,\n')
+            fout.write('13.0,END,umgr,MainThread,,,\n')
+
+        with open('%s/pilot.0000/agent_0.prof' % self._src, 'w') as fout:
+            fout.write('#time,event,comp,thread,uid,state,msg\n')
+            fout.write('20.0,sync_abs,agent_0,MainThread,,,%s\n'
+                       % (sync % (20.0, 20.0)))
+            fout.write('21.0,exec_start,agent_0,MainThread,unit.0000,,\n')
+            fout.write('22.0,exec_start,agent_0,MainThread,unit.0001,,\n')
+            fout.write('23.0,exec_stop,agent_0,MainThread,unit.0000,,ü\n')
+            fout.write('24.0,END,agent_0,MainThread,,,\n')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_write_read(self):
+
+        fname   = '%s/test.bprof' % self._tmp
+        profile = [[1.0, 'a', 'c', 't', 'unit.0001', None,  'm', 'unit'],
+                   [2.0, 'b', 'c', 't', 'unit.0000', 'NEW', 'ü', 'unit'],
+                   [3.0, 'a', 'c', 't', 'unit.0001', None,  '',  'unit'],
+                   [4.0, 'x', 'c', 't', 'sid',       None,  '',  'session']]
+
+        rpu.write_binary_profile(fname, profile, 'sid', 0.5, {'p': 'h'})
+
+        with rpu.BinaryProfile(fname) as prof:
+
+            self.assertEqual(len(prof),     4)
+            self.assertEqual(prof.rows(),   profile)
+            self.assertEqual(prof.row(1),   profile[1])
+            self.assertEqual(prof.sid,      'sid')
+            self.assertEqual(prof.accuracy, 0.5)
+            self.assertEqual(prof.hostmap,  {'p': 'h'})
+            self.assertEqual(prof.uids(),   ['sid', 'unit.0000', 'unit.0001'])
+            self.assertEqual(prof.events(), ['a', 'b', 'x'])
+
+            self.assertEqual(prof.rows(uid='unit.0001'),
+                             [profile[0], profile[2]])
+            self.assertEqual(prof.rows(event='b'), [profile[1]])
+            self.assertEqual(prof.rows(uid='unit.0001', event='b'), [])
+            self.assertEqual(prof.rows(uid='unit.0002'), [])
+
+        rpu.write_binary_profile(fname, [])
+        with rpu.BinaryProfile(fname) as prof:
+            self.assertEqual(prof.rows(), [])
+            self.assertEqual(prof.uids(), [])
+
+        with open(fname, 'wb') as fout:
+            fout.write(b'\0' * 128)
+        with self.assertRaises(ValueError):
+            rpu.BinaryProfile(fname)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_session_profile(self):
+
+        profile, accuracy, hostmap = rpu.get_session_profile(self._sid,
+                                                             self._src)
+        self.assertEqual(len(profile), 9)
+
+        fname = rpu.convert_session_profile(self._sid, self._src)
+        self.assertEqual(fname, '%s/%s.bprof' % (self._src, self._sid))
+        self.assertEqual(rpu.prof_utils._get_binary_profile(self._sid,
+                                                            self._src), fname)
+
+        # the binary profile is used, and yields the same result
+        self.assertEqual(rpu.get_session_profile(self._sid, self._src),
+                         (profile, accuracy, hostmap))
+
+        with rpu.BinaryProfile(fname) as prof:
+            self.assertEqual([row[ru.EVENT] for row
+                                            in prof.rows(uid='unit.0000')],
+                             ['state', 'exec_start', 'exec_stop'])
+
+        # the binary profile is stale once a CSV profile changes
+        os.utime(fname, (0, 0))
+        self.assertIsNone(rpu.prof_utils._get_binary_profile(self._sid,
+                                                             self._src))
+        self.assertEqual(rpu.convert_session_profile(self._sid, self._src),
+                         fname)
+        self.assertGreater(os.path.getmtime(fname), 0)
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument
+
@@ -0,0 +1,153 @@
+
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase, mock
+
+import radical.pilot.constants as rpc
+import radical.pilot.utils     as rpu
+
+
+# ------------------------------------------------------------------------------
+#
+class TestStaging(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def setUp(self):
+
+        self._tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp)
+
+        with open('%s/src' % self._tmp, 'w') as fout:
+            fout.write('data' * 1024)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _op(self, action, src, tgt, mkdir=None):
+
+        return {'did'   : 'sd.%s.%s' % (action, tgt),
+                'action': action,
+                'src'   : '%s/%s' % (self._tmp, src),
+                'tgt'   : '%s/%s' % (self._tmp, tgt),
+                'mkdir' : '%s/%s' % (self._tmp, mkdir) if mkdir else None}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_copy_file(self):
+
+        src = '%s/src' % self._tmp
+
+        self.assertEqual(rpu.copy_file(src, '%s/tgt' % self._tmp), 4096)
+        with open('%s/tgt' % self._tmp) as fin:
+            self.assertEqual(fin.read(), 'data' * 1024)
+
+        os.mkdir('%s/dir' % self._tmp)
+        rpu.copy_file(src, '%s/dir' % self._tmp)
+        self.assertTrue(os.path.isfile('%s/dir/src' % self._tmp))
+
+        # only read-only files are hard-linked
+        rpu.copy_file(src, '%s/rw' % self._tmp, hardlink=True)
+        self.assertEqual(os.stat('%s/rw' % self._tmp).st_nlink, 1)
+
+        os.chmod(src, 0o444)
+        self.assertEqual(rpu.copy_file(src, '%s/ro' % self._tmp,
+                                       hardlink=True), 0)
+        self.assertEqual(os.stat('%s/ro' % self._tmp).st_nlink, 2)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_stage(self):
+
+        for n_workers in [1, 4]:
+
+            tmp = self._tmp
+            cfg = {'staging_workers': n_workers}
+            eng = rpu.StagingEngine(cfg, mock.Mock(), mock.Mock(), 'staging')
+
+            os.mkdir('%s/%d'     % (tmp, n_workers))
+            os.mkdir('%s/%d/dir' % (tmp, n_workers))
+            shutil.copy('%s/src' % tmp, '%s/%d/dir/' % (tmp, n_workers))
+            d    = '%d/' % n_workers
+            bulk = [[{'uid': 'unit.0000'},
+                     [self._op(rpc.COPY, 'src',    d + 'a/copy', mkdir=d + 'a'),
+                      self._op(rpc.LINK, d + 'a', d + 'link')]],
+                    [{'uid': 'unit.0001'},
+                     [self._op(rpc.LINK, d + 'a', d + 'link'),
+                      self._op(rpc.MOVE, 'none',  d + 'move')]],
+                    [{'uid': 'unit.0002'},
+                     [self._op(rpc.COPY, d + 'dir', d + 'b')]]]
+
+            ret = list(eng.stage(bulk))
+            eng.close()
+
+            # results are in bulk order, the duplicated link does not fail
+            self.assertEqual([r[0]['uid'] for r in ret],
+                             ['unit.0000', 'unit.0001', 'unit.0002'])
+            self.assertIsNone(ret[0][1])
+            self.assertIsInstance(ret[1][1], OSError)
+            self.assertIsNone(ret[2][1])
+
+            self.assertTrue(os.path.islink('%s/%slink' % (tmp, d)))
+            self.assertTrue(os.path.isfile('%s/%sb/src' % (tmp, d)))
+
+            stats = eng.stats()
+            self.assertEqual(stats[rpc.COPY]['ops'],   2)
+            self.assertEqual(stats[rpc.COPY]['bytes'], 8192)
+            self.assertEqual(stats[rpc.LINK]['ops'],   1)
+            self.assertNotIn(rpc.MOVE, stats)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_stage_failed_owner(self):
+
+        # a unit which fails before it gets to a duplicated operation does not
+        # fail the other units: the next unit performs the operation
+        for n_workers in [1, 4]:
+
+            d    = '%d/' % n_workers
+            cfg  = {'staging_workers': n_workers}
+            eng  = rpu.StagingEngine(cfg, mock.Mock(), mock.Mock(), 'staging')
+            copy = self._op(rpc.COPY, 'src', d + 'copy', mkdir=d)
+            bulk = [[{'uid': 'unit.0000'},
+                     [self._op(rpc.MOVE, 'none', d + 'move'), copy]],
+                    [{'uid': 'unit.0001'}, [copy]],
+                    [{'uid': 'unit.0002'}, [copy]]]
+
+            ret = list(eng.stage(bulk))
+            eng.close()
+
+            self.assertIsInstance(ret[0][1], OSError)
+            self.assertIsNone(ret[1][1])
+            self.assertIsNone(ret[2][1])
+            self.assertTrue(os.path.isfile('%s/%scopy' % (self._tmp, d)))
+            self.assertEqual(eng.stats()[rpc.COPY]['ops'], 1)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_stage_handlers(self):
+
+        handler = mock.Mock()
+        eng     = rpu.StagingEngine({}, mock.Mock(), mock.Mock(), 'staging',
+                                    handlers={rpc.TARBALL: handler})
+        bulk    = [[{'uid': 'unit.0000'}, [self._op(rpc.TARBALL, 'a', 'b')]]]
+
+        self.assertEqual(list(eng.stage(bulk)), [(bulk[0][0], None)])
+        handler.assert_called_once_with('unit.0000', '%s/a' % self._tmp,
+                                                     '%s/b' % self._tmp)
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument
+
@@ -0,0 +1,120 @@
+
+# pylint: disable=protected-access, no-value-for-parameter, unused-argument
+
+__copyright__ = "Copyright 2021, http://radical.rutgers.edu"
+__license__   = "MIT"
+
+import time
+
+from unittest import mock
+from unittest import TestCase
+
+import radical.utils as ru
+
+import radical.pilot.states as rps
+
+from radical.pilot.worker.update import Update
+
+
+# ------------------------------------------------------------------------------
+#
+class TestUpdate(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _component(self):
+
+        component = Update()
+        component._log       = mock.Mock()
+        component._prof      = mock.Mock()
+        component._coll      = mock.Mock()
+        component._lock      = ru.Lock()
+        component._last      = time.time()
+        component._uids      = list()
+        component._pending   = dict()
+        component._bulk_time = 1000.0
+        component._bulk_size = 1000
+
+        return component
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Update, '__init__', return_value=None)
+    def test_state_cb(self, mocked_init):
+
+        component = self._component()
+        bulk      = component._coll.initialize_unordered_bulk_op.return_value
+
+        unit_0 = {'uid': 'unit.0000', 'type': 'unit'}
+        unit_1 = {'uid': 'unit.0001', 'type': 'unit'}
+        msgs   = [[dict(unit_0, state=rps.AGENT_EXECUTING_PENDING)],
+                  [dict(unit_0, state=rps.AGENT_EXECUTING, slots={'n': 1}),
+                   dict(unit_1, state=rps.AGENT_EXECUTING)],
+                  [dict(unit_0, state=rps.AGENT_STAGING_OUTPUT_PENDING,
+                                exit_code=0)],
+                  [dict(unit_0, state=None),
+                   {'uid': 'unit.0002.clone', 'type': 'unit', 'state': 'X'}]]
+
+        for msg in msgs:
+            self.assertTrue(component._state_cb(None, {'cmd': 'update',
+                                                       'arg': msg}))
+
+        # nothing is pushed before the bulk window closes
+        self.assertEqual(len(component._pending), 2)
+        self.assertEqual(len(component._uids),    4)
+        bulk.execute.assert_not_called()
+
+        self.assertTrue(component._timed_bulk_execute(flush=True))
+
+        # one update op per unit, with states pushed in order
+        self.assertEqual(bulk.find.call_count, 2)
+        bulk.find.assert_any_call({'uid': 'unit.0000', 'type': 'unit'})
+        bulk.execute.assert_called_once()
+
+        update = bulk.find.return_value.update.call_args_list[0][0][0]
+        self.assertEqual(update['$set'],
+                         {'uid'      : 'unit.0000',
+                          'type'     : 'unit',
+                          'state'    : rps.AGENT_STAGING_OUTPUT_PENDING,
+                          'slots'    : {'n': 1},
+                          'exit_code': 0})
+        states = [rps.AGENT_EXECUTING_PENDING,
+                  rps.AGENT_EXECUTING,
+                  rps.AGENT_STAGING_OUTPUT_PENDING]
+        self.assertEqual(update['$push'], {'states': {'$each': states}})
+
+        self.assertEqual(component._pending, dict())
+        self.assertEqual(component._uids,    list())
+
+        # 2 ops for 4 updates
+        msg = component._prof.prof.call_args[1]['msg']
+        self.assertTrue(msg.startswith('bulk size: 2 [4] 2.00'))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Update, '__init__', return_value=None)
+    def test_state_cb_out_of_order(self, mocked_init):
+
+        component = self._component()
+        bulk      = component._coll.initialize_unordered_bulk_op.return_value
+
+        unit = {'uid': 'unit.0000', 'type': 'unit'}
+        msgs = [[dict(unit, state=rps.AGENT_EXECUTING)],
+                [dict(unit, state=rps.AGENT_SCHEDULING)]]
+
+        for msg in msgs:
+            component._state_cb(None, {'cmd': 'update', 'arg': msg})
+        component._timed_bulk_execute(flush=True)
+
+        # the state does not move backwards, but the history is complete
+        update = bulk.find.return_value.update.call_args[0][0]
+        self.assertEqual(update['$set']['state'], rps.AGENT_EXECUTING)
+        self.assertEqual(update['$push']['states']['$each'],
+                         [rps.AGENT_EXECUTING, rps.AGENT_SCHEDULING])
+
+
+# ------------------------------------------------------------------------------
+# pylint: enable=protected-access, unused-argument, no-value-for-parameter
+